@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 非同期アラート配信
+平滑化カウントのヒステリシス判定（検出スレッド）と、
+まとめ送信・再試行・チャネル別レート制限を行う配信スレッド
+"""
+
+import json
+import time
+import queue
+import random
+import threading
+import logging
+import urllib.request
+import urllib.error
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from config import ALERT_DISPATCH_CONFIG, INVENTORY_ALERTS
+
+
+class AlertCondition:
+    """1クラス分のアラート条件（EMA平滑化 + 最短継続時間 + 解除マージン）"""
+    
+    OK = 'ok'
+    PENDING = 'pending'
+    ACTIVE = 'active'
+    
+    def __init__(self, threshold: int, alpha: float, min_duration: float,
+                 clear_margin: float, cooldown: float):
+        """
+        初期化
+        
+        Args:
+            threshold: しきい値（平滑化カウントがこの値以下でアラート）
+            alpha: EMA係数（大きいほど直近のフレームを重視）
+            min_duration: 発動までの条件継続秒数
+            clear_margin: 解除に必要なしきい値からの上乗せ
+            cooldown: 発動中の再通知間隔（秒）
+        """
+        self.threshold = threshold
+        self.alpha = alpha
+        self.min_duration = min_duration
+        self.clear_margin = clear_margin
+        self.cooldown = cooldown
+        
+        self.smoothed = None
+        self.state = self.OK
+        self.since = 0.0
+        self.last_notified = 0.0
+    
+    def update(self, count: int, timestamp: float) -> Optional[str]:
+        """
+        カウント更新
+        
+        Args:
+            count: 今回のカウント
+            timestamp: UNIX秒
+        
+        Returns:
+            Optional[str]: 'triggered' / 'reminder' / 'resolved'、変化なしはNone
+        """
+        if self.smoothed is None:
+            self.smoothed = float(count)
+        else:
+            self.smoothed += self.alpha * (count - self.smoothed)
+        
+        low = self.smoothed <= self.threshold
+        if self.state == self.OK:
+            if low:
+                self.state = self.PENDING
+                self.since = timestamp
+        elif self.state == self.PENDING:
+            if not low:
+                self.state = self.OK
+        elif self.smoothed >= self.threshold + self.clear_margin:
+            self.state = self.OK
+            return 'resolved'
+        
+        if self.state == self.PENDING and timestamp - self.since >= self.min_duration:
+            self.state = self.ACTIVE
+            self.last_notified = timestamp
+            return 'triggered'
+        if self.state == self.ACTIVE and timestamp - self.last_notified >= self.cooldown:
+            self.last_notified = timestamp
+            return 'reminder'
+        return None
+
+
+class AlertEvaluator:
+    """クラス別アラート条件の評価（検出スレッドで呼ばれるため軽量な計算のみ）"""
+    
+    def __init__(self, thresholds: Optional[Dict[str, int]] = None):
+        """
+        初期化
+        
+        Args:
+            thresholds: クラス名 -> しきい値
+        """
+        self.thresholds = INVENTORY_ALERTS['alert_thresholds'] if thresholds is None else thresholds
+        self.conditions = {
+            class_name: AlertCondition(threshold,
+                                       ALERT_DISPATCH_CONFIG['smoothing_alpha'],
+                                       ALERT_DISPATCH_CONFIG['min_duration'],
+                                       ALERT_DISPATCH_CONFIG['clear_margin'],
+                                       INVENTORY_ALERTS['alert_cooldown'])
+            for class_name, threshold in self.thresholds.items()
+        }
+    
+    def update(self, counts: Dict[str, int], timestamp: Optional[float] = None) -> List[Dict]:
+        """
+        カウント更新（検出されなかったクラスは0として評価）
+        
+        Args:
+            counts: クラス別カウント
+            timestamp: UNIX秒
+        
+        Returns:
+            List[Dict]: 発生したアラートイベント
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        events = []
+        for class_name, condition in self.conditions.items():
+            count = counts.get(class_name, 0)
+            kind = condition.update(count, timestamp)
+            if kind is not None:
+                events.append({
+                    'type': kind,
+                    'class_name': class_name,
+                    'count': count,
+                    'smoothed': round(condition.smoothed, 2),
+                    'threshold': condition.threshold,
+                    'timestamp': datetime.fromtimestamp(timestamp).isoformat()
+                })
+        return events
+    
+    def active_alerts(self) -> List[str]:
+        """発動中のクラス"""
+        return [class_name for class_name, condition in self.conditions.items()
+                if condition.state == AlertCondition.ACTIVE]
+
+
+def format_alert(alert: Dict) -> str:
+    """アラートイベントの表示文字列"""
+    labels = {'triggered': '在庫アラート', 'reminder': '在庫アラート継続', 'resolved': '在庫アラート解除'}
+    return (f"{labels.get(alert['type'], alert['type'])}: {alert['class_name']} = {alert['count']}個 "
+            f"(平滑値: {alert['smoothed']}, しきい値: {alert['threshold']}個)")
+
+
+class ConsoleSink:
+    """コンソール出力チャネル"""
+    
+    name = 'console'
+    
+    def send(self, digest: Dict):
+        """ダイジェスト出力"""
+        for alert in digest['alerts']:
+            print(f"🚨 {format_alert(alert)}")
+
+
+class WebhookSink:
+    """Webhookチャネル（ダイジェストをJSONでPOST）"""
+    
+    name = 'webhook'
+    
+    def __init__(self, url: str, timeout: Optional[float] = None):
+        """
+        初期化
+        
+        Args:
+            url: 送信先URL
+            timeout: タイムアウト（秒）
+        """
+        self.url = url
+        self.timeout = timeout or ALERT_DISPATCH_CONFIG['channels']['webhook']['timeout']
+    
+    def send(self, digest: Dict):
+        """ダイジェスト送信（2xx以外は例外）"""
+        request = urllib.request.Request(
+            self.url, data=json.dumps(digest, ensure_ascii=False).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class LocalHTTPSink:
+    """ローカルHTTP受信サーバー（Webhookの代替・動作確認用）"""
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        """
+        初期化（port=0で空きポートを使用）
+        
+        Args:
+            host: 待ち受けアドレス
+            port: 待ち受けポート
+        """
+        self.received: List[Dict] = []
+        self.fail_remaining = 0
+        self._lock = threading.Lock()
+        sink = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with sink._lock:
+                    fail = sink.fail_remaining > 0
+                    if fail:
+                        sink.fail_remaining -= 1
+                    else:
+                        sink.received.append(json.loads(body))
+                self.send_response(503 if fail else 200)
+                self.end_headers()
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+    
+    @property
+    def url(self) -> str:
+        """受信URL"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/alerts"
+    
+    def fail_next(self, count: int):
+        """次のcount件の受信を503で失敗させる（再試行の確認用）"""
+        with self._lock:
+            self.fail_remaining = count
+    
+    def close(self):
+        """サーバー停止"""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Channel:
+    """チャネル別の送信待ちダイジェストとトークンバケット"""
+    
+    def __init__(self, sink, rate: float, burst: int, max_pending: int):
+        self.sink = sink
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.max_pending = max_pending
+        # [ダイジェスト, 試行回数, 次回送信時刻]
+        self.pending: List[list] = []
+    
+    def take_token(self, now: float) -> float:
+        """トークン取得（取得できた場合0、不足時は待ち秒数）"""
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AlertDispatcher:
+    """アラート配信（投入は待たない、まとめ送信・再試行・レート制限は配信スレッドで実施）"""
+    
+    def __init__(self, sinks: Optional[List] = None, digest_window: Optional[float] = None,
+                 max_queue: Optional[int] = None):
+        """
+        初期化
+        
+        Args:
+            sinks: 送信チャネル（name属性とsend(digest)を持つオブジェクト）
+            digest_window: まとめ送信の待ち時間（秒）
+            max_queue: 配信待ちキューの上限（超過分は破棄）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.digest_window = (ALERT_DISPATCH_CONFIG['digest_window']
+                              if digest_window is None else digest_window)
+        self.max_batch = ALERT_DISPATCH_CONFIG['max_batch']
+        self.max_retries = ALERT_DISPATCH_CONFIG['max_retries']
+        self.retry_backoff = ALERT_DISPATCH_CONFIG['retry_backoff']
+        self.max_backoff = ALERT_DISPATCH_CONFIG['max_backoff']
+        
+        self.channels = []
+        for sink in (sinks if sinks is not None else self._default_sinks()):
+            options = ALERT_DISPATCH_CONFIG['channels'].get(sink.name, {})
+            self.channels.append(_Channel(sink, options.get('rate', 1.0), options.get('burst', 5),
+                                          ALERT_DISPATCH_CONFIG['max_pending_digests']))
+        
+        self.queue = queue.Queue(maxsize=max_queue or ALERT_DISPATCH_CONFIG['max_queue'])
+        self.dispatch_thread = None
+        self.is_running = False
+        self._start_lock = threading.Lock()
+        
+        # 統計情報
+        self.stats = {
+            'submitted': 0,
+            'dropped': 0,
+            'digests': 0,
+            'sent': 0,
+            'retries': 0,
+            'failed': 0,
+            'rate_limited': 0
+        }
+    
+    @staticmethod
+    def _default_sinks() -> List:
+        """設定からチャネル生成"""
+        sinks = [ConsoleSink()]
+        webhook_url = ALERT_DISPATCH_CONFIG['channels']['webhook']['url']
+        if webhook_url:
+            sinks.append(WebhookSink(webhook_url))
+        return sinks
+    
+    def start(self):
+        """配信スレッド開始"""
+        with self._start_lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            self.dispatch_thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+            self.dispatch_thread.start()
+    
+    def stop(self, timeout: float = 10.0):
+        """送信待ちをまとめて送信し配信スレッドを停止（再試行待ちは破棄）"""
+        with self._start_lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+        self.queue.put(None)
+        if self.dispatch_thread and self.dispatch_thread.is_alive():
+            self.dispatch_thread.join(timeout=timeout)
+    
+    def submit(self, alert: Dict) -> bool:
+        """
+        アラート投入（待たない、キュー満杯時は破棄）
+        
+        Args:
+            alert: AlertEvaluator.update() のイベント
+        
+        Returns:
+            bool: 投入できたか
+        """
+        if not self.is_running:
+            self.start()
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['submitted'] += 1
+        return True
+    
+    def flush(self, timeout: float = 10.0) -> bool:
+        """投入済みアラートのダイジェスト化と送信試行を待機"""
+        if not self.is_running:
+            return True
+        marker = threading.Event()
+        self.queue.put(marker)
+        return marker.wait(timeout)
+    
+    def _dispatch_loop(self):
+        """配信ループ（キュー待ちは次のダイジェスト締切・再試行時刻まで）"""
+        batch = []
+        batch_deadline = None
+        while True:
+            now = time.monotonic()
+            wake_times = [entry[2] for channel in self.channels for entry in channel.pending[:1]]
+            if batch_deadline is not None:
+                wake_times.append(batch_deadline)
+            timeout = max(min(wake_times) - now, 0.0) if wake_times else None
+            
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            
+            stopping = item is None
+            marker = item if isinstance(item, threading.Event) else None
+            if isinstance(item, dict):
+                batch.append(item)
+                if batch_deadline is None:
+                    batch_deadline = time.monotonic() + self.digest_window
+            
+            now = time.monotonic()
+            if batch and (stopping or marker is not None or len(batch) >= self.max_batch
+                          or now >= batch_deadline):
+                self._queue_digest(batch, now)
+                batch = []
+                batch_deadline = None
+            
+            for channel in self.channels:
+                self._send_due(channel, now, final=stopping)
+            
+            if marker is not None:
+                marker.set()
+            if stopping:
+                break
+    
+    def _queue_digest(self, alerts: List[Dict], now: float):
+        """ダイジェスト作成（全チャネルの送信待ちに追加）"""
+        digest = {
+            'type': 'inventory_alert_digest',
+            'generated_at': datetime.now().isoformat(),
+            'count': len(alerts),
+            'alerts': alerts
+        }
+        self.stats['digests'] += 1
+        for channel in self.channels:
+            if len(channel.pending) >= channel.max_pending:
+                channel.pending.pop(0)
+                self.stats['failed'] += 1
+                self.logger.warning(f"送信待ちが満杯のため古いダイジェストを破棄: {channel.sink.name}")
+            channel.pending.append([digest, 0, now])
+    
+    def _send_due(self, channel: _Channel, now: float, final: bool = False):
+        """送信時刻に達したダイジェストを順に送信（失敗時は指数バックオフで再試行）"""
+        while channel.pending and (final or channel.pending[0][2] <= now):
+            entry = channel.pending[0]
+            wait = channel.take_token(now)
+            if wait > 0 and not final:
+                entry[2] = now + wait
+                self.stats['rate_limited'] += 1
+                return
+            
+            try:
+                channel.sink.send(entry[0])
+            except (OSError, urllib.error.URLError, ValueError) as e:
+                entry[1] += 1
+                if final or entry[1] > self.max_retries:
+                    channel.pending.pop(0)
+                    self.stats['failed'] += 1
+                    self.logger.error(f"アラート送信失敗（破棄）: {channel.sink.name}: {e}")
+                    continue
+                delay = min(self.retry_backoff * 2 ** (entry[1] - 1), self.max_backoff)
+                entry[2] = now + delay * random.uniform(0.5, 1.0)
+                self.stats['retries'] += 1
+                self.logger.warning(f"アラート送信失敗（{entry[1]}回目、再試行予定）: {channel.sink.name}: {e}")
+                return
+            
+            channel.pending.pop(0)
+            self.stats['sent'] += 1
+    
+    def get_stats(self) -> Dict:
+        """統計情報取得"""
+        stats = dict(self.stats)
+        stats['queued'] = self.queue.qsize()
+        stats['pending'] = {channel.sink.name: len(channel.pending) for channel in self.channels}
+        return stats
+
+
+if __name__ == "__main__":
+    # ノイズの多いカウントで50 SKUを評価し、ローカルHTTPシンクにまとめ送信
+    rng = random.Random(0)
+    thresholds = {f"sku_{i:03d}": 5 for i in range(50)}
+    
+    evaluator = AlertEvaluator(thresholds)
+    naive_alerts = 0
+    previous_low = {name: False for name in thresholds}
+    start_time = time.time() - 120
+    events = []
+    for frame in range(120 * 10):
+        timestamp = start_time + frame / 10
+        # 前半は在庫あり（しきい値付近でノイズ）、後半に半数のSKUが枯渇
+        counts = {}
+        for i, name in enumerate(thresholds):
+            level = 2 if (frame > 600 and i % 2 == 0) else 7
+            counts[name] = max(level + rng.randint(-3, 3), 0)
+            low = counts[name] <= thresholds[name]
+            naive_alerts += low and not previous_low[name]
+            previous_low[name] = low
+        events.extend(evaluator.update(counts, timestamp))
+    print(f"フレーム毎のしきい値判定での発動回数: {naive_alerts}")
+    print(f"平滑化 + ヒステリシスでの発動回数: {sum(e['type'] == 'triggered' for e in events)}")
+    
+    sink = LocalHTTPSink()
+    sink.fail_next(2)
+    ALERT_DISPATCH_CONFIG['retry_backoff'] = 0.05
+    dispatcher = AlertDispatcher([WebhookSink(sink.url, timeout=2.0)], digest_window=0.2)
+    
+    begin = time.perf_counter()
+    for event in events:
+        dispatcher.submit(event)
+    submit_ms = (time.perf_counter() - begin) * 1000
+    time.sleep(1.0)
+    dispatcher.stop()
+    sink.close()
+    
+    print(f"投入: {len(events)}件 ({submit_ms:.2f} ms)")
+    print(f"受信ダイジェスト: {len(sink.received)}件 / "
+          f"アラート {sum(d['count'] for d in sink.received)}件")
+    print(f"統計: {dispatcher.get_stats()}")
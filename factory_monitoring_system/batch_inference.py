@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - バッチ推論エンジン
+複数カメラのフレームをマイクロバッチにまとめてYOLOで一括推論
+"""
+
+import time
+import queue
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import INFERENCE_CONFIG
+
+
+class BatchInferenceEngine:
+    """マイクロバッチ推論エンジン（複数ストリーム共有）"""
+    
+    def __init__(self, model, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None, **predict_kwargs):
+        """
+        初期化
+        
+        Args:
+            model: 読み込み済みYOLOモデル
+            max_batch_size: 1回の推論にまとめる最大フレーム数
+            max_wait_ms: 最初のフレーム到着後にバッチを待つ最大時間（ミリ秒）
+            predict_kwargs: 推論時に渡す追加引数（conf, iouなど）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.model = model
+        self.max_batch_size = max_batch_size or INFERENCE_CONFIG['max_batch_size']
+        self.max_wait = (max_wait_ms if max_wait_ms is not None
+                         else INFERENCE_CONFIG['max_wait_ms']) / 1000.0
+        self.predict_kwargs = dict(predict_kwargs)
+        self.predict_kwargs.setdefault('verbose', False)
+        
+        # 推論要求キュー（上限付き）
+        self.request_queue = queue.Queue(maxsize=INFERENCE_CONFIG['queue_size'])
+        
+        # ワーカースレッド管理
+        self.worker_thread = None
+        self.is_running = False
+        
+        # 統計情報
+        self.stats = {
+            'batches': 0,
+            'frames': 0,
+            'max_batch': 0,
+            'total_inference_time': 0.0,
+            'frames_by_source': {}
+        }
+        self._stats_lock = threading.Lock()
+    
+    @property
+    def names(self) -> Dict[int, str]:
+        """クラス名辞書"""
+        return self.model.names
+    
+    def start(self):
+        """ワーカースレッド開始"""
+        if self.is_running:
+            return
+        
+        self.is_running = True
+        self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.worker_thread.start()
+        self.logger.info(
+            f"バッチ推論エンジン開始 (最大バッチ: {self.max_batch_size}, "
+            f"最大待機: {self.max_wait * 1000:.0f}ms)"
+        )
+    
+    def stop(self):
+        """ワーカースレッド停止"""
+        if not self.is_running:
+            return
+        
+        self.is_running = False
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=5.0)
+        
+        # 未処理の要求をキャンセル
+        while True:
+            try:
+                _, _, future = self.request_queue.get_nowait()
+            except queue.Empty:
+                break
+            future.cancel()
+        
+        self.logger.info("バッチ推論エンジン停止")
+    
+    def submit(self, frame: np.ndarray, source_id: Any = None) -> Future:
+        """
+        推論要求を登録
+        
+        Args:
+            frame: 入力画像フレーム
+            source_id: 要求元ストリームの識別子（統計用）
+        
+        Returns:
+            Future: 推論結果（ultralytics Results）を受け取るFuture
+        """
+        if not self.is_running:
+            self.start()
+        
+        future = Future()
+        self.request_queue.put((frame, source_id, future))
+        return future
+    
+    def infer(self, frame: np.ndarray, source_id: Any = None,
+              timeout: Optional[float] = None):
+        """
+        推論実行（結果が返るまでブロック）
+        
+        Args:
+            frame: 入力画像フレーム
+            source_id: 要求元ストリームの識別子
+            timeout: 待機タイムアウト（秒）
+        
+        Returns:
+            ultralytics Results: 当該フレームの推論結果
+        """
+        if timeout is None:
+            timeout = INFERENCE_CONFIG['result_timeout']
+        return self.submit(frame, source_id).result(timeout=timeout)
+    
+    def infer_many(self, frames: List[np.ndarray], source_id: Any = None,
+                   timeout: Optional[float] = None) -> List:
+        """複数フレームをまとめて推論要求（タイル推論など）"""
+        if timeout is None:
+            timeout = INFERENCE_CONFIG['result_timeout']
+        futures = [self.submit(frame, source_id) for frame in frames]
+        return [future.result(timeout=timeout) for future in futures]
+    
+    def _collect_batch(self) -> List[Tuple[np.ndarray, Any, Future]]:
+        """マイクロバッチ収集"""
+        try:
+            first = self.request_queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.request_queue.get(timeout=remaining))
+                else:
+                    # 期限切れ後も既にキューにある分は取り込む
+                    batch.append(self.request_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _worker_loop(self):
+        """推論ワーカーループ"""
+        while self.is_running:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            
+            # キャンセル済み要求を除外
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            
+            frames = [frame for frame, _, _ in batch]
+            
+            try:
+                start_time = time.perf_counter()
+                results = self.model(frames, **self.predict_kwargs)
+                elapsed = time.perf_counter() - start_time
+            except Exception as e:
+                self.logger.error(f"バッチ推論エラー: {e}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            # 結果を各ストリームへ振り分け
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+            
+            self._update_stats(batch, elapsed)
+    
+    def _update_stats(self, batch: List[Tuple[np.ndarray, Any, Future]], elapsed: float):
+        """統計情報更新"""
+        with self._stats_lock:
+            self.stats['batches'] += 1
+            self.stats['frames'] += len(batch)
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(batch))
+            self.stats['total_inference_time'] += elapsed
+            
+            by_source = self.stats['frames_by_source']
+            for _, source_id, _ in batch:
+                key = str(source_id)
+                by_source[key] = by_source.get(key, 0) + 1
+    
+    def get_stats(self) -> Dict:
+        """統計情報取得"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+            stats['frames_by_source'] = dict(self.stats['frames_by_source'])
+        
+        batches = stats['batches']
+        stats['average_batch_size'] = stats['frames'] / batches if batches else 0
+        stats['average_frame_time_ms'] = (
+            stats['total_inference_time'] * 1000 / stats['frames'] if stats['frames'] else 0
+        )
+        stats['queue_length'] = self.request_queue.qsize()
+        return stats
+
+
+# プロセス内で共有するエンジン
+_shared_engines: Dict[Tuple, BatchInferenceEngine] = {}
+_shared_engines_lock = threading.Lock()
+
+
+def get_shared_engine(model_path: str, device: Optional[str] = None,
+                      **predict_kwargs) -> BatchInferenceEngine:
+    """
+    共有バッチ推論エンジン取得
+    
+    同じモデル・デバイス・推論引数の組み合わせに対して1つのエンジンを返すため、
+    同一プロセス内の全カメラが1つのバッチにまとめられる。
+    
+    Args:
+        model_path: YOLOモデルファイルパス
+        device: 推論デバイス（"cpu", "cuda:0"など）
+        predict_kwargs: 推論時に渡す追加引数
+    
+    Returns:
+        BatchInferenceEngine: 起動済みエンジン
+    """
+    key = (model_path, device, tuple(sorted(predict_kwargs.items())))
+    
+    with _shared_engines_lock:
+        engine = _shared_engines.get(key)
+        if engine is None:
+            from ultralytics import YOLO
+            
+            model = YOLO(model_path)
+            if device:
+                model.to(device)
+            
+            engine = BatchInferenceEngine(model, **predict_kwargs)
+            engine.start()
+            _shared_engines[key] = engine
+        
+        return engine
+
+
+def shutdown_shared_engines():
+    """共有エンジンを全て停止"""
+    with _shared_engines_lock:
+        for engine in _shared_engines.values():
+            engine.stop()
+        _shared_engines.clear()
+
+
+if __name__ == "__main__":
+    # ベンチマーク: 単一フレーム推論 vs バッチ推論
+    from config import YOLO_MODEL
+    
+    camera_count = 4
+    frames_per_camera = 20
+    frames = [
+        np.random.randint(0, 255, (480, 640, 3), dtype=np.uint8)
+        for _ in range(camera_count)
+    ]
+    
+    engine = get_shared_engine(YOLO_MODEL)
+    engine.model(frames[0], verbose=False)  # ウォームアップ
+    
+    start = time.perf_counter()
+    for _ in range(frames_per_camera):
+        for frame in frames:
+            engine.model(frame, verbose=False)
+    single_fps = camera_count * frames_per_camera / (time.perf_counter() - start)
+    
+    def camera_worker(camera_id: int):
+        for _ in range(frames_per_camera):
+            engine.infer(frames[camera_id], source_id=camera_id)
+    
+    workers = [threading.Thread(target=camera_worker, args=(i,)) for i in range(camera_count)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    batch_fps = camera_count * frames_per_camera / (time.perf_counter() - start)
+    
+    print(f"単一フレーム推論: {single_fps:.1f} FPS")
+    print(f"バッチ推論: {batch_fps:.1f} FPS (平均バッチ: {engine.get_stats()['average_batch_size']:.1f})")
+    shutdown_shared_engines()
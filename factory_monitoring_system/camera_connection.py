@@ -10,11 +10,15 @@ import numpy as np
 import time
 import threading
 import logging
-from typing import Optional, Callable, Tuple
+from typing import List, Optional, Callable, Tuple
 from urllib.parse import urlparse
 
-from config import CAMERA_CONFIG, CAMERA_URLS, NETWORK_CONFIG
+from config import CAMERA_CONFIG, CAMERA_URLS, NETWORK_CONFIG, PIPELINE_CONFIG, ROI_CONFIG
 from factory_monitor import FactoryMonitor
+from frame_pipeline import StreamPipeline
+from motion_gate import create_motion_gate
+from clip_recorder import create_clip_recorder, source_label
+from roi_tiling import ROITiler
 
 
 class FactoryCameraConnection:
@@ -32,16 +36,34 @@ class FactoryCameraConnection:
         
         # カメラ設定
         self.cap = None
+        # 差し替え済みのキャプチャ（読み取り中の可能性があるためキャプチャスレッドが解放）
+        self._capture_lock = threading.Lock()
+        self._retired_captures = []
         self.is_connected = False
-        self.is_streaming = False
         self.current_url = None
         
-        # ストリーミング制御
-        self.streaming_thread = None
-        self.stop_streaming = False
+        # ストリーミング制御（キャプチャ/推論/出力の段階パイプライン）
+        self.pipeline = None
+        self.stream_callback = None
+        # キャプチャ失敗時の処理（CameraSupervisor管理時、Noneの場合はその場で再接続）
+        self.failure_handler: Optional[Callable[[], bool]] = None
         
-        # フレーム管理
+        # 動きのないフレームは推論をスキップ（前回結果を再利用）
+        self.motion_gate = create_motion_gate()
+        
+        # カメラ別の推論領域（Noneの場合はFactoryMonitor側の設定を使用）
+        self.roi_tiler = None
+        
+        # イベント前後のクリップ録画（在庫アラート・カウント急変で発動）
+        # 在庫アラートの購読は接続中のみ（切断時に解除し、共有FactoryMonitorに残さない）
+        self.clip_recorder = create_clip_recorder()
+        
+        # フレーム管理（描画・エンコードは視聴者の要求時のみ）
         self.latest_frame = None
+        self.latest_result = None
+        self._encoded_result = None
+        self._encoded_jpeg = None
+        self._encode_lock = threading.Lock()
         self.frame_count = 0
         self.fps_counter = 0
         self.last_fps_time = time.time()
@@ -62,47 +84,110 @@ class FactoryCameraConnection:
             # 既存接続を切断
             self.disconnect_camera()
             
-            # OpenCV VideoCapture初期化
-            self.cap = cv2.VideoCapture(source)
-            
-            # カメラ設定適用
-            self._apply_camera_settings()
-            
-            # 接続テスト
-            if self.cap.isOpened():
-                ret, frame = self.cap.read()
-                if ret and frame is not None:
-                    self.is_connected = True
-                    self.current_url = source
-                    self.logger.info(f"カメラ接続成功: {source}")
-                    return True
-            
-            self.logger.error(f"カメラ接続失敗: {source}")
-            return False
+            return self._open_capture(source)
             
         except Exception as e:
             self.logger.error(f"カメラ接続エラー: {e}")
             return False
     
-    def _apply_camera_settings(self):
-        """カメラ設定適用"""
-        if self.cap is None:
+    def reopen_capture(self, source) -> bool:
+        """
+        キャプチャのみ再オープン（ストリーミング状態は変更しない）
+        
+        Args:
+            source: カメラソース
+        
+        Returns:
+            bool: 接続成功フラグ
+        """
+        try:
+            return self._open_capture(source)
+        except Exception as e:
+            self.logger.error(f"再接続エラー: {e}")
+            return False
+    
+    def set_roi_zones(self, zones: List):
+        """
+        このカメラの推論対象カウントゾーン設定（FactoryMonitorを共有する他カメラに影響しない）
+        
+        Args:
+            zones: CountingZoneリスト
+        """
+        if not ROI_CONFIG['enable_roi']:
             return
+        if self.roi_tiler is None:
+            self.roi_tiler = ROITiler(zones)
+        else:
+            self.roi_tiler.set_zones(zones)
+    
+    def _open_capture(self, source) -> bool:
+        """
+        VideoCapture初期化（ストリーミング状態は変更しない）
+        
+        新しいキャプチャは別に開いてから差し替える（VideoCaptureはスレッドセーフではないため、
+        キャプチャスレッドが読み取り中の古いキャプチャはここでは解放しない）
+        """
+        # 再接続完了までキャプチャスレッドが古いキャプチャを読まないようにする
+        self.is_connected = False
+        
+        # OpenCV VideoCapture初期化
+        cap = cv2.VideoCapture(source)
+        
+        # カメラ設定適用
+        self._apply_camera_settings(cap)
+        
+        # 接続テスト
+        if cap.isOpened():
+            ret, frame = cap.read()
+            if ret and frame is not None:
+                self._swap_capture(cap)
+                self.is_connected = True
+                self.current_url = source
+                if self.clip_recorder is not None:
+                    self.clip_recorder.camera_id = source_label(source)
+                    if self._on_inventory_alert not in self.monitor.alert_listeners:
+                        self.monitor.alert_listeners.append(self._on_inventory_alert)
+                self.logger.info(f"カメラ接続成功: {source}")
+                return True
+        
+        cap.release()
+        self._swap_capture(None)
+        self.logger.error(f"カメラ接続失敗: {source}")
+        return False
+    
+    def _swap_capture(self, cap):
+        """キャプチャ差し替え（ストリーミング中の古いキャプチャはキャプチャスレッドが解放）"""
+        with self._capture_lock:
+            old_cap, self.cap = self.cap, cap
+            if old_cap is not None:
+                self._retired_captures.append(old_cap)
+        if not self.is_streaming:
+            self._release_retired_captures()
+    
+    def _release_retired_captures(self):
+        """差し替え済みキャプチャの解放（読み取りスレッド、またはストリーミング停止後に呼ぶ）"""
+        with self._capture_lock:
+            retired, self._retired_captures = self._retired_captures, []
+        for cap in retired:
+            cap.release()
+    
+    def _apply_camera_settings(self, cap):
+        """カメラ設定適用"""
         
         try:
             # フレームサイズ設定
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_CONFIG['frame_width'])
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_CONFIG['frame_height'])
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_CONFIG['frame_width'])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_CONFIG['frame_height'])
             
             # FPS設定
-            self.cap.set(cv2.CAP_PROP_FPS, CAMERA_CONFIG['fps'])
+            cap.set(cv2.CAP_PROP_FPS, CAMERA_CONFIG['fps'])
             
             # バッファサイズ設定（遅延軽減）
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, CAMERA_CONFIG['buffer_size'])
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, CAMERA_CONFIG['buffer_size'])
             
             # RTSPタイムアウト設定
             if isinstance(self.current_url, str) and 'rtsp://' in self.current_url:
-                self.cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, CAMERA_CONFIG['rtsp_timeout'] * 1000)
+                cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, CAMERA_CONFIG['rtsp_timeout'] * 1000)
             
             self.logger.info("カメラ設定を適用しました")
             
@@ -115,14 +200,22 @@ class FactoryCameraConnection:
             # ストリーミング停止
             self.stop_live_streaming()
             
-            # カメラリソース解放
-            if self.cap is not None:
-                self.cap.release()
-                self.cap = None
+            # カメラリソース解放（ストリーミング停止後のため読み取り中のスレッドはない）
+            self._swap_capture(None)
+            self._release_retired_captures()
             
             self.is_connected = False
             self.current_url = None
             self.latest_frame = None
+            self.latest_result = None
+            if self.motion_gate is not None:
+                self.motion_gate.reset()
+            if self._on_inventory_alert in self.monitor.alert_listeners:
+                self.monitor.alert_listeners.remove(self._on_inventory_alert)
+            if self.clip_recorder is not None:
+                # 録画中のクリップを書き出してからバッファ破棄
+                self.clip_recorder.stop()
+                self.clip_recorder.reset()
             
             self.logger.info("カメラ切断完了")
             
@@ -136,11 +229,12 @@ class FactoryCameraConnection:
         Returns:
             Tuple[bool, Optional[np.ndarray]]: (成功フラグ, フレーム)
         """
-        if not self.is_connected or self.cap is None:
+        cap = self.cap
+        if not self.is_connected or cap is None:
             return False, None
         
         try:
-            ret, frame = self.cap.read()
+            ret, frame = cap.read()
             if ret and frame is not None:
                 self.latest_frame = frame.copy()
                 self.frame_count += 1
@@ -168,61 +262,106 @@ class FactoryCameraConnection:
             self.logger.error("カメラが接続されていません")
             return
         
-        self.stop_streaming = False
-        self.is_streaming = True
+        self.stream_callback = callback
+        self.fps_counter = 0
+        self.last_fps_time = time.time()
         
-        # ストリーミングスレッド開始
-        self.streaming_thread = threading.Thread(
-            target=self._streaming_loop,
-            args=(callback,),
-            daemon=True
+        # キャプチャ・推論・描画エンコードを別スレッドで実行
+        # キャプチャは常に最新フレームのみ保持するため、推論が遅くても遅延は蓄積しない
+        self.pipeline = StreamPipeline(
+            capture_fn=self._pipeline_capture,
+            inference_fn=self._pipeline_inference,
+            output_fn=self._pipeline_output,
+            failure_fn=self._pipeline_capture_failed,
+            max_fps=CAMERA_CONFIG['fps'],
+            name=f"camera-{self.current_url}"
         )
-        self.streaming_thread.start()
+        self.pipeline.start()
         
         self.logger.info("ライブストリーミング開始")
     
-    def _streaming_loop(self, callback: Optional[Callable] = None):
-        """ストリーミングループ"""
-        self.fps_counter = 0
-        self.last_fps_time = time.time()
+    @property
+    def is_streaming(self) -> bool:
+        """ストリーミング中か"""
+        return self.pipeline is not None and self.pipeline.is_running
+    
+    def _pipeline_capture(self) -> Optional[np.ndarray]:
+        """キャプチャステージ: フレーム取得（latest_frameは出力ステージで更新）"""
+        # 再接続で差し替えられたキャプチャは読み取りから戻ったこのスレッドで解放
+        if self._retired_captures:
+            self._release_retired_captures()
         
-        while not self.stop_streaming and self.is_connected:
-            try:
-                # フレーム取得
-                ret, frame = self.capture_single_frame()
-                
-                if ret and frame is not None:
-                    # FPS計算
-                    self._update_fps_counter()
-                    
-                    # 物体検出実行
-                    counts, annotated_frame = self.monitor.detect_objects(frame)
-                    
-                    # コールバック実行
-                    if callback:
-                        callback(annotated_frame, counts)
-                    
-                    # フレーム情報描画
-                    self._draw_frame_info(annotated_frame, counts)
-                    
-                    # 最新フレーム更新
-                    self.latest_frame = annotated_frame
-                    
-                else:
-                    # 接続エラー時の再接続試行
-                    self.logger.warning("フレーム取得失敗 - 再接続試行")
-                    if not self._reconnect():
-                        break
-                
-                # フレームレート制御
-                time.sleep(1.0 / CAMERA_CONFIG['fps'])
-                
-            except Exception as e:
-                self.logger.error(f"ストリーミングエラー: {e}")
-                break
+        cap = self.cap
+        if not self.is_connected or cap is None:
+            return None
+        
+        ret, frame = cap.read()
+        if not ret or frame is None:
+            return None
+        self.frame_count += 1
+        
+        # FPS計算（カメラからの取得レート）
+        self._update_fps_counter()
+        return frame
+    
+    def _pipeline_capture_failed(self) -> bool:
+        """キャプチャ失敗時: 再接続試行（Supervisor管理時は再接続を任せる）"""
+        if self.failure_handler is not None:
+            return self.failure_handler()
+        self.logger.warning("フレーム取得失敗 - 再接続試行")
+        return self._reconnect()
+    
+    def _pipeline_inference(self, frame: np.ndarray):
+        """推論ステージ: 物体検出（描画は遅延）"""
+        return self.monitor.detect_frame(frame, source_id=self.current_url,
+                                         overlay_fn=self._draw_frame_info,
+                                         motion_gate=self.motion_gate,
+                                         roi_tiler=self.roi_tiler)
+    
+    def _pipeline_output(self, frame: np.ndarray, result):
+        """出力ステージ: 最新結果の公開（コールバック登録時のみ描画）"""
+        self.latest_frame = frame
+        self.latest_result = result
+        self.record_clip_frame(frame, result.counts)
+        
+        # コールバック実行
+        if self.stream_callback:
+            self.stream_callback(result.annotated, result.counts)
+    
+    def record_clip_frame(self, frame: np.ndarray, counts: dict):
+        """クリップ録画用リングバッファへの投入（カウント急変でイベント発動）"""
+        if self.clip_recorder is None:
+            return
+        self.clip_recorder.add_frame(frame)
+        self.clip_recorder.observe_counts(counts)
+    
+    def _on_inventory_alert(self, class_name: str, current_count: int, threshold: int):
+        """在庫アラート発動時: クリップ録画開始"""
+        if self.is_connected:
+            self.clip_recorder.trigger('alert', {'class_name': class_name,
+                                                 'count': current_count,
+                                                 'threshold': threshold})
+    
+    @property
+    def annotated_frame(self) -> Optional[np.ndarray]:
+        """最新の描画済みフレーム（初回参照時に描画）"""
+        result = self.latest_result
+        return result.annotated if result is not None else None
+    
+    @property
+    def latest_jpeg(self) -> Optional[bytes]:
+        """最新の配信用JPEG（同一結果のエンコードは1回のみ）"""
+        result = self.latest_result
+        if result is None:
+            return None
         
-        self.is_streaming = False
-        self.logger.info("ライブストリーミング終了")
+        with self._encode_lock:
+            if self._encoded_result is not result:
+                ok, buffer = cv2.imencode('.jpg', result.annotated,
+                                          [cv2.IMWRITE_JPEG_QUALITY, PIPELINE_CONFIG['jpeg_quality']])
+                self._encoded_jpeg = buffer.tobytes() if ok else None
+                self._encoded_result = result
+            return self._encoded_jpeg
     
     def _update_fps_counter(self):
         """FPS計算更新"""
@@ -266,16 +405,13 @@ class FactoryCameraConnection:
     
     def stop_live_streaming(self):
         """ライブストリーミング停止"""
-        if not self.is_streaming:
+        if self.pipeline is None:
             return
         
-        self.stop_streaming = True
-        
-        # スレッド終了待機
-        if self.streaming_thread and self.streaming_thread.is_alive():
-            self.streaming_thread.join(timeout=5.0)
+        # 各ステージのスレッド終了待機
+        self.pipeline.stop(timeout=5.0)
+        self.pipeline = None
         
-        self.is_streaming = False
         self.logger.info("ライブストリーミング停止")
     
     def _reconnect(self) -> bool:
@@ -286,8 +422,12 @@ class FactoryCameraConnection:
         for attempt in range(NETWORK_CONFIG['retry_attempts']):
             self.logger.info(f"再接続試行 {attempt + 1}/{NETWORK_CONFIG['retry_attempts']}")
             
-            if self.connect_camera(self.current_url):
-                return True
+            # ストリーミングスレッドから呼ばれるためパイプラインは停止しない
+            try:
+                if self._open_capture(self.current_url):
+                    return True
+            except Exception as e:
+                self.logger.error(f"再接続エラー: {e}")
             
             time.sleep(NETWORK_CONFIG['retry_delay'])
         
@@ -341,7 +481,10 @@ class FactoryCameraConnection:
                 'frame_height': int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
                 'fps': int(self.cap.get(cv2.CAP_PROP_FPS)),
                 'frame_count': self.frame_count,
-                'current_fps': getattr(self, 'current_fps', 0)
+                'current_fps': getattr(self, 'current_fps', 0),
+                'pipeline_stats': self.pipeline.get_stats() if self.pipeline else {},
+                'motion_gate_stats': self.motion_gate.get_stats() if self.motion_gate else {},
+                'clip_stats': self.clip_recorder.get_stats() if self.clip_recorder else {}
             }
             return info
             
@@ -370,14 +513,14 @@ class FactoryCameraConnection:
                 ret, frame = self.capture_single_frame()
                 
                 if ret and frame is not None:
-                    # 物体検出
-                    counts, annotated_frame = self.monitor.detect_objects(frame)
-                    
-                    # フレーム情報描画
-                    self._draw_frame_info(annotated_frame, counts)
+                    # 物体検出（描画は画面表示時のみ）
+                    result = self.monitor.detect_frame(frame, overlay_fn=self._draw_frame_info,
+                                                       motion_gate=self.motion_gate)
+                    counts = result.counts
                     
                     # 画面表示
                     if display:
+                        annotated_frame = result.annotated
                         cv2.imshow('Factory Monitor', annotated_frame)
                         
                         # キー入力チェック
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 複数カメラ監視
+カメラ毎の接続を並列に開き、切断時は揺らぎ付き指数バックオフで
+ワーカースレッドから再接続（他のカメラのパイプラインは止めない）
+"""
+
+import time
+import random
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from config import SUPERVISOR_CONFIG
+from camera_connection import FactoryCameraConnection
+from clip_recorder import source_label
+from factory_monitor import FactoryMonitor
+
+
+class SupervisedCamera:
+    """監視対象カメラ1台分の状態"""
+    
+    CONNECTING = 'connecting'
+    ONLINE = 'online'
+    RECONNECTING = 'reconnecting'
+    STOPPED = 'stopped'
+    
+    def __init__(self, camera_id: str, source, connection: FactoryCameraConnection):
+        self.camera_id = camera_id
+        self.source = source
+        self.connection = connection
+        self.state = self.CONNECTING
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.in_flight = False
+        self.last_error = None
+        self.reconnected = threading.Event()
+        
+        # フレーム進捗（停止検出用）
+        self.last_frame_count = 0
+        self.last_progress = time.monotonic()
+        
+        # 統計情報
+        self.connects = 0
+        self.disconnects = 0
+        self.online_since = None
+
+
+class CameraSupervisor:
+    """複数カメラの接続管理（並列接続・非同期再接続・ヘルス状態）"""
+    
+    def __init__(self, monitor: Optional[FactoryMonitor] = None,
+                 callback: Optional[Callable] = None):
+        """
+        初期化
+        
+        Args:
+            monitor: 全カメラで共有するFactoryMonitor（推論エンジンを共有）
+            callback: フレーム処理コールバック fn(camera_id, annotated_frame, counts)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.monitor = monitor or FactoryMonitor()
+        self.callback = callback
+        self.cameras: Dict[str, SupervisedCamera] = {}
+        self._lock = threading.Lock()
+        
+        self.executor = None
+        self.monitor_thread = None
+        self.stop_event = threading.Event()
+        self.is_running = False
+    
+    def add_camera(self, camera_id: str, source,
+                   zones: Optional[List] = None) -> FactoryCameraConnection:
+        """
+        カメラ追加（稼働中の場合はすぐに接続開始）
+        
+        Args:
+            camera_id: カメラ識別子
+            source: カメラソース（URL、デバイス番号など）
+            zones: このカメラの推論対象カウントゾーン（推論エンジンは共有、ROIはカメラ別）
+        
+        Returns:
+            FactoryCameraConnection: 追加したカメラの接続
+        """
+        connection = FactoryCameraConnection(self.monitor)
+        if zones:
+            connection.set_roi_zones(zones)
+        camera = SupervisedCamera(camera_id, source, connection)
+        connection.failure_handler = lambda: self._on_capture_failed(camera)
+        
+        with self._lock:
+            if camera_id in self.cameras:
+                raise ValueError(f"カメラIDが重複しています: {camera_id}")
+            self.cameras[camera_id] = camera
+        
+        if self.is_running:
+            self._schedule_connect(camera)
+        return connection
+    
+    def remove_camera(self, camera_id: str):
+        """カメラ削除（ストリーミング停止・切断）"""
+        with self._lock:
+            camera = self.cameras.pop(camera_id, None)
+        if camera is not None:
+            self._stop_camera(camera)
+    
+    def get_connection(self, camera_id: str) -> Optional[FactoryCameraConnection]:
+        """カメラ接続取得"""
+        camera = self.cameras.get(camera_id)
+        return camera.connection if camera is not None else None
+    
+    def start(self):
+        """全カメラを並列に接続開始（接続を待たずに戻る）"""
+        if self.is_running:
+            return
+        
+        self.stop_event.clear()
+        self.is_running = True
+        self.executor = ThreadPoolExecutor(max_workers=SUPERVISOR_CONFIG['max_workers'],
+                                           thread_name_prefix='camera-connect')
+        for camera in list(self.cameras.values()):
+            self._schedule_connect(camera)
+        
+        self.monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        self.monitor_thread.start()
+        self.logger.info(f"カメラ監視開始: {len(self.cameras)}台")
+    
+    def stop(self):
+        """全カメラ停止"""
+        if not self.is_running:
+            return
+        
+        self.is_running = False
+        self.stop_event.set()
+        for camera in list(self.cameras.values()):
+            camera.reconnected.set()
+        if self.monitor_thread and self.monitor_thread.is_alive():
+            self.monitor_thread.join(timeout=5.0)
+        
+        for camera in list(self.cameras.values()):
+            self._stop_camera(camera)
+        # 接続試行中のVideoCaptureはタイムアウトまで待たない
+        self.executor.shutdown(wait=False)
+        self.logger.info("カメラ監視停止")
+    
+    def _stop_camera(self, camera: SupervisedCamera):
+        """1台分の停止"""
+        camera.state = SupervisedCamera.STOPPED
+        camera.reconnected.set()
+        camera.connection.disconnect_camera()
+    
+    def _schedule_connect(self, camera: SupervisedCamera):
+        """接続試行をワーカーに投入（試行中は重複投入しない）"""
+        with self._lock:
+            if camera.in_flight or not self.is_running:
+                return
+            camera.in_flight = True
+        self.executor.submit(self._connect, camera)
+    
+    def _connect(self, camera: SupervisedCamera):
+        """接続試行（ワーカースレッド、VideoCaptureのオープン待ちはここでのみ発生）"""
+        connection = camera.connection
+        success = connection.reopen_capture(camera.source)
+        
+        with self._lock:
+            camera.in_flight = False
+            stopped = camera.state == SupervisedCamera.STOPPED or not self.is_running
+            if success and not stopped:
+                camera.state = SupervisedCamera.ONLINE
+                camera.failures = 0
+                camera.connects += 1
+                camera.online_since = time.time()
+                camera.last_progress = time.monotonic()
+                camera.last_error = None
+                camera.reconnected.set()
+        
+        if stopped:
+            # 停止後に接続が完了した場合は解放のみ
+            if success:
+                connection.disconnect_camera()
+            return
+        
+        if success:
+            # 初回のみパイプライン開始（再接続時は待機中のキャプチャスレッドが再開する）
+            if not connection.is_streaming:
+                connection.start_live_streaming(self._camera_callback(camera))
+            self.logger.info(f"カメラ接続: {camera.camera_id}")
+            return
+        
+        with self._lock:
+            camera.failures += 1
+            delay = self._backoff(camera.failures)
+            camera.next_attempt = time.monotonic() + delay
+            camera.last_error = '接続失敗'
+            camera.state = SupervisedCamera.RECONNECTING
+        self.logger.warning(f"カメラ接続失敗: {camera.camera_id} "
+                            f"({camera.failures}回目、{delay:.1f}秒後に再試行)")
+    
+    @staticmethod
+    def _backoff(failures: int) -> float:
+        """再接続待ち時間（指数バックオフ + 揺らぎ、複数台の同時再試行を分散）"""
+        delay = min(SUPERVISOR_CONFIG['backoff_initial'] * 2 ** (failures - 1),
+                    SUPERVISOR_CONFIG['backoff_max'])
+        return delay * random.uniform(1.0 - SUPERVISOR_CONFIG['backoff_jitter'], 1.0)
+    
+    def _camera_callback(self, camera: SupervisedCamera) -> Optional[Callable]:
+        """パイプライン用コールバック（カメラIDを付与）"""
+        if self.callback is None:
+            return None
+        return lambda frame, counts: self.callback(camera.camera_id, frame, counts)
+    
+    def _on_capture_failed(self, camera: SupervisedCamera) -> bool:
+        """
+        キャプチャ失敗時（パイプラインのキャプチャスレッドから呼ばれる）
+        
+        再接続はワーカーに任せ、このカメラのキャプチャスレッドのみ短時間待機する
+        
+        Returns:
+            bool: パイプラインを継続するか
+        """
+        if not self.is_running or camera.state == SupervisedCamera.STOPPED:
+            return False
+        
+        self._mark_disconnected(camera, 'フレーム取得失敗')
+        self._schedule_connect_if_due(camera)
+        camera.reconnected.wait(SUPERVISOR_CONFIG['check_interval'])
+        return self.is_running
+    
+    def _mark_disconnected(self, camera: SupervisedCamera, reason: str):
+        """接続中のカメラを再接続待ちに変更（キャプチャの再オープンは接続試行で行う）"""
+        with self._lock:
+            if camera.state != SupervisedCamera.ONLINE:
+                return
+            # 再接続完了までキャプチャスレッドが古いキャプチャを読まないようにする
+            camera.connection.is_connected = False
+            camera.state = SupervisedCamera.RECONNECTING
+            camera.disconnects += 1
+            camera.online_since = None
+            camera.next_attempt = time.monotonic()
+            camera.last_error = reason
+            camera.reconnected.clear()
+        self.logger.warning(f"カメラ切断検出: {camera.camera_id} ({reason})")
+    
+    def _schedule_connect_if_due(self, camera: SupervisedCamera):
+        """再試行時刻に達していれば接続試行"""
+        if camera.state == SupervisedCamera.RECONNECTING and time.monotonic() >= camera.next_attempt:
+            self._schedule_connect(camera)
+    
+    def _monitor_loop(self):
+        """監視ループ（再試行の投入・フレーム停止の検出）"""
+        while not self.stop_event.wait(SUPERVISOR_CONFIG['check_interval']):
+            now = time.monotonic()
+            for camera in list(self.cameras.values()):
+                frame_count = camera.connection.frame_count
+                if frame_count != camera.last_frame_count:
+                    camera.last_frame_count = frame_count
+                    camera.last_progress = now
+                elif (camera.state == SupervisedCamera.ONLINE and
+                      now - camera.last_progress > SUPERVISOR_CONFIG['stall_timeout']):
+                    # 読み取りが返らないキャプチャは接続試行で解放・再オープン
+                    self._mark_disconnected(camera, 'フレーム停止')
+                
+                self._schedule_connect_if_due(camera)
+    
+    def get_health(self) -> Dict[str, Dict]:
+        """カメラ別ヘルス状態"""
+        now = time.monotonic()
+        health = {}
+        for camera_id, camera in list(self.cameras.items()):
+            health[camera_id] = {
+                'state': camera.state,
+                'source': source_label(camera.source),
+                'failures': camera.failures,
+                'attempting': camera.in_flight,
+                'retry_in': (round(max(camera.next_attempt - now, 0.0), 1)
+                             if camera.state == SupervisedCamera.RECONNECTING and not camera.in_flight
+                             else None),
+                'last_error': camera.last_error,
+                'connects': camera.connects,
+                'disconnects': camera.disconnects,
+                'online_since': camera.online_since,
+                'seconds_since_frame': round(now - camera.last_progress, 1),
+                'current_fps': getattr(camera.connection, 'current_fps', 0)
+            }
+        return health
+
+
+def main():
+    """複数カメラ監視（引数: カメラソース...）"""
+    import sys
+    
+    logging.basicConfig(level=logging.INFO)
+    sources = sys.argv[1:] or [0]
+    
+    supervisor = CameraSupervisor()
+    for index, source in enumerate(sources):
+        source = int(source) if str(source).isdigit() else source
+        supervisor.add_camera(f"camera{index}", source)
+    
+    supervisor.start()
+    try:
+        while True:
+            time.sleep(5)
+            for camera_id, health in supervisor.get_health().items():
+                print(f"{camera_id}: {health['state']} "
+                      f"(FPS: {health['current_fps']:.1f}, 失敗: {health['failures']})")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
+        supervisor.monitor.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,9 @@ from requests.auth import HTTPBasicAuth
 from ultralytics import YOLO
 import os
 import socket
+import subprocess
+from stream_prober import StreamProber
+from stream_cache import StreamCache
 
 app = Flask(__name__)
 
@@ -34,6 +37,10 @@ class CCTVKiriiWifiSystem:
         self.password = "admin"
         self.working_url = None
         
+        # 前回動作したURL（再起動時は確認1回で再利用）
+        self.stream_cache = StreamCache()
+        self.cache_key = "kirii_wifi:192.168.1.10"
+        
         # YOLO設定
         self.model = None
         self.load_yolo_model()
@@ -58,37 +65,19 @@ class CCTVKiriiWifiSystem:
             print(f"❌ YOLOモデル読み込みエラー: {e}")
     
     def test_network_connectivity(self):
-        """ネットワーク接続性テスト"""
-        self.debug_info = []
-        
-        # 1. 中間ルーターへのping
-        print("🔍 中間ルーター接続テスト...")
-        try:
-            import subprocess
-            result = subprocess.run(['ping', '-c', '3', '192.168.0.115'], 
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                self.debug_info.append("✅ 中間ルーター(192.168.0.115): 接続OK")
-                print("✅ 中間ルーター接続成功")
-            else:
-                self.debug_info.append("❌ 中間ルーター(192.168.0.115): ping失敗")
-        except Exception as e:
-            self.debug_info.append(f"❌ 中間ルーターping エラー: {e}")
-        
-        # 2. CCTVへのping
-        print("🔍 CCTV接続テスト...")
-        try:
-            result = subprocess.run(['ping', '-c', '3', '192.168.1.10'], 
-                                  capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                self.debug_info.append("✅ CCTV(192.168.1.10): 接続OK")
-                print("✅ CCTV接続成功")
-            else:
-                self.debug_info.append("❌ CCTV(192.168.1.10): ping失敗")
-        except Exception as e:
-            self.debug_info.append(f"❌ CCTVping エラー: {e}")
+        """ネットワーク接続性テスト（ping・ルート確認は同時に実行）"""
+        # 1. 中間ルーター / 2. CCTV へのping、3. ルーティングテーブル確認
+        print("🔍 中間ルーター・CCTV接続テスト...")
+        targets = [('中間ルーター', '192.168.0.115'), ('CCTV', '192.168.1.10')]
+        processes = []
+        for name, ip in targets:
+            try:
+                processes.append((name, ip, subprocess.Popen(['ping', '-c', '3', ip],
+                                                             stdout=subprocess.PIPE,
+                                                             stderr=subprocess.PIPE, text=True)))
+            except Exception as e:
+                self.debug_info.append(f"❌ {name}ping エラー: {e}")
         
-        # 3. ルーティングテーブル確認
         try:
             result = subprocess.run(['netstat', '-rn'], 
                                   capture_output=True, text=True, timeout=5)
@@ -98,64 +87,58 @@ class CCTVKiriiWifiSystem:
                 self.debug_info.append("❌ ルーティングテーブル: 192.168.1.x ルート不明")
         except Exception as e:
             self.debug_info.append(f"❌ ルーティング確認エラー: {e}")
+        
+        for name, ip, process in processes:
+            try:
+                process.communicate(timeout=10)
+                if process.returncode == 0:
+                    self.debug_info.append(f"✅ {name}({ip}): 接続OK")
+                    print(f"✅ {name}接続成功")
+                else:
+                    self.debug_info.append(f"❌ {name}({ip}): ping失敗")
+            except subprocess.TimeoutExpired:
+                process.kill()
+                self.debug_info.append(f"❌ {name}ping エラー: タイムアウト")
     
     def test_cctv_connections(self):
-        """複数のCCTV接続方法をテスト"""
+        """複数のCCTV接続方法をテスト（診断と並行して全候補を時間差で並列に試行）"""
         print("🔍 CCTV接続テスト開始...")
-        self.test_network_connectivity()
+        self.debug_info = []
+        auth = HTTPBasicAuth(self.username, self.password)
         
-        for i, url in enumerate(self.cctv_urls, 1):
-            print(f"📡 テスト {i}: {url}")
-            try:
-                # より詳細なリクエスト設定
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                    'Accept': 'multipart/x-mixed-replace,*/*',
-                    'Connection': 'keep-alive'
-                }
-                
-                response = requests.get(
-                    url,
-                    auth=HTTPBasicAuth(self.username, self.password),
-                    headers=headers,
-                    timeout=8,
-                    stream=False,
-                    verify=False  # HTTPS証明書検証無効
-                )
-                
-                print(f"📊 HTTP Status: {response.status_code}")
-                print(f"📊 Content-Type: {response.headers.get('content-type', 'Unknown')}")
-                
-                if response.status_code == 200:
-                    content_type = response.headers.get('content-type', '')
-                    if 'multipart' in content_type or 'image' in content_type:
-                        print(f"✅ 接続成功 (MJPEG): {url}")
-                        self.working_url = url
-                        self.connection_status = f"接続成功 (方法{i})"
-                        self.debug_info.append(f"✅ 成功URL: {url}")
-                        return True
-                    else:
-                        print(f"⚠️ 接続成功だが映像形式が不明: {content_type}")
-                        self.debug_info.append(f"⚠️ URL{i}: HTTP 200だが映像形式不明")
-                elif response.status_code == 401:
-                    print(f"🔐 認証エラー: {url}")
-                    self.debug_info.append(f"🔐 URL{i}: 認証エラー (401)")
-                else:
-                    print(f"❌ HTTP {response.status_code}: {url}")
-                    self.debug_info.append(f"❌ URL{i}: HTTP {response.status_code}")
-                    
-            except requests.exceptions.ConnectTimeout:
-                print(f"⏰ タイムアウト: {url}")
-                self.debug_info.append(f"⏰ URL{i}: タイムアウト")
-            except requests.exceptions.ConnectionError as e:
-                print(f"🔌 接続エラー: {url} - {str(e)[:100]}")
-                self.debug_info.append(f"🔌 URL{i}: 接続エラー")
-            except requests.exceptions.SSLError as e:
-                print(f"🔒 SSL証明書エラー: {url}")
-                self.debug_info.append(f"🔒 URL{i}: SSL証明書エラー")
-            except Exception as e:
-                print(f"❌ その他エラー: {url} - {str(e)[:100]}")
-                self.debug_info.append(f"❌ URL{i}: {str(e)[:50]}")
+        cached = self.stream_cache.get_validated(self.cache_key, auth=auth, verify=False)
+        if cached is not None:
+            print(f"✅ 前回の映像URLを再利用: {cached['url']}")
+            self.working_url = cached['url']
+            self.connection_status = "接続成功 (キャッシュ)"
+            self.debug_info.append(f"✅ キャッシュURL: {cached['url']}")
+            return True
+        
+        # ping等の診断は映像URL探索を待たせない
+        diagnostics = threading.Thread(target=self.test_network_connectivity, daemon=True)
+        diagnostics.start()
+        
+        prober = StreamProber(auth=auth, verify=False)
+        working, results = prober.probe_first(self.cctv_urls)
+        
+        for i, result in enumerate(results, 1):
+            print(f"📡 テスト {i}: {result['url']}")
+            if result['success']:
+                print(f"✅ 接続成功 (MJPEG): {result['url']}")
+            else:
+                print(f"❌ {result['error']}")
+                self.debug_info.append(f"❌ URL{i}: {result['error'][:50]}")
+        
+        diagnostics.join(timeout=1.0)
+        
+        if working is not None:
+            method = results.index(working) + 1
+            self.working_url = working['url']
+            self.connection_status = f"接続成功 (方法{method})"
+            self.debug_info.append(f"✅ 成功URL: {working['url']}")
+            self.stream_cache.put(self.cache_key, working['url'], auth_mode='basic',
+                                  content_type=working['content_type'])
+            return True
         
         self.connection_status = "全て接続失敗"
         self.debug_info.append("❌ 全ての接続方法が失敗")
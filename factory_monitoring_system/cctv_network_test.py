@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 
-import requests
 import cv2
 import numpy as np
 from flask import Flask, render_template_string
 import threading
-import time
+from stream_prober import StreamProber
 
 app = Flask(__name__)
 
@@ -43,17 +42,17 @@ class CCTVNetworkTester:
         ]
         
         print("🔍 CCTV接続テスト開始...")
-        self.test_results = []
         
-        for url in test_urls:
-            result = self.test_single_url(url)
-            self.test_results.append(result)
+        # 全候補を同時に試行（全体の期限内に終わらない候補は失敗扱い）
+        self.test_results = StreamProber().probe_all(test_urls)
+        
+        for result in self.test_results:
+            url = result['url']
             print(f"{'✅' if result['success'] else '❌'} {url[:60]}{'...' if len(url) > 60 else ''}")
             if result['success']:
                 print(f"   ✅ 成功: {result['message']}")
             else:
                 print(f"   ❌ 失敗: {result['error']}")
-            time.sleep(1)
         
         # 成功したURLを表示
         successful_urls = [r for r in self.test_results if r['success']]
@@ -65,55 +64,6 @@ class CCTVNetworkTester:
             print("\n❌ 接続できるURLが見つかりませんでした")
             
         return self.test_results
-    
-    def test_single_url(self, url):
-        """単一URLのテスト"""
-        try:
-            # 短いタイムアウトでテスト
-            response = requests.get(url, timeout=5, stream=True)
-            
-            if response.status_code == 200:
-                # Content-Typeを確認
-                content_type = response.headers.get('content-type', '')
-                
-                if 'image' in content_type.lower() or 'mjpeg' in content_type.lower():
-                    return {
-                        'url': url,
-                        'success': True,
-                        'message': f'HTTP {response.status_code}, Content-Type: {content_type}',
-                        'content_type': content_type
-                    }
-                else:
-                    return {
-                        'url': url,
-                        'success': False,
-                        'error': f'不正なContent-Type: {content_type}'
-                    }
-            else:
-                return {
-                    'url': url,
-                    'success': False,
-                    'error': f'HTTP {response.status_code}'
-                }
-                
-        except requests.exceptions.ConnectTimeout:
-            return {
-                'url': url,
-                'success': False,
-                'error': '接続タイムアウト'
-            }
-        except requests.exceptions.ConnectionError as e:
-            return {
-                'url': url,
-                'success': False,
-                'error': f'接続エラー: {str(e)[:50]}...'
-            }
-        except Exception as e:
-            return {
-                'url': url,
-                'success': False,
-                'error': f'エラー: {str(e)[:50]}...'
-            }
 
 # グローバルインスタンス
 tester = CCTVNetworkTester()
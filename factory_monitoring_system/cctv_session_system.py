@@ -1,14 +1,16 @@
 #!/usr/bin/env python3
 
 import requests
-import cv2
-import numpy as np
-from flask import Flask, render_template_string
+from flask import Flask, render_template_string, request, Response
 import threading
 import time
-import base64
+from mjpeg_parser import iter_mjpeg_frames, decode_jpeg
+from frame_transport import FrameChannel
 from requests.auth import HTTPBasicAuth
 from ultralytics import YOLO
+from detection_results import DetectionArray, draw_detections
+from stream_prober import StreamProber
+from stream_cache import StreamCache
 import os
 import re
 
@@ -28,11 +30,16 @@ class CCTVSessionSystem:
         self.session_id = None
         self.working_url = None
         
+        # 前回動作したURL・セッションID（再起動時は確認1回で再利用）
+        self.stream_cache = StreamCache()
+        self.cache_key = f"session:{self.router_ip}/{self.cctv_ip}"
+        
         # YOLO設定
         self.model = None
         self.load_yolo_model()
         
         # ストリーム設定
+        self.frame_channel = FrameChannel()
         self.current_frame = None
         self.is_streaming = False
         self.detection_results = []
@@ -135,98 +142,44 @@ class CCTVSessionSystem:
         
         test_urls = session_urls + basic_urls
         
-        for i, url in enumerate(test_urls, 1):
-            print(f"📡 テスト {i}: {url}")
-            
-            try:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-                    'Accept': 'multipart/x-mixed-replace,*/*',
-                    'Connection': 'keep-alive'
-                }
-                
-                # まずHEADリクエストで確認
-                response = self.session.head(
-                    url,
-                    headers=headers,
-                    timeout=8,
-                    allow_redirects=True
-                )
-                
-                print(f"📊 HTTP Status: {response.status_code}")
-                content_type = response.headers.get('content-type', 'Unknown')
-                print(f"📊 Content-Type: {content_type}")
-                
-                if response.status_code == 200:
-                    if 'multipart' in content_type.lower() or 'image' in content_type.lower():
-                        print(f"✅ 映像ストリーム発見: {url}")
-                        self.working_url = url
-                        self.connection_status = f"映像ストリーム発見 (方法{i})"
-                        self.debug_info.append(f"✅ 成功URL: {url}")
-                        self.debug_info.append(f"✅ Content-Type: {content_type}")
-                        return True
-                    else:
-                        # GETリクエストで実際のデータを少し取得して確認
-                        try:
-                            get_response = self.session.get(
-                                url,
-                                headers=headers,
-                                timeout=5,
-                                stream=True
-                            )
-                            
-                            # 最初の2048バイトを取得（より多くのデータを確認）
-                            chunk = b''
-                            for data in get_response.iter_content(chunk_size=1024):
-                                chunk += data
-                                if len(chunk) >= 2048:
-                                    break
-                            get_response.close()
-                            
-                            # JPEG画像の開始バイトまたはMJPEG境界をチェック
-                            if (chunk.startswith(b'\xff\xd8') or 
-                                b'--boundary' in chunk or 
-                                b'Content-Type: image/jpeg' in chunk):
-                                print(f"✅ MJPEG画像データ検出: {url}")
-                                self.working_url = url
-                                self.connection_status = f"MJPEG検出 (方法{i})"
-                                self.debug_info.append(f"✅ MJPEG URL: {url}")
-                                return True
-                            else:
-                                print(f"⚠️ 画像データではない: {url}")
-                                self.debug_info.append(f"⚠️ URL{i}: 画像データではない")
-                                # デバッグ用：最初の100バイトを表示
-                                print(f"🔍 データサンプル: {chunk[:100]}")
-                                
-                        except Exception as e:
-                            print(f"⚠️ データ取得エラー: {str(e)[:50]}")
-                            self.debug_info.append(f"⚠️ URL{i}: データ取得エラー")
-                            
-                elif response.status_code == 401:
-                    print(f"🔐 認証エラー: {url}")
-                    self.debug_info.append(f"🔐 URL{i}: 認証エラー")
-                else:
-                    print(f"❌ HTTP {response.status_code}: {url}")
-                    self.debug_info.append(f"❌ URL{i}: HTTP {response.status_code}")
-                    
-            except requests.exceptions.ConnectTimeout:
-                print(f"⏰ タイムアウト: {url}")
-                self.debug_info.append(f"⏰ URL{i}: タイムアウト")
-            except requests.exceptions.ConnectionError as e:
-                print(f"🔌 接続エラー: {url}")
-                self.debug_info.append(f"🔌 URL{i}: 接続エラー")
-            except Exception as e:
-                print(f"❌ その他エラー: {url} - {str(e)[:50]}")
-                self.debug_info.append(f"❌ URL{i}: {str(e)[:30]}")
+        # セッションCookie・認証はself.sessionを全候補で共有
+        prober = StreamProber(session=self.session)
+        working, results = prober.probe_first(test_urls)
+        
+        for i, result in enumerate(results, 1):
+            if result['success']:
+                print(f"✅ 映像ストリーム発見: {result['url']}")
+            else:
+                print(f"❌ テスト {i}: {result['error']} - {result['url']}")
+                self.debug_info.append(f"❌ URL{i}: {result['error'][:30]}")
+        
+        if working is not None:
+            method = results.index(working) + 1
+            self.working_url = working['url']
+            self.connection_status = f"映像ストリーム発見 (方法{method})"
+            self.debug_info.append(f"✅ 成功URL: {working['url']}")
+            self.debug_info.append(f"✅ Content-Type: {working['content_type']}")
+            self.stream_cache.put(self.cache_key, working['url'], auth_mode='session',
+                                  session_id=self.session_id, content_type=working['content_type'])
+            return True
         
         self.connection_status = "全ての映像URL失敗"
         self.debug_info.append("❌ 全ての映像URLテスト失敗")
         return False
     
     def test_cctv_connections(self):
-        """CCTV接続テスト（セッション管理付き）"""
+        """CCTV接続テスト（セッション管理付き、前回のURL・セッションが使えれば探索しない）"""
         print("🔍 CCTV接続テスト開始...")
         
+        cached = self.stream_cache.get_validated(self.cache_key, session=self.session)
+        if cached is not None:
+            print(f"✅ 前回の映像URLを再利用: {cached['url']}")
+            self.session_id = cached['session_id']
+            self.working_url = cached['url']
+            self.connection_status = "映像ストリーム発見 (キャッシュ)"
+            self.debug_info = [f"✅ キャッシュURL: {cached['url']}"]
+            return True
+        
         # 1. CCTVセッション確立
         if not self.establish_cctv_session():
             return False
@@ -241,30 +194,14 @@ class CCTVSessionSystem:
         
         try:
             results = self.model(frame, verbose=False)
-            detections = []
             
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        conf = box.conf[0].cpu().numpy()
-                        cls = int(box.cls[0].cpu().numpy())
-                        
-                        if conf > 0.5:
-                            class_name = self.model.names[cls]
-                            detections.append({
-                                'class': class_name,
-                                'confidence': float(conf),
-                                'bbox': [int(x1), int(y1), int(x2), int(y2)]
-                            })
-                            
-                            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                            label = f'{class_name}: {conf:.2f}'
-                            cv2.putText(frame, label, (int(x1), int(y1) - 10), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            # 検出結果をNumPyへ一括変換・信頼度でフィルタ
+            detections = DetectionArray.from_yolo_result(results[0], self.model.names, conf_threshold=0.5)
             
-            return frame, detections
+            # バウンディングボックス・ラベル描画
+            draw_detections(frame, detections, label_background=False)
+            
+            return frame, detections.to_dicts()
             
         except Exception as e:
             print(f"❌ YOLO検出エラー: {e}")
@@ -299,43 +236,25 @@ class CCTVSessionSystem:
                     print("✅ CCTV映像ストリーム開始")
                     self.connection_status = "ストリーミング中"
                     
-                    buffer = b''
                     frame_count = 0
                     
-                    for chunk in response.iter_content(chunk_size=1024):
+                    for jpeg_data in iter_mjpeg_frames(response):
                         if not self.is_streaming:
                             break
-                            
-                        buffer += chunk
                         
-                        while True:
-                            start = buffer.find(b'\xff\xd8')
-                            end = buffer.find(b'\xff\xd9')
+                        frame = decode_jpeg(jpeg_data)
+                        
+                        if frame is not None:
+                            processed_frame, detections = self.detect_objects(frame)
+                            
+                            self.current_frame = self.frame_channel.publish(processed_frame)
+                            self.detection_results = detections
                             
-                            if start != -1 and end != -1 and end > start:
-                                jpeg_data = buffer[start:end+2]
-                                buffer = buffer[end+2:]
-                                
-                                img_array = np.frombuffer(jpeg_data, np.uint8)
-                                frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-                                
-                                if frame is not None:
-                                    processed_frame, detections = self.detect_objects(frame)
-                                    
-                                    _, buffer_encoded = cv2.imencode('.jpg', processed_frame, 
-                                                                   [cv2.IMWRITE_JPEG_QUALITY, 80])
-                                    frame_base64 = base64.b64encode(buffer_encoded).decode('utf-8')
-                                    
-                                    self.current_frame = frame_base64
-                                    self.detection_results = detections
-                                    
-                                    frame_count += 1
-                                    if frame_count % 30 == 0:
-                                        print(f"🖼️ フレーム {frame_count}: {len(detections)} objects detected")
-                                    
-                                    time.sleep(0.1)
-                            else:
-                                break
+                            frame_count += 1
+                            if frame_count % 30 == 0:
+                                print(f"🖼️ フレーム {frame_count}: {len(detections)} objects detected")
+                            
+                            time.sleep(0.1)
                 else:
                     print(f"❌ CCTV映像ストリーム失敗: {response.status_code}")
                     self.connection_status = f"HTTP {response.status_code} エラー"
@@ -520,12 +439,15 @@ def index():
             function updateFrame() {
                 if (!isStreaming) return;
                 
-                fetch('/get_frame')
+                fetch('/get_frame?binary=1')
                 .then(response => response.json())
                 .then(data => {
-                    if (data.success && data.frame) {
+                    if (data.success && data.frame_url) {
                         const img = document.getElementById('videoFrame');
-                        img.src = 'data:image/jpeg;base64,' + data.frame;
+                        if (img.dataset.seq !== String(data.seq)) {
+                            img.dataset.seq = data.seq;
+                            img.src = data.frame_url;
+                        }
                         img.style.display = 'block';
                         document.getElementById('noVideo').style.display = 'none';
                         
@@ -604,15 +526,31 @@ def stop_stream():
 @app.route('/get_frame')
 def get_frame():
     """フレーム取得"""
-    if cctv_system.current_frame:
-        return {
-            'success': True, 
-            'frame': cctv_system.current_frame,
+    frame = cctv_system.current_frame
+    if frame:
+        response = {
+            'success': True,
+            'seq': frame.seq,
             'detections': cctv_system.detection_results
         }
+        if request.args.get('binary') == '1':
+            # 画像本体は/frame.jpgからバイナリで取得
+            response['frame_url'] = f'/frame.jpg?seq={frame.seq}'
+        else:
+            response['frame'] = frame.base64
+        return response
     else:
         return {'success': False}
 
+@app.route('/frame.jpg')
+def frame_jpeg():
+    """最新フレーム取得（JPEGバイナリ）"""
+    frame = cctv_system.current_frame
+    if not frame:
+        return Response(status=204)
+    return Response(frame.jpeg, mimetype='image/jpeg',
+                    headers={'Cache-Control': 'no-store', 'X-Frame-Seq': str(frame.seq)})
+
 if __name__ == '__main__':
     print("🏭 KIRII CCTV-YOLO監視システム (Session管理)")
     print("📡 中間ルーター: 192.168.0.115")
@@ -1,14 +1,14 @@
 #!/usr/bin/env python3
 
 import requests
-import cv2
-import numpy as np
-from flask import Flask, render_template_string
+from flask import Flask, render_template_string, request, Response
 import threading
 import time
-import base64
+from mjpeg_parser import iter_mjpeg_frames, decode_jpeg
+from frame_transport import FrameChannel, MJPEG_MIMETYPE
 from requests.auth import HTTPBasicAuth
-from ultralytics import YOLO
+from batch_inference import get_shared_engine
+from detection_results import DetectionArray, draw_detections
 import os
 
 app = Flask(__name__)
@@ -22,9 +22,11 @@ class CCTVWorkingRestored:
         
         # YOLO設定
         self.model = None
+        self.inference_engine = None
         self.load_yolo_model()
         
         # ストリーム設定
+        self.frame_channel = FrameChannel()
         self.current_frame = None
         self.is_streaming = False
         self.detection_results = []
@@ -35,7 +37,9 @@ class CCTVWorkingRestored:
         try:
             model_path = 'yolo11n.pt'
             if os.path.exists(model_path):
-                self.model = YOLO(model_path)
+                # 同一プロセス内のストリームでバッチ推論エンジンを共有
+                self.inference_engine = get_shared_engine(model_path)
+                self.model = self.inference_engine.model
                 print("✅ YOLO11モデル読み込み成功")
             else:
                 print("❌ YOLOモデルファイルが見つかりません")
@@ -48,31 +52,15 @@ class CCTVWorkingRestored:
             return frame, []
         
         try:
-            results = self.model(frame, verbose=False)
-            detections = []
+            results = [self.inference_engine.infer(frame)]
             
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        conf = box.conf[0].cpu().numpy()
-                        cls = int(box.cls[0].cpu().numpy())
-                        
-                        if conf > 0.5:
-                            class_name = self.model.names[cls]
-                            detections.append({
-                                'class': class_name,
-                                'confidence': float(conf),
-                                'bbox': [int(x1), int(y1), int(x2), int(y2)]
-                            })
-                            
-                            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                            label = f'{class_name}: {conf:.2f}'
-                            cv2.putText(frame, label, (int(x1), int(y1) - 10), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            # 検出結果をNumPyへ一括変換・信頼度でフィルタ
+            detections = DetectionArray.from_yolo_result(results[0], self.model.names, conf_threshold=0.5)
+            
+            # バウンディングボックス・ラベル描画
+            draw_detections(frame, detections, label_background=False)
             
-            return frame, detections
+            return frame, detections.to_dicts()
             
         except Exception as e:
             print(f"❌ YOLO検出エラー: {e}")
@@ -80,6 +68,10 @@ class CCTVWorkingRestored:
     
     def start_cctv_stream(self):
         """CCTVストリーム開始"""
+        if self.is_streaming:
+            # 既存のキャプチャを全視聴者で共有（カメラへの接続は1本のみ）
+            return True
+        
         self.is_streaming = True
         
         def stream_worker():
@@ -97,43 +89,25 @@ class CCTVWorkingRestored:
                     print("✅ CCTV接続成功")
                     self.connection_status = "ストリーミング中"
                     
-                    buffer = b''
                     frame_count = 0
                     
-                    for chunk in response.iter_content(chunk_size=1024):
+                    for jpeg_data in iter_mjpeg_frames(response):
                         if not self.is_streaming:
                             break
-                            
-                        buffer += chunk
                         
-                        while True:
-                            start = buffer.find(b'\xff\xd8')
-                            end = buffer.find(b'\xff\xd9')
+                        frame = decode_jpeg(jpeg_data)
+                        
+                        if frame is not None:
+                            processed_frame, detections = self.detect_objects(frame)
+                            
+                            self.current_frame = self.frame_channel.publish(processed_frame)
+                            self.detection_results = detections
+                            
+                            frame_count += 1
+                            if frame_count % 30 == 0:
+                                print(f"🖼️ フレーム {frame_count}: {len(detections)} objects detected")
                             
-                            if start != -1 and end != -1 and end > start:
-                                jpeg_data = buffer[start:end+2]
-                                buffer = buffer[end+2:]
-                                
-                                img_array = np.frombuffer(jpeg_data, np.uint8)
-                                frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-                                
-                                if frame is not None:
-                                    processed_frame, detections = self.detect_objects(frame)
-                                    
-                                    _, buffer_encoded = cv2.imencode('.jpg', processed_frame, 
-                                                                   [cv2.IMWRITE_JPEG_QUALITY, 80])
-                                    frame_base64 = base64.b64encode(buffer_encoded).decode('utf-8')
-                                    
-                                    self.current_frame = frame_base64
-                                    self.detection_results = detections
-                                    
-                                    frame_count += 1
-                                    if frame_count % 30 == 0:
-                                        print(f"🖼️ フレーム {frame_count}: {len(detections)} objects detected")
-                                    
-                                    time.sleep(0.1)
-                            else:
-                                break
+                            time.sleep(0.1)
                 else:
                     print(f"❌ CCTV接続失敗: {response.status_code}")
                     self.connection_status = f"HTTP {response.status_code} エラー"
@@ -249,7 +223,7 @@ def index():
                         updateStatus('✅ YOLO監視開始', 'success');
                         document.getElementById('streamStatus').textContent = '監視中';
                         isStreaming = true;
-                        updateInterval = setInterval(updateFrame, 200);
+                        updateInterval = setInterval(updateFrame, 1000); // 検出結果のみ更新（映像は/video_feed）
                     } else {
                         updateStatus('❌ 監視開始失敗', 'error');
                         document.getElementById('streamStatus').textContent = 'エラー';
@@ -269,6 +243,7 @@ def index():
                 .then(data => {
                     updateStatus('⏹️ 監視停止', 'info');
                     document.getElementById('streamStatus').textContent = '停止中';
+                    document.getElementById('videoFrame').removeAttribute('src');
                     document.getElementById('videoFrame').style.display = 'none';
                     document.getElementById('noVideo').style.display = 'block';
                     document.getElementById('objectCount').textContent = '0';
@@ -279,12 +254,14 @@ def index():
             function updateFrame() {
                 if (!isStreaming) return;
                 
-                fetch('/get_frame')
+                fetch('/get_frame?binary=1')
                 .then(response => response.json())
                 .then(data => {
-                    if (data.success && data.frame) {
+                    if (data.success && data.frame_url) {
                         const img = document.getElementById('videoFrame');
-                        img.src = 'data:image/jpeg;base64,' + data.frame;
+                        if (!img.getAttribute('src')) {
+                            img.src = '/video_feed';
+                        }
                         img.style.display = 'block';
                         document.getElementById('noVideo').style.display = 'none';
                         
@@ -345,15 +322,37 @@ def stop_stream():
 @app.route('/get_frame')
 def get_frame():
     """フレーム取得"""
-    if cctv_system.current_frame:
-        return {
-            'success': True, 
-            'frame': cctv_system.current_frame,
+    frame = cctv_system.current_frame
+    if frame:
+        response = {
+            'success': True,
+            'seq': frame.seq,
             'detections': cctv_system.detection_results
         }
+        if request.args.get('binary') == '1':
+            # 画像本体は/frame.jpgからバイナリで取得
+            response['frame_url'] = f'/frame.jpg?seq={frame.seq}'
+        else:
+            response['frame'] = frame.base64
+        return response
     else:
         return {'success': False}
 
+@app.route('/video_feed')
+def video_feed():
+    """MJPEGストリーム配信（全視聴者で1キャプチャ・1エンコードを共有）"""
+    return Response(cctv_system.frame_channel.iter_multipart(lambda: cctv_system.is_streaming),
+                    mimetype=MJPEG_MIMETYPE)
+
+@app.route('/frame.jpg')
+def frame_jpeg():
+    """最新フレーム取得（JPEGバイナリ）"""
+    frame = cctv_system.current_frame
+    if not frame:
+        return Response(status=204)
+    return Response(frame.jpeg, mimetype='image/jpeg',
+                    headers={'Cache-Control': 'no-store', 'X-Frame-Seq': str(frame.seq)})
+
 if __name__ == '__main__':
     print("🏭 KIRII CCTV-YOLO監視システム (復元版)")
     print("📺 CCTV: 192.168.0.98:18080 (動作確認済み)")
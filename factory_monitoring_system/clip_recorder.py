@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - イベントクリップ録画
+カメラ毎にエンコード済みJPEGをバイト数上限のリングバッファで保持し、
+イベント発生時に前後の映像をMJPEG AVIとしてバックグラウンドで書き出す
+（縮小・JPEGエンコードもエンコードスレッドで行い、出力ステージを待たせない）
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import struct
+import threading
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+import cv2
+import numpy as np
+
+from config import CLIP_CONFIG, DATA_CONFIG
+
+
+def source_label(source) -> str:
+    """
+    カメラソースの表示名（URLの認証情報・クエリを除去）
+    
+    Args:
+        source: カメラソース（URL、デバイス番号など）
+    
+    Returns:
+        str: メタデータ・ファイル名に記録できる名前
+    """
+    text = str(source)
+    parts = urlsplit(text)
+    if not parts.scheme or not parts.netloc:
+        return text
+    host = parts.hostname or ''
+    if ':' in host:
+        host = f"[{host}]"
+    if parts.port is not None:
+        host = f"{host}:{parts.port}"
+    return urlunsplit((parts.scheme, host, parts.path, '', ''))
+
+
+def _chunk(fourcc: bytes, data: bytes) -> bytes:
+    """RIFFチャンク（奇数長は1バイト詰める）"""
+    return fourcc + struct.pack('<I', len(data)) + data + (b'\0' if len(data) % 2 else b'')
+
+
+def _list(list_type: bytes, data: bytes) -> bytes:
+    """RIFF LISTチャンク"""
+    return _chunk(b'LIST', list_type + data)
+
+
+def write_mjpeg_avi(path: str, jpeg_frames: Sequence[bytes], fps: float, width: int, height: int):
+    """
+    エンコード済みJPEG列をそのままMJPEG AVIに格納（再エンコードなし）
+    
+    Args:
+        path: 出力ファイル
+        jpeg_frames: JPEGバイト列のリスト
+        fps: フレームレート
+        width: 幅
+        height: 高さ
+    """
+    fps = max(fps, 0.1)
+    frame_count = len(jpeg_frames)
+    max_frame = max((len(frame) for frame in jpeg_frames), default=0)
+    
+    main_header = struct.pack(
+        '<14I',
+        int(round(1000000 / fps)),          # dwMicroSecPerFrame
+        int(max_frame * fps),               # dwMaxBytesPerSec
+        0,                                  # dwPaddingGranularity
+        0x10,                               # dwFlags (AVIF_HASINDEX)
+        frame_count,                        # dwTotalFrames
+        0,                                  # dwInitialFrames
+        1,                                  # dwStreams
+        max_frame,                          # dwSuggestedBufferSize
+        width, height,
+        0, 0, 0, 0                          # dwReserved
+    )
+    rate_scale = 1000
+    stream_header = struct.pack(
+        '<4s4sIHHIIIIIIIIhhhh',
+        b'vids', b'MJPG',
+        0, 0, 0, 0,                         # dwFlags, wPriority, wLanguage, dwInitialFrames
+        rate_scale, int(round(fps * rate_scale)),
+        0, frame_count,                     # dwStart, dwLength
+        max_frame, 0xFFFFFFFF, 0,           # dwSuggestedBufferSize, dwQuality, dwSampleSize
+        0, 0, width, height                 # rcFrame
+    )
+    stream_format = struct.pack(
+        '<IiiHH4sIiiII',
+        40, width, height, 1, 24, b'MJPG', width * height * 3, 0, 0, 0, 0
+    )
+    header_list = _list(b'hdrl', _chunk(b'avih', main_header) + _list(
+        b'strl', _chunk(b'strh', stream_header) + _chunk(b'strf', stream_format)
+    ))
+    
+    # idx1のオフセットは 'movi' の直前（LISTデータ先頭）からの相対位置
+    movi_parts = []
+    index_entries = []
+    offset = 4
+    for frame in jpeg_frames:
+        chunk = _chunk(b'00dc', frame)
+        index_entries.append(struct.pack('<4sIII', b'00dc', 0x10, offset, len(frame)))
+        movi_parts.append(chunk)
+        offset += len(chunk)
+    
+    movi_list = _list(b'movi', b''.join(movi_parts))
+    index = _chunk(b'idx1', b''.join(index_entries))
+    body = b'AVI ' + header_list + movi_list + index
+    
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', len(body)) + body)
+    os.replace(temporary_path, path)
+
+
+class JpegRingBuffer:
+    """エンコード済みフレームのリングバッファ（合計バイト数で上限）"""
+    
+    def __init__(self, max_bytes: int):
+        """
+        初期化
+        
+        Args:
+            max_bytes: 保持するJPEGの合計バイト数上限
+        """
+        self.max_bytes = max_bytes
+        self.frames = deque()
+        self.total_bytes = 0
+    
+    def append(self, timestamp: float, data: bytes):
+        """追加（上限を超える分は古い順に破棄）"""
+        self.frames.append((timestamp, data))
+        self.total_bytes += len(data)
+        while self.total_bytes > self.max_bytes and len(self.frames) > 1:
+            _, dropped = self.frames.popleft()
+            self.total_bytes -= len(dropped)
+    
+    def since(self, timestamp: float) -> List[Tuple[float, bytes]]:
+        """指定時刻以降のフレーム（参照のみコピー）"""
+        return [(frame_time, data) for frame_time, data in self.frames if frame_time >= timestamp]
+    
+    def clear(self):
+        """全件破棄"""
+        self.frames.clear()
+        self.total_bytes = 0
+
+
+class ClipRecorder:
+    """イベントクリップ録画（カメラ毎に1つ、フレーム投入は書き込みを待たない）"""
+    
+    def __init__(self, camera_id: str = 'camera', output_dir: Optional[str] = None,
+                 pre_roll: Optional[float] = None, post_roll: Optional[float] = None,
+                 buffer_bytes: Optional[int] = None, max_clip_bytes: Optional[int] = None,
+                 max_pending_clips: Optional[int] = None):
+        """
+        初期化
+        
+        Args:
+            camera_id: カメラ識別子（ファイル名に使用）
+            output_dir: クリップ保存ディレクトリ
+            pre_roll: イベント前の秒数
+            post_roll: イベント後の秒数（録画中の再イベントで延長）
+            buffer_bytes: プリロール用リングバッファの上限（バイト）
+            max_clip_bytes: 1クリップの上限（バイト、超過時は打ち切り）
+            max_pending_clips: 書き込み待ちクリップの上限（超過分は破棄）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.camera_id = camera_id
+        self.output_dir = output_dir or os.path.join(DATA_CONFIG['data_dir'], CLIP_CONFIG['clips_dir'])
+        self.pre_roll = CLIP_CONFIG['pre_roll'] if pre_roll is None else pre_roll
+        self.post_roll = CLIP_CONFIG['post_roll'] if post_roll is None else post_roll
+        self.max_clip_bytes = max_clip_bytes or CLIP_CONFIG['max_clip_bytes']
+        self.frame_width = CLIP_CONFIG['frame_width']
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, CLIP_CONFIG['jpeg_quality']]
+        
+        # エンコード待ちフレーム（生フレームの参照を保持するため件数を小さく制限）
+        self.encode_queue = queue.Queue(maxsize=CLIP_CONFIG['encode_queue'])
+        self.encoder_thread = None
+        
+        self.buffer = JpegRingBuffer(buffer_bytes or CLIP_CONFIG['buffer_bytes'])
+        self.active_clip = None
+        self._lock = threading.Lock()
+        self.frame_size = None
+        
+        # 急激なカウント変化の検出（直近平均との差）
+        self.count_baseline = deque(maxlen=CLIP_CONFIG['baseline_frames'])
+        
+        self.write_queue = queue.Queue(
+            maxsize=max_pending_clips or CLIP_CONFIG['max_pending_clips'])
+        self.writer_thread = None
+        self.is_running = False
+        
+        # 統計情報
+        self.stats = {
+            'frames': 0,
+            'frames_dropped': 0,
+            'events': 0,
+            'clips_written': 0,
+            'clips_dropped': 0,
+            'clips_truncated': 0
+        }
+    
+    @property
+    def memory_limit(self) -> int:
+        """最大メモリ使用量（リングバッファ + 録画中 + 書き込み待ちクリップ、エンコード待ちの生フレームは除く）"""
+        return self.buffer.max_bytes + self.max_clip_bytes * (1 + self.write_queue.maxsize)
+    
+    def start(self):
+        """書き込みスレッド開始"""
+        with self._lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+            self.writer_thread.start()
+    
+    def stop(self, timeout: float = 10.0):
+        """エンコード待ちを処理し、録画中のクリップを確定して書き込みスレッドを停止"""
+        self._stop_encoder(timeout)
+        with self._lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+            clip = self.active_clip
+            self.active_clip = None
+        if clip is not None:
+            self._enqueue(clip)
+        self.write_queue.put(None)
+        if self.writer_thread and self.writer_thread.is_alive():
+            self.writer_thread.join(timeout=timeout)
+    
+    def reset(self):
+        """バッファ破棄（カメラ切替時、録画中のクリップは先にstop()で確定）"""
+        with self._lock:
+            self.active_clip = None
+            self.buffer.clear()
+            self.count_baseline.clear()
+            self.frame_size = None
+    
+    def add_frame(self, frame: np.ndarray, timestamp: Optional[float] = None):
+        """
+        フレーム投入（縮小・JPEGエンコードはエンコードスレッドで実施、待ちが満杯なら破棄）
+        
+        Args:
+            frame: 入力フレーム（エンコード完了まで参照を保持するため、投入後に変更しないこと）
+            timestamp: 取得時刻（UNIX秒）
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        self._start_encoder()
+        try:
+            self.encode_queue.put_nowait((frame, timestamp))
+        except queue.Full:
+            self.stats['frames_dropped'] += 1
+    
+    def _start_encoder(self):
+        """エンコードスレッド開始（初回投入時）"""
+        if self.encoder_thread is not None:
+            return
+        with self._lock:
+            if self.encoder_thread is None:
+                self.encoder_thread = threading.Thread(target=self._encoder_loop, daemon=True)
+                self.encoder_thread.start()
+    
+    def _stop_encoder(self, timeout: float):
+        """エンコード待ちを処理してエンコードスレッドを停止（次回投入時に再開）"""
+        with self._lock:
+            thread = self.encoder_thread
+            self.encoder_thread = None
+        if thread is None:
+            return
+        self.encode_queue.put(None)
+        thread.join(timeout=timeout)
+    
+    def _encoder_loop(self):
+        """エンコードループ"""
+        while True:
+            item = self.encode_queue.get()
+            try:
+                if item is None:
+                    break
+                frame, timestamp = item
+                if self.frame_width and frame.shape[1] > self.frame_width:
+                    height = max(int(frame.shape[0] * self.frame_width / frame.shape[1]), 1)
+                    frame = cv2.resize(frame, (self.frame_width, height), interpolation=cv2.INTER_AREA)
+                ok, encoded = cv2.imencode('.jpg', frame, self.encode_params)
+                if ok:
+                    self.add_jpeg(encoded.tobytes(), frame.shape[1], frame.shape[0], timestamp)
+            except cv2.error as e:
+                self.logger.error(f"クリップフレームのエンコードエラー: {e}")
+            finally:
+                self.encode_queue.task_done()
+    
+    def add_jpeg(self, data: bytes, width: int, height: int, timestamp: Optional[float] = None):
+        """エンコード済みフレーム投入"""
+        timestamp = time.time() if timestamp is None else timestamp
+        finished = None
+        with self._lock:
+            if self.frame_size != (width, height):
+                # 解像度が変わった場合は混在させない
+                self.buffer.clear()
+                self.frame_size = (width, height)
+            self.buffer.append(timestamp, data)
+            self.stats['frames'] += 1
+            
+            clip = self.active_clip
+            if clip is not None:
+                if clip['size'] != (width, height) or timestamp > clip['end_time']:
+                    finished = clip
+                    self.active_clip = None
+                elif clip['bytes'] + len(data) > self.max_clip_bytes:
+                    clip['truncated'] = True
+                    finished = clip
+                    self.active_clip = None
+                else:
+                    clip['frames'].append((timestamp, data))
+                    clip['bytes'] += len(data)
+        if finished is not None:
+            self._enqueue(finished)
+    
+    def observe_counts(self, counts: Dict[str, int], timestamp: Optional[float] = None) -> bool:
+        """
+        カウント変化の監視（直近平均から閾値以上変化したらイベント発生）
+        
+        Args:
+            counts: クラス別カウント
+            timestamp: 時刻（UNIX秒）
+        
+        Returns:
+            bool: イベントを発生させたか
+        """
+        total = sum(counts.values())
+        baseline = self.count_baseline
+        triggered = False
+        if len(baseline) == baseline.maxlen:
+            average = sum(baseline) / len(baseline)
+            if abs(total - average) >= CLIP_CONFIG['count_change_threshold']:
+                self.trigger('count_change', {'total': total, 'baseline': round(average, 2)},
+                             timestamp)
+                triggered = True
+                baseline.clear()
+        baseline.append(total)
+        return triggered
+    
+    def trigger(self, reason: str, details: Optional[Dict] = None,
+                timestamp: Optional[float] = None):
+        """
+        イベント発生（録画中なら終了時刻を延長）
+        
+        Args:
+            reason: イベント種別（'alert', 'count_change' など）
+            details: クリップのメタデータに記録する情報
+            timestamp: 発生時刻（UNIX秒）
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        if not self.is_running:
+            self.start()
+        
+        event = {'reason': reason, 'time': datetime.fromtimestamp(timestamp).isoformat(),
+                 'details': details or {}}
+        with self._lock:
+            self.stats['events'] += 1
+            if self.active_clip is not None:
+                self.active_clip['end_time'] = max(self.active_clip['end_time'],
+                                                   timestamp + self.post_roll)
+                self.active_clip['events'].append(event)
+                return
+            
+            frames = self.buffer.since(timestamp - self.pre_roll)
+            self.active_clip = {
+                'camera_id': self.camera_id,
+                'start_time': timestamp - self.pre_roll,
+                'end_time': timestamp + self.post_roll,
+                'size': self.frame_size,
+                'frames': frames,
+                'bytes': sum(len(data) for _, data in frames),
+                'events': [event],
+                'truncated': False
+            }
+        self.logger.info(f"クリップ録画開始: {self.camera_id} ({reason})")
+    
+    def _enqueue(self, clip: Dict):
+        """書き込み待ちに追加（満杯の場合は破棄）"""
+        if clip['truncated']:
+            self.stats['clips_truncated'] += 1
+        try:
+            self.write_queue.put_nowait(clip)
+        except queue.Full:
+            self.stats['clips_dropped'] += 1
+            self.logger.warning(f"クリップ書き込み待ちが満杯のため破棄: {self.camera_id}")
+    
+    def _writer_loop(self):
+        """書き込みループ"""
+        while True:
+            clip = self.write_queue.get()
+            if clip is None:
+                break
+            try:
+                self._write_clip(clip)
+            except (OSError, struct.error) as e:
+                self.logger.error(f"クリップ書き込みエラー: {e}")
+    
+    def _write_clip(self, clip: Dict) -> Optional[str]:
+        """AVI + メタデータJSONの書き出し"""
+        frames = clip['frames']
+        if not frames or clip['size'] is None:
+            return None
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        camera = re.sub(r'[^0-9A-Za-z_-]+', '_', str(clip['camera_id'])).strip('_') or 'camera'
+        started = datetime.fromtimestamp(frames[0][0])
+        base = os.path.join(self.output_dir,
+                            f"{camera}_{started.strftime('%Y%m%d_%H%M%S')}_{clip['events'][0]['reason']}")
+        
+        duration = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / duration if duration > 0 and len(frames) > 1 else 1.0
+        width, height = clip['size']
+        write_mjpeg_avi(base + '.avi', [data for _, data in frames], fps, width, height)
+        
+        metadata = {
+            'camera_id': clip['camera_id'],
+            'start': started.isoformat(),
+            'end': datetime.fromtimestamp(frames[-1][0]).isoformat(),
+            'frames': len(frames),
+            'fps': round(fps, 2),
+            'bytes': clip['bytes'],
+            'truncated': clip['truncated'],
+            'events': clip['events']
+        }
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        
+        self.stats['clips_written'] += 1
+        self.logger.info(f"クリップ保存: {base}.avi ({len(frames)}フレーム, {duration:.1f}秒)")
+        return base + '.avi'
+    
+    def get_stats(self) -> Dict:
+        """統計情報取得"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['buffered_frames'] = len(self.buffer.frames)
+            stats['buffered_bytes'] = self.buffer.total_bytes
+            stats['recording'] = self.active_clip is not None
+        stats['pending_frames'] = self.encode_queue.qsize()
+        stats['pending_clips'] = self.write_queue.qsize()
+        stats['memory_limit'] = self.memory_limit
+        return stats
+
+
+def create_clip_recorder(camera_id: str = 'camera') -> Optional[ClipRecorder]:
+    """設定に応じて録画器生成（無効時はNone）"""
+    if not CLIP_CONFIG['enable_clips']:
+        return None
+    return ClipRecorder(camera_id)
+
+
+if __name__ == "__main__":
+    import tempfile
+    
+    # 15fpsの合成映像で、40秒目に台数が急変した場面を録画
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8), (31, 31), 0)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = ClipRecorder('cam0', output_dir=directory, pre_roll=5.0, post_roll=5.0,
+                                buffer_bytes=4 * 1024 ** 2)
+        start_time = time.time() - 60
+        add_ms = []
+        for i in range(60 * 15):
+            timestamp = start_time + i / 15
+            frame = background.copy()
+            cars = 2 if i < 40 * 15 else 9
+            for car in range(cars):
+                x = (i * 4 + car * 130) % 1200
+                cv2.rectangle(frame, (x, 300), (x + 80, 360), (20, 20, 20), -1)
+            begin = time.perf_counter()
+            recorder.add_frame(frame, timestamp)
+            recorder.observe_counts({'car': cars}, timestamp)
+            add_ms.append((time.perf_counter() - begin) * 1000)
+            # 実時間では次のフレームまでにエンコードが終わるため、デモでは完了を待って次を投入
+            recorder.encode_queue.join()
+        recorder.stop()
+        
+        stats = recorder.get_stats()
+        print(f"投入: {stats['frames']}フレーム (出力ステージの待ち 平均 {np.mean(add_ms):.2f} ms, "
+              f"最大 {max(add_ms):.2f} ms, 破棄 {stats['frames_dropped']})")
+        print(f"リングバッファ: {stats['buffered_frames']}フレーム / "
+              f"{stats['buffered_bytes'] / 1024 ** 2:.1f}MB (メモリ上限 {stats['memory_limit'] / 1024 ** 2:.0f}MB)")
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.endswith('.avi'):
+                capture = cv2.VideoCapture(path)
+                readable = 0
+                while capture.read()[0]:
+                    readable += 1
+                capture.release()
+                print(f"{name}: {os.path.getsize(path) / 1024:.0f}KB, OpenCVで読み込み {readable}フレーム")
+            else:
+                print(f"{name}: {json.load(open(path, encoding='utf-8'))['events'][0]}")
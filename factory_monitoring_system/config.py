@@ -9,6 +9,46 @@ YOLO_MODEL = 'yolo11n.pt'  # 使用するYOLOモデル
 CONFIDENCE_THRESHOLD = 0.5  # 検出信頼度閾値
 NMS_THRESHOLD = 0.45       # Non-Maximum Suppression閾値
 
+# バッチ推論設定
+INFERENCE_CONFIG = {
+    'enable_batching': True,   # 複数カメラのフレームをまとめて推論
+    'max_batch_size': 8,       # 最大バッチサイズ
+    'max_wait_ms': 10,         # バッチ収集の最大待機時間（ミリ秒）
+    'queue_size': 64,          # 推論要求キューの上限
+    'result_timeout': 30       # 推論結果待ちタイムアウト（秒）
+}
+
+# 関心領域（ROI）・タイル推論設定
+ROI_CONFIG = {
+    'enable_roi': True,         # カウントゾーンの外接矩形のみ推論（ゾーン未設定時は全体）
+    'roi_padding': 32,          # 外接矩形の余白（ピクセル）
+    'enable_tiling': False,     # 大きな領域をタイル分割して推論（小物体向け）
+    'tile_size': 640,           # タイル一辺（ピクセル）
+    'tile_overlap': 0.2,        # タイル重なり率
+    'merge_threshold': 0.6      # タイル間重複除去の閾値（小さい方の面積に対する重なり率）
+}
+
+# 動き検出による推論スキップ設定
+MOTION_CONFIG = {
+    'enable_motion_gate': True, # 動きがないフレームは推論せず前回結果を再利用
+    'downscale_width': 160,     # 差分計算用の縮小幅（ピクセル）
+    'pixel_threshold': 25,      # 画素変化とみなす輝度差（0-255）
+    'min_changed_ratio': 0.005, # 変化画素率がこれ以上で推論
+    'max_staleness': 10.0       # 動きがなくてもこの秒数経過で強制推論
+}
+
+# 物体追跡設定（ByteTrack方式）
+TRACKING_CONFIG = {
+    'enable_tracking': True,    # 追跡IDでユニーク物体をカウント
+    'high_threshold': 0.5,      # 1段目の対応付けに使う信頼度
+    'low_threshold': 0.1,       # 2段目（低信頼度検出）の下限
+    'new_track_threshold': 0.6, # 新規トラック生成に必要な信頼度
+    'match_iou': 0.3,           # 1段目の最小IoU
+    'low_match_iou': 0.5,       # 2段目の最小IoU
+    'min_hits': 2,              # トラック確定までの検出回数
+    'max_coast': 1.5            # 未検出のまま予測で維持する秒数
+}
+
 # カメラ設定
 CAMERA_CONFIG = {
     'rtsp_timeout': 30,        # RTSP接続タイムアウト（秒）
@@ -18,6 +58,24 @@ CAMERA_CONFIG = {
     'buffer_size': 1           # バッファサイズ
 }
 
+# ストリーム処理パイプライン設定
+PIPELINE_CONFIG = {
+    'capture_buffer_size': 1,  # キャプチャ→推論バッファ（最新フレームのみ保持）
+    'result_buffer_size': 2,   # 推論→描画・エンコードバッファ
+    'jpeg_quality': 80         # 配信用JPEG品質
+}
+
+# ダッシュボード配信設定（品質・解像度ティア）
+BROADCAST_CONFIG = {
+    'default_tier': 'medium',  # 接続直後のティア
+    'ack_timeout': 5.0,        # 受信確認待ちの上限（秒）
+    'tiers': {
+        'high': {'max_width': None, 'quality': 85},  # 原寸
+        'medium': {'max_width': 960, 'quality': 70},
+        'low': {'max_width': 480, 'quality': 50}     # タブレット・低速回線向け
+    }
+}
+
 # IPカメラURL例
 CAMERA_URLS = {
     'hikvision': 'rtsp://admin:password@{ip}:554/Streaming/Channels/101',
@@ -28,6 +86,33 @@ CAMERA_URLS = {
     'webcam': 0  # ローカルWebカメラ
 }
 
+# カメラURL探索設定（候補を時間差で並列に試行）
+PROBE_CONFIG = {
+    'timeout': 5.0,            # 1候補あたりのタイムアウト（秒）
+    'deadline': 12.0,          # 探索全体の期限（秒）
+    'stagger': 0.25,           # 候補を開始する時間差（秒）
+    'max_workers': 8,          # 同時に試行する候補数
+    'sniff_bytes': 2048        # Content-Typeで判別できない場合に確認する先頭バイト数
+}
+
+# 映像URLキャッシュ設定（再起動時は確認1回で再利用）
+STREAM_CACHE_CONFIG = {
+    'cache_file': 'stream_cache.json',  # キャッシュファイル名（data_dir内）
+    'ttl': 7 * 24 * 3600,               # 有効期限（秒）
+    'session_ttl': 3600,                # セッションIDを含む場合の有効期限（秒）
+    'validate_timeout': 3.0             # 再利用前の確認タイムアウト（秒）
+}
+
+# 複数カメラ監視設定（再接続はワーカースレッドで実施）
+SUPERVISOR_CONFIG = {
+    'max_workers': 8,          # 同時に接続試行するカメラ数
+    'backoff_initial': 1.0,    # 再接続待ちの初期値（秒、失敗毎に倍）
+    'backoff_max': 60.0,       # 再接続待ちの上限（秒）
+    'backoff_jitter': 0.5,     # 待ち時間の揺らぎ（0.5で50〜100%）
+    'check_interval': 0.5,     # 監視ループ間隔（秒）
+    'stall_timeout': 10.0      # この秒数フレームが進まなければ停止とみなす
+}
+
 # 監視設定
 MONITORING_CONFIG = {
     'detection_interval': 5,    # 検出間隔（秒）
@@ -37,6 +122,12 @@ MONITORING_CONFIG = {
     'log_level': 'INFO'        # ログレベル
 }
 
+# ローリング統計設定（統計・トレンドAPIを定数時間で応答）
+ROLLING_STATS_CONFIG = {
+    'window_hours': [1, 24, 168],  # 保持するウィンドウ（1時間・24時間・7日）
+    'buckets_per_window': 360      # ウィンドウ内の時間バケット数（失効の粒度）
+}
+
 # 在庫アラート設定
 INVENTORY_ALERTS = {
     'enable_alerts': True,      # アラート機能有効
@@ -49,6 +140,24 @@ INVENTORY_ALERTS = {
     'alert_cooldown': 300      # アラート間隔（秒）
 }
 
+# アラート配信設定（判定は平滑化カウント、送信は配信スレッド）
+ALERT_DISPATCH_CONFIG = {
+    'smoothing_alpha': 0.2,         # カウントのEMA係数
+    'min_duration': 10.0,           # 発動までの条件継続秒数
+    'clear_margin': 2,              # 解除はしきい値 + この値以上
+    'digest_window': 5.0,           # まとめ送信の待ち時間（秒）
+    'max_batch': 100,               # 1ダイジェストの最大件数
+    'max_queue': 1000,              # 配信待ちキュー上限
+    'max_pending_digests': 50,      # チャネル別の送信待ちダイジェスト上限
+    'max_retries': 5,               # 再試行回数
+    'retry_backoff': 2.0,           # 再試行間隔の初期値（秒、失敗毎に倍）
+    'max_backoff': 60.0,            # 再試行間隔の上限（秒）
+    'channels': {                   # チャネル別レート制限（rate: 件/秒, burst: 連続送信数）
+        'console': {'rate': 1.0, 'burst': 5},
+        'webhook': {'url': None, 'rate': 0.2, 'burst': 3, 'timeout': 5.0}
+    }
+}
+
 # データ保存設定
 DATA_CONFIG = {
     'data_dir': 'data',                    # データ保存ディレクトリ
@@ -56,7 +165,58 @@ DATA_CONFIG = {
     'images_dir': 'images',                # 画像保存ディレクトリ
     'save_detection_images': True,         # 検出結果画像保存
     'image_format': 'jpg',                 # 画像フォーマット
-    'compress_images': True                # 画像圧縮
+    'compress_images': True,               # 画像圧縮
+    'history_db': 'detection_history.db'   # 履歴DB（SQLite WAL、追記専用）
+}
+
+# 検出画像アーカイブ設定（重複除外・容量上限付き）
+IMAGE_ARCHIVE_CONFIG = {
+    'index_file': 'image_index.db',       # 索引DB（画像保存ディレクトリ内）
+    'max_bytes': 2 * 1024 ** 3,           # 画像・サムネイルの合計容量上限（バイト）
+    'max_age_days': 30,                   # 保存期間（日）
+    'thumbnail_width': 320,               # サムネイル幅
+    'jpeg_quality': 80,                   # JPEG品質（compress_images有効時）
+    'dhash_threshold': 6,                 # 類似画像とみなす差分ハッシュのビット差
+    'dhash_window': 60.0,                 # 類似判定の対象とする直近の秒数（カメラ毎）
+    'max_queue': 32                       # 書き込み待ちキュー上限（超過分は破棄）
+}
+
+# イベントクリップ録画設定（メモリ上限/カメラ = buffer_bytes + max_clip_bytes * (1 + max_pending_clips)）
+CLIP_CONFIG = {
+    'enable_clips': True,                 # クリップ録画有効
+    'clips_dir': 'clips',                 # 保存ディレクトリ（data_dir内）
+    'pre_roll': 10.0,                     # イベント前の秒数
+    'post_roll': 10.0,                    # イベント後の秒数
+    'buffer_bytes': 32 * 1024 ** 2,       # プリロール用リングバッファ上限（バイト/カメラ）
+    'max_clip_bytes': 64 * 1024 ** 2,     # 1クリップの上限（バイト）
+    'max_pending_clips': 2,               # 書き込み待ちクリップ上限
+    'frame_width': 960,                   # 録画時の縮小幅（0で縮小なし）
+    'jpeg_quality': 70,                   # 録画JPEG品質
+    'encode_queue': 4,                    # エンコード待ちフレーム上限（超過分は録画しない）
+    'count_change_threshold': 5,          # 直近平均からこの台数以上変化したらイベント
+    'baseline_frames': 10                 # 直近平均に使うフレーム数
+}
+
+# 履歴ストア設定（バックグラウンドでまとめてコミット）
+HISTORY_STORE_CONFIG = {
+    'batch_size': 500,         # 1回のコミットにまとめる最大件数
+    'flush_interval': 1.0,     # 最初の1件からコミットまでの最大秒数（クラッシュ時の損失上限）
+    'max_queue': 10000         # 書き込み待ちキュー上限（超過分は破棄）
+}
+
+# ロールアップ設定（長期間の統計・履歴を分/時/日単位の集計から応答）
+# 全体（スコープ ''）・ゾーン別とも ObjectCounter の追跡カウントから記録する
+# （追跡無効時は全体が新規検出数・ゾーン別がフレーム内の有効検出数となり比較不可）
+ROLLUP_CONFIG = {
+    'tiers': {'minute': 60, 'hour': 3600, 'day': 86400},  # 階層名: バケット幅（秒）
+    'retention_days': {                                   # 階層毎の保持期間（日）
+        'raw': 30,
+        'minute': 7,
+        'hour': 365,
+        'day': 3650
+    },
+    'min_buckets': 24,         # 期間内にこのバケット数以上となる最も粗い階層を使用
+    'prune_interval': 600      # 保持期間切れデータの削除間隔（秒）
 }
 
 # Web UI設定
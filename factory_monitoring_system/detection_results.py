@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 検出結果処理
+YOLO検出結果をNumPy構造化配列に変換し、フィルタ・集計をベクトル化
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# 検出結果の構造化配列（1行1検出）
+DETECTION_DTYPE = np.dtype([
+    ('x1', np.float32),
+    ('y1', np.float32),
+    ('x2', np.float32),
+    ('y2', np.float32),
+    ('conf', np.float32),
+    ('cls', np.int32)
+])
+
+
+class DetectionArray:
+    """検出結果配列（構造化配列 + クラス名辞書）"""
+    
+    def __init__(self, data: np.ndarray, names: Dict[int, str]):
+        """
+        初期化
+        
+        Args:
+            data: DETECTION_DTYPEの構造化配列
+            names: クラスID -> クラス名
+        """
+        self.data = data
+        self.names = names
+    
+    @classmethod
+    def empty(cls, names: Optional[Dict[int, str]] = None) -> 'DetectionArray':
+        """空の検出結果"""
+        return cls(np.empty(0, dtype=DETECTION_DTYPE), names or {})
+    
+    @classmethod
+    def from_arrays(cls, xyxy: np.ndarray, conf: np.ndarray, class_ids: np.ndarray,
+                    names: Dict[int, str]) -> 'DetectionArray':
+        """座標・信頼度・クラスID配列から生成"""
+        data = np.empty(len(conf), dtype=DETECTION_DTYPE)
+        if len(data):
+            xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+            data['x1'], data['y1'], data['x2'], data['y2'] = xyxy.T
+            data['conf'] = conf
+            data['cls'] = class_ids
+        return cls(data, names)
+    
+    @classmethod
+    def from_yolo_result(cls, result, names: Optional[Dict[int, str]] = None,
+                         conf_threshold: Optional[float] = None,
+                         classes: Optional[Iterable[int]] = None) -> 'DetectionArray':
+        """
+        ultralytics Resultsから生成（GPU→CPU転送は1回のみ）
+        
+        Args:
+            result: ultralytics Results
+            names: クラス名辞書（Noneの場合はresult.names）
+            conf_threshold: 信頼度閾値
+            classes: 対象クラスID
+        
+        Returns:
+            DetectionArray: 検出結果
+        """
+        names = names if names is not None else getattr(result, 'names', {})
+        boxes = getattr(result, 'boxes', None)
+        if boxes is None or len(boxes) == 0:
+            return cls.empty(names)
+        
+        # boxes.data: [x1, y1, x2, y2, (track_id), conf, cls]
+        raw = boxes.data.cpu().numpy()
+        detections = cls.from_arrays(raw[:, :4], raw[:, -2], raw[:, -1].astype(np.int32), names)
+        
+        if conf_threshold is not None or classes is not None:
+            detections = detections.filter(min_conf=conf_threshold, class_ids=classes)
+        return detections
+    
+    def __len__(self) -> int:
+        return len(self.data)
+    
+    def __getitem__(self, index) -> 'DetectionArray':
+        """マスク・インデックスによる部分取得"""
+        return DetectionArray(np.atleast_1d(self.data[index]), self.names)
+    
+    @property
+    def xyxy(self) -> np.ndarray:
+        """座標配列 (N, 4)"""
+        return np.stack([self.data['x1'], self.data['y1'], self.data['x2'], self.data['y2']], axis=1)
+    
+    @property
+    def conf(self) -> np.ndarray:
+        """信頼度配列"""
+        return self.data['conf']
+    
+    @property
+    def cls(self) -> np.ndarray:
+        """クラスID配列"""
+        return self.data['cls']
+    
+    @property
+    def centers(self) -> np.ndarray:
+        """中心座標配列 (N, 2)"""
+        return np.stack([
+            (self.data['x1'] + self.data['x2']) / 2,
+            (self.data['y1'] + self.data['y2']) / 2
+        ], axis=1)
+    
+    @property
+    def areas(self) -> np.ndarray:
+        """面積配列"""
+        return (self.data['x2'] - self.data['x1']) * (self.data['y2'] - self.data['y1'])
+    
+    @property
+    def class_names(self) -> List[str]:
+        """クラス名リスト"""
+        return [self.names.get(class_id, str(class_id)) for class_id in self.data['cls'].tolist()]
+    
+    def class_ids_for(self, class_names: Iterable[str]) -> np.ndarray:
+        """クラス名からクラスID配列を取得"""
+        wanted = set(class_names)
+        return np.array([class_id for class_id, name in self.names.items() if name in wanted],
+                        dtype=np.int32)
+    
+    def filter(self, min_conf: Optional[float] = None,
+               class_ids: Optional[Iterable[int]] = None,
+               class_names: Optional[Iterable[str]] = None,
+               min_area: Optional[float] = None,
+               max_area: Optional[float] = None) -> 'DetectionArray':
+        """
+        条件に一致する検出のみ抽出（ブールマスク）
+        
+        Args:
+            min_conf: 最小信頼度
+            class_ids: 対象クラスID
+            class_names: 対象クラス名
+            min_area: 最小面積
+            max_area: 最大面積
+        
+        Returns:
+            DetectionArray: 抽出結果
+        """
+        if len(self.data) == 0:
+            return self
+        
+        mask = np.ones(len(self.data), dtype=bool)
+        if min_conf is not None:
+            mask &= self.data['conf'] >= min_conf
+        if class_names is not None:
+            class_ids = self.class_ids_for(class_names)
+        if class_ids is not None:
+            mask &= np.isin(self.data['cls'], np.fromiter(class_ids, dtype=np.int32))
+        if min_area is not None or max_area is not None:
+            areas = self.areas
+            if min_area is not None:
+                mask &= areas >= min_area
+            if max_area is not None:
+                mask &= areas <= max_area
+        
+        if mask.all():
+            return self
+        return DetectionArray(self.data[mask], self.names)
+    
+    def class_counts(self) -> Dict[str, int]:
+        """クラス別カウント（np.bincount）"""
+        if len(self.data) == 0:
+            return {}
+        
+        bins = np.bincount(self.data['cls'])
+        return {
+            self.names.get(class_id, str(class_id)): int(bins[class_id])
+            for class_id in np.flatnonzero(bins).tolist()
+        }
+    
+    def to_dicts(self) -> List[Dict]:
+        """JSON応答用の辞書リスト"""
+        boxes = self.xyxy.astype(int).tolist()
+        return [
+            {'class': name, 'confidence': conf, 'bbox': box}
+            for name, conf, box in zip(self.class_names, self.data['conf'].tolist(), boxes)
+        ]
+    
+    def to_detected_objects(self, timestamp: Optional[datetime] = None) -> List:
+        """DetectedObjectリストに変換（従来APIとの互換用）"""
+        from object_counter import DetectedObject
+        
+        timestamp = timestamp or datetime.now()
+        boxes = self.xyxy.astype(int).tolist()
+        centers = self.centers.astype(int).tolist()
+        areas = self.areas.tolist()
+        return [
+            DetectedObject(
+                class_name=name,
+                confidence=conf,
+                bbox=tuple(box),
+                center=tuple(center),
+                area=area,
+                timestamp=timestamp
+            )
+            for name, conf, box, center, area in zip(
+                self.class_names, self.data['conf'].tolist(), boxes, centers, areas
+            )
+        ]
+
+
+def draw_detections(frame: np.ndarray, detections: DetectionArray,
+                    color_fn: Optional[Callable[[str], Tuple[int, int, int]]] = None,
+                    label_background: bool = True) -> np.ndarray:
+    """
+    検出結果をフレームに描画（入力フレームを直接更新）
+    
+    Args:
+        frame: 描画先フレーム
+        detections: 検出結果
+        color_fn: クラス名 -> 色（Noneの場合は緑）
+        label_background: ラベル背景を塗りつぶすか
+    
+    Returns:
+        np.ndarray: 描画済みフレーム
+    """
+    if len(detections) == 0:
+        return frame
+    
+    font_scale = 0.6 if label_background else 0.5
+    boxes = detections.xyxy.astype(int).tolist()
+    
+    for name, conf, (x1, y1, x2, y2) in zip(detections.class_names,
+                                            detections.conf.tolist(), boxes):
+        color = color_fn(name) if color_fn else (0, 255, 0)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        
+        label = f"{name}: {conf:.2f}"
+        if label_background:
+            label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 2)[0]
+            cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), (x1 + label_size[0], y1), color, -1)
+            cv2.putText(frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, (255, 255, 255), 2)
+        else:
+            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale, color, 2)
+    
+    return frame
+
+
+class FrameDetections:
+    """1フレーム分の検出結果（描画済みフレームは要求時に1回だけ生成）"""
+    
+    def __init__(self, frame: np.ndarray, detections: DetectionArray,
+                 color_fn: Optional[Callable[[str], Tuple[int, int, int]]] = None,
+                 overlay_fn: Optional[Callable[[np.ndarray, Dict[str, int]], None]] = None,
+                 label_background: bool = True, inferred: bool = True,
+                 min_conf: Optional[float] = None):
+        """
+        初期化
+        
+        Args:
+            frame: 入力フレーム（描画時もコピーして使用し、変更しない）
+            detections: 検出結果
+            color_fn: クラス名 -> 色
+            overlay_fn: 検出描画後に追加描画する関数 (frame, counts)
+            label_background: ラベル背景を塗りつぶすか
+            inferred: このフレームで推論したか（Falseは前回の検出結果の再利用）
+            min_conf: カウント・描画に使う最小信頼度（detections は追跡用に低信頼度検出も保持）
+        """
+        self.frame = frame
+        self.detections = detections
+        self.inferred = inferred
+        self.min_conf = min_conf
+        self._confident = None
+        self.color_fn = color_fn
+        self.overlay_fn = overlay_fn
+        self.label_background = label_background
+        self._counts = None
+        self._annotated = None
+        self._render_lock = threading.Lock()
+    
+    @property
+    def confident(self) -> DetectionArray:
+        """カウント・描画対象の検出（min_conf 以上）"""
+        if self._confident is None:
+            self._confident = (self.detections if self.min_conf is None
+                               else self.detections.filter(min_conf=self.min_conf))
+        return self._confident
+    
+    @property
+    def counts(self) -> Dict[str, int]:
+        """クラス別カウント"""
+        if self._counts is None:
+            self._counts = self.confident.class_counts()
+        return self._counts
+    
+    @property
+    def is_rendered(self) -> bool:
+        """描画済みフレームが生成済みか"""
+        return self._annotated is not None
+    
+    @property
+    def annotated(self) -> np.ndarray:
+        """描画済みフレーム（初回アクセス時にコピー・描画）"""
+        if self._annotated is None:
+            with self._render_lock:
+                if self._annotated is None:
+                    frame = draw_detections(self.frame.copy(), self.confident,
+                                            self.color_fn, self.label_background)
+                    if self.overlay_fn is not None:
+                        self.overlay_fn(frame, self.counts)
+                    self._annotated = frame
+        return self._annotated
+
+
+if __name__ == "__main__":
+    # ベンチマーク: ボックス毎のPythonループ vs ベクトル化処理（混雑フレーム想定）
+    rng = np.random.default_rng(0)
+    box_count = 300
+    names = {0: 'person', 1: 'car', 2: 'truck'}
+    xy = rng.uniform(0, 1800, (box_count, 2)).astype(np.float32)
+    xyxy = np.hstack([xy, xy + rng.uniform(10, 100, (box_count, 2)).astype(np.float32)])
+    conf = rng.uniform(0.2, 1.0, box_count).astype(np.float32)
+    class_ids = rng.integers(0, 3, box_count)
+    iterations = 200
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        counts = {}
+        detections = []
+        for box, score, class_id in zip(xyxy, conf, class_ids):
+            if score >= 0.5:
+                class_name = names[int(class_id)]
+                counts[class_name] = counts.get(class_name, 0) + 1
+                x1, y1, x2, y2 = box.astype(int)
+                detections.append({'class': class_name, 'confidence': float(score),
+                                   'bbox': [int(x1), int(y1), int(x2), int(y2)]})
+    loop_ms = (time.perf_counter() - start) * 1000 / iterations
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        array = DetectionArray.from_arrays(xyxy, conf, class_ids, names).filter(min_conf=0.5)
+        counts_vectorized = array.class_counts()
+        dicts = array.to_dicts()
+    vector_ms = (time.perf_counter() - start) * 1000 / iterations
+    
+    assert counts == counts_vectorized
+    print(f"ボックス数: {box_count}")
+    print(f"Pythonループ: {loop_ms:.3f} ms/フレーム")
+    print(f"ベクトル化: {vector_ms:.3f} ms/フレーム")
@@ -7,23 +7,29 @@ YOLO11を使用したリアルタイム物体検出・在庫管理システム
 
 import cv2
 import numpy as np
-import json
 import time
 import os
 import threading
-from datetime import datetime, timedelta
-from collections import defaultdict, deque
-from typing import Dict, List, Tuple, Optional
+from datetime import datetime
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple, Optional
 import logging
 
 from ultralytics import YOLO
 import torch
 
 from config import (
-    YOLO_MODEL, CONFIDENCE_THRESHOLD, NMS_THRESHOLD,
-    MONITORING_CONFIG, INVENTORY_ALERTS, DATA_CONFIG,
+    YOLO_MODEL, CONFIDENCE_THRESHOLD, NMS_THRESHOLD, INFERENCE_CONFIG, ROI_CONFIG,
+    MONITORING_CONFIG, INVENTORY_ALERTS, DATA_CONFIG, TRACKING_CONFIG,
     SYSTEM_CONFIG, PRODUCT_MASTER
 )
+from batch_inference import get_shared_engine
+from detection_results import DetectionArray, FrameDetections
+from roi_tiling import ROITiler
+from timeseries_store import CountRingBuffer
+from history_store import HistoryStore
+from image_archive import ImageArchive
+from alert_dispatcher import AlertDispatcher, AlertEvaluator, format_alert
 
 
 class FactoryMonitor:
@@ -36,19 +42,42 @@ class FactoryMonitor:
         
         # YOLO11モデル初期化
         self.model = None
+        self.inference_engine = None
+        # 追跡有効時は低信頼度検出も残す（追跡の2段目対応付け用、表示・カウントは CONFIDENCE_THRESHOLD）
+        self.detection_threshold = (TRACKING_CONFIG['low_threshold'] if TRACKING_CONFIG['enable_tracking']
+                                    else CONFIDENCE_THRESHOLD)
         self.device = self._setup_device()
         self.load_model()
         
         # 検出履歴
-        self.detection_history = deque(maxlen=MONITORING_CONFIG['max_history_records'])
+        self.detection_history = CountRingBuffer(MONITORING_CONFIG['max_history_records'])
         self.current_counts = defaultdict(int)
         self.last_detection_time = time.time()
+        self.last_detections = None
+        
+        # 関心領域（カウントゾーン外は推論しない）
+        self.roi_tiler = ROITiler() if ROI_CONFIG['enable_roi'] else None
         
         # データ保存設定
         self.setup_data_directories()
         
-        # アラート管理
-        self.last_alert_time = defaultdict(float)
+        # 履歴ストア（追記専用、書き込みはバックグラウンドスレッド）
+        self.history_store = HistoryStore(
+            os.path.join(DATA_CONFIG['data_dir'], DATA_CONFIG['history_db'])
+        )
+        self.history_store.migrate_json(
+            os.path.join(DATA_CONFIG['data_dir'], DATA_CONFIG['history_file'])
+        )
+        self.load_history()
+        
+        # 検出画像アーカイブ（重複除外・容量上限、書き込みはバックグラウンドスレッド）
+        self.image_archive = ImageArchive() if DATA_CONFIG['save_detection_images'] else None
+        
+        # アラート管理（判定は平滑化カウント、通知は配信スレッドでまとめて送信）
+        self.alert_evaluator = AlertEvaluator()
+        self.alert_dispatcher = AlertDispatcher()
+        # アラート発動時の通知先: fn(class_name, current_count, threshold)
+        self.alert_listeners: List[Callable] = []
         
         # 監視状態
         self.is_monitoring = False
@@ -81,8 +110,18 @@ class FactoryMonitor:
     def load_model(self):
         """YOLO11モデル読み込み"""
         try:
-            self.model = YOLO(YOLO_MODEL)
-            self.model.to(self.device)
+            if INFERENCE_CONFIG['enable_batching']:
+                # 同一プロセス内の全カメラでバッチ推論エンジンを共有
+                self.inference_engine = get_shared_engine(
+                    YOLO_MODEL,
+                    device=self.device,
+                    conf=self.detection_threshold,
+                    iou=NMS_THRESHOLD
+                )
+                self.model = self.inference_engine.model
+            else:
+                self.model = YOLO(YOLO_MODEL)
+                self.model.to(self.device)
             self.logger.info(f"YOLO11モデル '{YOLO_MODEL}' を読み込みました")
         except Exception as e:
             self.logger.error(f"モデル読み込みエラー: {e}")
@@ -94,12 +133,117 @@ class FactoryMonitor:
         os.makedirs(os.path.join(DATA_CONFIG['data_dir'], DATA_CONFIG['images_dir']), exist_ok=True)
         self.logger.info("データディレクトリを作成しました")
     
-    def detect_objects(self, frame: np.ndarray) -> Tuple[Dict[str, int], np.ndarray]:
+    def _run_inference(self, frame: np.ndarray, source_id=None) -> List:
+        """YOLO推論実行（バッチ推論エンジン有効時は共有バッチに投入）"""
+        if self.inference_engine is not None:
+            return [self.inference_engine.infer(frame, source_id)]
+        
+        return self.model(
+            frame,
+            conf=self.detection_threshold,
+            iou=NMS_THRESHOLD,
+            verbose=False
+        )
+    
+    def _infer_regions(self, crops: List[np.ndarray], source_id=None) -> List[DetectionArray]:
+        """ROI・タイル切り出し画像をまとめて推論"""
+        if self.inference_engine is not None:
+            results = self.inference_engine.infer_many(crops, source_id)
+        else:
+            results = self.model(
+                crops,
+                conf=self.detection_threshold,
+                iou=NMS_THRESHOLD,
+                verbose=False
+            )
+        return [
+            DetectionArray.from_yolo_result(result, self.model.names,
+                                            conf_threshold=self.detection_threshold)
+            for result in results
+        ]
+    
+    def set_roi_zones(self, zones: List):
+        """
+        推論対象のカウントゾーン設定
+        
+        Args:
+            zones: CountingZoneリスト（参照を保持するため、後からの追加・削除も反映）
+        """
+        if self.roi_tiler is None:
+            return
+        self.roi_tiler.set_zones(zones)
+    
+    def detect(self, frame: np.ndarray, source_id=None, roi_tiler=None) -> DetectionArray:
         """
-        物体検出実行
+        物体検出実行（描画なし）
         
         Args:
             frame: 入力画像フレーム
+            source_id: 要求元カメラの識別子（バッチ推論の統計用）
+            roi_tiler: カメラ別のROITiler（Noneの場合は set_roi_zones() の設定）
+        
+        Returns:
+            DetectionArray: detection_threshold 以上の検出結果（追跡有効時は低信頼度検出を含む）
+        """
+        if self.model is None:
+            return DetectionArray.empty()
+        
+        roi_tiler = self.roi_tiler if roi_tiler is None else roi_tiler
+        if roi_tiler is not None and roi_tiler.is_active:
+            # ゾーン外接矩形・タイル単位で推論してフレーム座標に統合
+            detections = roi_tiler.detect(
+                frame, lambda crops: self._infer_regions(crops, source_id)
+            )
+            self.last_detections = detections
+            return detections
+        
+        results = self._run_inference(frame, source_id)
+        if not results:
+            return DetectionArray.empty(self.model.names)
+        
+        detections = DetectionArray.from_yolo_result(
+            results[0], self.model.names, conf_threshold=self.detection_threshold
+        )
+        self.last_detections = detections
+        return detections
+    
+    def detect_frame(self, frame: np.ndarray, source_id=None,
+                     overlay_fn=None, motion_gate=None, roi_tiler=None) -> FrameDetections:
+        """
+        物体検出実行（描画は結果の annotated 参照時まで遅延）
+        
+        Args:
+            frame: 入力画像フレーム
+            source_id: 要求元カメラの識別子（バッチ推論の統計用）
+            overlay_fn: 描画時に追加描画する関数 (frame, counts)
+            motion_gate: MotionGate（動きがなければ前回の検出結果を再利用）
+            roi_tiler: カメラ別のROITiler（Noneの場合は set_roi_zones() の設定）
+        
+        Returns:
+            FrameDetections: 検出結果（カウント・遅延描画フレーム、再利用時は inferred=False）
+        """
+        if motion_gate is not None and not motion_gate.should_infer(frame):
+            return FrameDetections(frame, motion_gate.last_result, self._get_class_color, overlay_fn,
+                                   inferred=False, min_conf=CONFIDENCE_THRESHOLD)
+        
+        try:
+            detections = self.detect(frame, source_id, roi_tiler)
+        except Exception as e:
+            self.logger.error(f"物体検出エラー: {e}")
+            detections = DetectionArray.empty()
+        
+        if motion_gate is not None:
+            motion_gate.store(detections)
+        return FrameDetections(frame, detections, self._get_class_color, overlay_fn,
+                               min_conf=CONFIDENCE_THRESHOLD)
+    
+    def detect_objects(self, frame: np.ndarray, source_id=None) -> Tuple[Dict[str, int], np.ndarray]:
+        """
+        物体検出実行（描画済みフレームも必要な場合）
+        
+        Args:
+            frame: 入力画像フレーム
+            source_id: 要求元カメラの識別子（バッチ推論の統計用）
             
         Returns:
             Tuple[Dict[str, int], np.ndarray]: (検出カウント, 描画済みフレーム)
@@ -108,64 +252,8 @@ class FactoryMonitor:
             return {}, frame
         
         try:
-            # YOLO11で検出実行
-            results = self.model(
-                frame,
-                conf=CONFIDENCE_THRESHOLD,
-                iou=NMS_THRESHOLD,
-                verbose=False
-            )
-            
-            # 検出結果処理
-            counts = defaultdict(int)
-            annotated_frame = frame.copy()
-            
-            if results and len(results) > 0:
-                result = results[0]
-                
-                if result.boxes is not None and len(result.boxes) > 0:
-                    # バウンディングボックス取得
-                    boxes = result.boxes.xyxy.cpu().numpy()
-                    confidences = result.boxes.conf.cpu().numpy()
-                    class_ids = result.boxes.cls.cpu().numpy().astype(int)
-                    
-                    # 検出結果描画・カウント
-                    for i, (box, conf, class_id) in enumerate(zip(boxes, confidences, class_ids)):
-                        if conf >= CONFIDENCE_THRESHOLD:
-                            # クラス名取得
-                            class_name = self.model.names[class_id]
-                            counts[class_name] += 1
-                            
-                            # バウンディングボックス描画
-                            x1, y1, x2, y2 = box.astype(int)
-                            
-                            # 色設定（クラスごと）
-                            color = self._get_class_color(class_name)
-                            
-                            # ボックス描画
-                            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 2)
-                            
-                            # ラベル描画
-                            label = f"{class_name}: {conf:.2f}"
-                            label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
-                            cv2.rectangle(
-                                annotated_frame,
-                                (x1, y1 - label_size[1] - 10),
-                                (x1 + label_size[0], y1),
-                                color,
-                                -1
-                            )
-                            cv2.putText(
-                                annotated_frame,
-                                label,
-                                (x1, y1 - 5),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                0.6,
-                                (255, 255, 255),
-                                2
-                            )
-            
-            return dict(counts), annotated_frame
+            result = self.detect_frame(frame, source_id)
+            return result.counts, result.annotated
             
         except Exception as e:
             self.logger.error(f"物体検出エラー: {e}")
@@ -200,19 +288,13 @@ class FactoryMonitor:
                 self.logger.error(f"画像読み込み失敗: {image_path}")
                 return {}
             
-            # 物体検出
-            counts, annotated_frame = self.detect_objects(frame)
+            # 物体検出（描画は画像保存時のみ）
+            result = self.detect_frame(frame)
+            counts = result.counts
             
-            # 結果保存（オプション）
-            if DATA_CONFIG['save_detection_images']:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                output_path = os.path.join(
-                    DATA_CONFIG['data_dir'],
-                    DATA_CONFIG['images_dir'],
-                    f"detection_{timestamp}.{DATA_CONFIG['image_format']}"
-                )
-                cv2.imwrite(output_path, annotated_frame)
-                self.logger.info(f"検出結果画像保存: {output_path}")
+            # 結果保存（オプション、エンコード・書き込みはアーカイブのスレッドで実行）
+            if self.image_archive is not None:
+                self.image_archive.submit(result.annotated, counts, camera_id='file')
             
             # 履歴記録
             self.record_detection(counts)
@@ -223,18 +305,18 @@ class FactoryMonitor:
             self.logger.error(f"画像処理エラー: {e}")
             return {}
     
-    def record_detection(self, counts: Dict[str, int]):
-        """検出結果記録"""
-        timestamp = datetime.now()
-        
-        detection_record = {
-            'timestamp': timestamp.isoformat(),
-            'counts': counts,
-            'total_objects': sum(counts.values())
-        }
+    def record_detection(self, counts: Dict[str, int],
+                         zone_counts: Optional[Dict[str, Dict[str, int]]] = None):
+        """
+        検出結果記録
         
-        # 履歴追加
-        self.detection_history.append(detection_record)
+        Args:
+            counts: クラス別カウント
+            zone_counts: ゾーン別・クラス別カウント（ロールアップのゾーン集計用、
+                         counts と同じ追跡結果から求めたもの）
+        """
+        # 履歴追加（エポックミリ秒 + クラス別カウント列）
+        self.detection_history.append(counts)
         
         # 現在のカウント更新
         self.current_counts.update(counts)
@@ -243,76 +325,58 @@ class FactoryMonitor:
         # アラートチェック
         self.check_alerts(counts)
         
-        # 定期保存
-        if len(self.detection_history) % MONITORING_CONFIG['save_interval'] == 0:
-            self.save_history()
+        # 永続化（キュー投入のみ、コミット・ロールアップ更新は書き込みスレッドがまとめて行う）
+        self.history_store.append(counts, zone_counts=zone_counts)
     
     def check_alerts(self, counts: Dict[str, int]):
-        """アラートチェック"""
+        """アラートチェック（平滑化カウントがしきい値以下の状態が続いたら発動）"""
         if not INVENTORY_ALERTS['enable_alerts']:
             return
         
-        current_time = time.time()
-        
-        for class_name, count in counts.items():
-            if class_name in INVENTORY_ALERTS['alert_thresholds']:
-                threshold = INVENTORY_ALERTS['alert_thresholds'][class_name]
-                
-                # しきい値以下でアラート
-                if count <= threshold:
-                    # クールダウンチェック
-                    if (current_time - self.last_alert_time[class_name] > 
-                        INVENTORY_ALERTS['alert_cooldown']):
-                        
-                        self.trigger_alert(class_name, count, threshold)
-                        self.last_alert_time[class_name] = current_time
+        for alert in self.alert_evaluator.update(counts):
+            self.trigger_alert(alert)
     
-    def trigger_alert(self, class_name: str, current_count: int, threshold: int):
-        """アラート発動"""
-        message = f"在庫アラート: {class_name} = {current_count}個 (しきい値: {threshold}個)"
-        self.logger.warning(message)
+    def trigger_alert(self, alert: Dict):
+        """アラート発動（通知は配信キューに投入するのみ）"""
+        self.logger.warning(format_alert(alert))
         
-        # ここでメール送信、Slack通知などを実装可能
-        print(f"🚨 {message}")
+        # コンソール・Webhookへの送信は配信スレッドで実施
+        self.alert_dispatcher.submit(alert)
+        
+        if alert['type'] != 'triggered':
+            return
+        # 通知中のカメラ追加・切断による登録解除に影響されないようコピーを走査
+        for listener in list(self.alert_listeners):
+            try:
+                listener(alert['class_name'], alert['count'], alert['threshold'])
+            except Exception as e:
+                self.logger.error(f"アラート通知エラー: {e}")
     
     def save_history(self):
-        """履歴保存"""
-        try:
-            history_file = os.path.join(DATA_CONFIG['data_dir'], DATA_CONFIG['history_file'])
-            
-            # 履歴データをJSON形式で保存
-            history_data = {
-                'last_updated': datetime.now().isoformat(),
-                'records': list(self.detection_history)
-            }
-            
-            with open(history_file, 'w', encoding='utf-8') as f:
-                json.dump(history_data, f, ensure_ascii=False, indent=2)
-            
-            self.logger.info(f"履歴保存完了: {len(self.detection_history)}件")
-            
-        except Exception as e:
-            self.logger.error(f"履歴保存エラー: {e}")
+        """履歴保存（書き込み待ちの記録をコミットするまで待機）"""
+        if self.history_store.flush():
+            self.logger.info(f"履歴保存完了: {self.history_store.get_stats()['written']}件")
+        else:
+            self.logger.error("履歴保存エラー: 書き込み待ちがタイムアウトしました")
     
     def load_history(self):
-        """履歴読み込み"""
+        """履歴読み込み（履歴ストアの直近記録をメモリ上の履歴に復元）"""
         try:
-            history_file = os.path.join(DATA_CONFIG['data_dir'], DATA_CONFIG['history_file'])
+            records = self.history_store.query(limit=MONITORING_CONFIG['max_history_records'])
+            self.detection_history.load_records(records)
             
-            if os.path.exists(history_file):
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    history_data = json.load(f)
-                
-                # 履歴復元
-                self.detection_history.clear()
-                for record in history_data.get('records', []):
-                    self.detection_history.append(record)
-                
-                self.logger.info(f"履歴読み込み完了: {len(self.detection_history)}件")
+            self.logger.info(f"履歴読み込み完了: {len(self.detection_history)}件")
             
         except Exception as e:
             self.logger.error(f"履歴読み込みエラー: {e}")
     
+    def close(self):
+        """終了処理（書き込み待ちの履歴・画像・アラートを処理）"""
+        self.alert_dispatcher.stop()
+        self.history_store.stop()
+        if self.image_archive is not None:
+            self.image_archive.stop()
+    
     def get_current_status(self) -> Dict:
         """現在の状態取得"""
         return {
@@ -321,45 +385,32 @@ class FactoryMonitor:
             'current_counts': dict(self.current_counts),
             'total_objects': sum(self.current_counts.values()),
             'last_detection_time': self.last_detection_time,
-            'history_count': len(self.detection_history)
+            'history_count': len(self.detection_history),
+            'active_alerts': self.alert_evaluator.active_alerts(),
+            'alert_stats': self.alert_dispatcher.get_stats()
         }
     
     def get_statistics(self, hours: int = 24) -> Dict:
-        """統計情報取得"""
-        cutoff_time = datetime.now() - timedelta(hours=hours)
-        
-        # 指定時間内の記録を抽出
-        recent_records = [
-            record for record in self.detection_history
-            if datetime.fromisoformat(record['timestamp']) > cutoff_time
-        ]
+        """統計情報取得（履歴ストアのロールアップから、期間に応じた階層で集計）"""
+        summary = self.history_store.get_statistics(since=time.time() - hours * 3600)
         
-        if not recent_records:
+        if summary['records'] == 0:
             return {}
         
-        # 統計計算
-        stats = {
+        classes = summary['classes']
+        return {
             'period_hours': hours,
-            'total_records': len(recent_records),
-            'average_counts': {},
-            'max_counts': {},
-            'min_counts': {},
-            'detection_rate': len(recent_records) / hours if hours > 0 else 0
+            'resolution': summary['resolution'],
+            'total_records': summary['records'],
+            'average_counts': {name: values['average'] for name, values in classes.items()},
+            'max_counts': {name: values['max'] for name, values in classes.items()},
+            'min_counts': {name: values['min'] for name, values in classes.items()},
+            'zone_stats': {
+                zone: {name: values['average'] for name, values in zone_summary['classes'].items()}
+                for zone, zone_summary in summary['zones'].items()
+            },
+            'detection_rate': summary['records'] / hours if hours > 0 else 0
         }
-        
-        # クラス別統計
-        all_classes = set()
-        for record in recent_records:
-            all_classes.update(record['counts'].keys())
-        
-        for class_name in all_classes:
-            counts = [record['counts'].get(class_name, 0) for record in recent_records]
-            stats['average_counts'][class_name] = sum(counts) / len(counts)
-            stats['max_counts'][class_name] = max(counts)
-            stats['min_counts'][class_name] = min(counts)
-        
-        return stats
-
 
 if __name__ == "__main__":
     # テスト実行
@@ -376,4 +427,6 @@ if __name__ == "__main__":
         print("検出結果:", result)
     else:
         print(f"\nテスト画像 '{test_image}' が見つかりません")
-        print("Webカメラでテストする場合は camera_connection.py を使用してください") 
\ No newline at end of file
+        print("Webカメラでテストする場合は camera_connection.py を使用してください")
+    
+    monitor.close()
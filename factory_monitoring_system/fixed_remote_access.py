@@ -6,6 +6,9 @@ from flask import Flask, render_template_string, Response, jsonify
 import threading
 import time
 from datetime import datetime
+from frame_transport import FrameChannel, MJPEG_MIMETYPE
+from stream_prober import StreamProber
+from stream_cache import StreamCache
 
 class FixedRemoteAccess:
     def __init__(self):
@@ -13,6 +16,10 @@ class FixedRemoteAccess:
         self.camera = None
         self.is_streaming = False
         
+        # 1キャプチャ・1エンコードを全視聴者で共有
+        self.frame_channel = FrameChannel()
+        self.capture_thread = None
+        
         # 修正されたカメラURL候補（ポート80に修正）
         self.camera_candidates = [
             # D-Linkポートフォワーディング経由（修正版）
@@ -27,6 +34,10 @@ class FixedRemoteAccess:
         ]
         
         self.working_url = None
+        
+        # 前回動作したURL（再起動時は確認1回で再利用）
+        self.stream_cache = StreamCache()
+        self.cache_key = "fixed_remote_access"
         self.setup_routes()
     
     def test_connection(self, url):
@@ -51,17 +62,38 @@ class FixedRemoteAccess:
         print("- 認証: admin/admin")
         print()
         
-        for url in self.camera_candidates:
-            if self.test_connection(url):
-                self.working_url = url
-                return url
-        return None
+        cached = self.stream_cache.get_validated(self.cache_key)
+        if cached is not None:
+            print(f"✅ 前回のURLを再利用: {cached['url']}")
+            self.working_url = cached['url']
+            return self.working_url
+        
+        # 全候補を時間差で並列に試行（最初に映像を返したURLを採用）
+        working, results = StreamProber().probe_first(self.camera_candidates)
+        for result in results:
+            if result['success']:
+                print(f"✅ 成功: {result['url']}")
+            else:
+                print(f"❌ 失敗: {result['url']} - {result['error']}")
+        
+        if working is None:
+            return None
+        self.working_url = working['url']
+        self.stream_cache.put(self.cache_key, working['url'],
+                              auth_mode='url' if '@' in working['url'] else 'none',
+                              content_type=working['content_type'])
+        return self.working_url
     
-    def generate_frames(self):
-        """フレーム生成"""
-        if not self.working_url:
+    def start_capture(self):
+        """キャプチャスレッド開始（既に動作中なら共有）"""
+        if self.capture_thread and self.capture_thread.is_alive():
             return
-            
+        
+        self.capture_thread = threading.Thread(target=self.capture_loop, daemon=True)
+        self.capture_thread.start()
+    
+    def capture_loop(self):
+        """カメラから1本の接続でフレームを取得してチャネルへ配信"""
         self.camera = cv2.VideoCapture(self.working_url)
         
         while self.is_streaming:
@@ -69,14 +101,19 @@ class FixedRemoteAccess:
             if not success:
                 print("フレーム読み取り失敗")
                 break
-            else:
-                ret, buffer = cv2.imencode('.jpg', frame)
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            self.frame_channel.publish(frame)
         
+        self.is_streaming = False
         if self.camera:
             self.camera.release()
+            self.camera = None
+    
+    def generate_frames(self):
+        """フレーム生成（視聴者毎・キャプチャとエンコードは共有）"""
+        if not self.working_url:
+            return iter(())
+        
+        return self.frame_channel.iter_multipart(lambda: self.is_streaming)
     
     def setup_routes(self):
         @self.app.route('/')
@@ -135,7 +172,7 @@ class FixedRemoteAccess:
                     <div id="status" class="status"></div>
                     
                     <div style="text-align: center; margin: 20px 0;">
-                        <img id="video" src="/video_feed" style="display: none;">
+                        <img id="video" style="display: none;">
                     </div>
                     
                     <div id="log" class="log"></div>
@@ -182,6 +219,7 @@ class FixedRemoteAccess:
                         .then(data => {
                             if (data.success) {
                                 updateStatus('✅ 配信開始', 'success');
+                                document.getElementById('video').src = '/video_feed';
                                 document.getElementById('video').style.display = 'block';
                                 addLog('配信開始');
                             } else {
@@ -196,6 +234,7 @@ class FixedRemoteAccess:
                         .then(response => response.json())
                         .then(data => {
                             updateStatus('⏹️ 配信停止', 'info');
+                            document.getElementById('video').removeAttribute('src');
                             document.getElementById('video').style.display = 'none';
                             addLog('配信停止');
                         });
@@ -224,6 +263,7 @@ class FixedRemoteAccess:
         def start_stream():
             if self.working_url:
                 self.is_streaming = True
+                self.start_capture()
                 return jsonify({'success': True})
             else:
                 return jsonify({'success': False, 'message': '有効なカメラURLなし'})
@@ -231,14 +271,12 @@ class FixedRemoteAccess:
         @self.app.route('/stop_stream', methods=['POST'])
         def stop_stream():
             self.is_streaming = False
-            if self.camera:
-                self.camera.release()
+            self.frame_channel.clear()
             return jsonify({'success': True})
         
         @self.app.route('/video_feed')
         def video_feed():
-            return Response(self.generate_frames(),
-                          mimetype='multipart/x-mixed-replace; boundary=frame')
+            return Response(self.generate_frames(), mimetype=MJPEG_MIMETYPE)
     
     def run(self, port=5020):
         print(f"🚀 修正版リモートアクセス起動: http://localhost:{port}")
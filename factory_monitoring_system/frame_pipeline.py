@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - ストリーム処理パイプライン
+キャプチャ / 推論 / 描画・エンコードを別スレッドに分離した段階処理
+"""
+
+import time
+import threading
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from config import PIPELINE_CONFIG
+
+
+class LatestFrameBuffer:
+    """最新フレーム保持バッファ（満杯時は最も古い要素を破棄）"""
+    
+    def __init__(self, capacity: int = 1):
+        """
+        初期化
+        
+        Args:
+            capacity: 保持する最大要素数
+        """
+        self.buffer = deque(maxlen=max(1, capacity))
+        self.condition = threading.Condition()
+        self.dropped = 0
+    
+    def put(self, item: Any) -> bool:
+        """
+        要素追加
+        
+        Returns:
+            bool: 古い要素を破棄した場合True
+        """
+        with self.condition:
+            dropped = len(self.buffer) == self.buffer.maxlen
+            if dropped:
+                self.dropped += 1
+            self.buffer.append(item)
+            self.condition.notify()
+            return dropped
+    
+    def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """最も古い要素を取り出し（タイムアウト時はNone）"""
+        with self.condition:
+            if not self.buffer:
+                self.condition.wait(timeout)
+            if not self.buffer:
+                return None
+            return self.buffer.popleft()
+    
+    def clear(self):
+        """バッファクリア"""
+        with self.condition:
+            self.buffer.clear()
+    
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+
+class StageStats:
+    """ステージ別レイテンシ計測"""
+    
+    def __init__(self):
+        """初期化"""
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+        self.max_time = 0.0
+    
+    def record(self, elapsed: float):
+        """処理時間記録（秒）"""
+        with self.lock:
+            self.count += 1
+            self.total_time += elapsed
+            self.last_time = elapsed
+            self.max_time = max(self.max_time, elapsed)
+    
+    def snapshot(self) -> Dict:
+        """統計スナップショット（ミリ秒）"""
+        with self.lock:
+            return {
+                'count': self.count,
+                'last_ms': self.last_time * 1000,
+                'average_ms': self.total_time * 1000 / self.count if self.count else 0,
+                'max_ms': self.max_time * 1000
+            }
+
+
+class StreamPipeline:
+    """キャプチャ・推論・出力の3段パイプライン"""
+    
+    STAGES = ('capture', 'inference', 'output', 'end_to_end')
+    
+    def __init__(self,
+                 capture_fn: Callable[[], Optional[np.ndarray]],
+                 inference_fn: Callable[[np.ndarray], Any],
+                 output_fn: Callable[[np.ndarray, Any], None],
+                 failure_fn: Optional[Callable[[], bool]] = None,
+                 max_fps: Optional[float] = None,
+                 name: str = "pipeline"):
+        """
+        初期化
+        
+        Args:
+            capture_fn: フレーム取得関数（失敗時はNone）
+            inference_fn: 推論関数（フレーム -> 推論結果）
+            output_fn: 描画・エンコード関数（フレーム, 推論結果）
+            failure_fn: キャプチャ失敗時の処理（Falseで停止）
+            max_fps: キャプチャ上限FPS
+            name: スレッド名の接頭辞
+        """
+        self.logger = logging.getLogger(__name__)
+        self.capture_fn = capture_fn
+        self.inference_fn = inference_fn
+        self.output_fn = output_fn
+        self.failure_fn = failure_fn
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.name = name
+        
+        # ステージ間バッファ（上限付き・古いものから破棄）
+        self.capture_buffer = LatestFrameBuffer(PIPELINE_CONFIG['capture_buffer_size'])
+        self.result_buffer = LatestFrameBuffer(PIPELINE_CONFIG['result_buffer_size'])
+        
+        # ステージ別統計
+        self.stats = {stage: StageStats() for stage in self.STAGES}
+        
+        # スレッド管理
+        self.threads = []
+        self.stop_event = threading.Event()
+    
+    @property
+    def is_running(self) -> bool:
+        """パイプライン稼働中か"""
+        return any(thread.is_alive() for thread in self.threads)
+    
+    def start(self):
+        """パイプライン開始"""
+        if self.is_running:
+            return
+        
+        self.stop_event.clear()
+        self.capture_buffer.clear()
+        self.result_buffer.clear()
+        
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name=f"{self.name}-capture", daemon=True),
+            threading.Thread(target=self._inference_loop, name=f"{self.name}-inference", daemon=True),
+            threading.Thread(target=self._output_loop, name=f"{self.name}-output", daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+        
+        self.logger.info(f"ストリームパイプライン開始: {self.name}")
+    
+    def stop(self, timeout: float = 5.0):
+        """パイプライン停止"""
+        self.stop_event.set()
+        
+        current = threading.current_thread()
+        for thread in self.threads:
+            if thread is not current and thread.is_alive():
+                thread.join(timeout=timeout)
+        
+        self.logger.info(f"ストリームパイプライン停止: {self.name}")
+    
+    def _capture_loop(self):
+        """キャプチャステージ（常に最新フレームのみ保持）"""
+        while not self.stop_event.is_set():
+            start_time = time.perf_counter()
+            
+            try:
+                frame = self.capture_fn()
+            except Exception as e:
+                self.logger.error(f"キャプチャエラー: {e}")
+                frame = None
+            
+            if frame is None:
+                if self.failure_fn is None or not self.failure_fn():
+                    break
+                continue
+            
+            elapsed = time.perf_counter() - start_time
+            self.stats['capture'].record(elapsed)
+            self.capture_buffer.put((time.perf_counter(), frame))
+            
+            # キャプチャ上限FPS制御（ライブカメラではread自体が待機する）
+            if self.min_interval > elapsed:
+                self.stop_event.wait(self.min_interval - elapsed)
+        
+        self.stop_event.set()
+    
+    def _inference_loop(self):
+        """推論ステージ"""
+        while not self.stop_event.is_set():
+            item = self.capture_buffer.get(timeout=0.1)
+            if item is None:
+                continue
+            
+            captured_at, frame = item
+            start_time = time.perf_counter()
+            
+            try:
+                result = self.inference_fn(frame)
+            except Exception as e:
+                self.logger.error(f"推論エラー: {e}")
+                continue
+            
+            self.stats['inference'].record(time.perf_counter() - start_time)
+            self.result_buffer.put((captured_at, frame, result))
+    
+    def _output_loop(self):
+        """描画・エンコードステージ"""
+        while not self.stop_event.is_set():
+            item = self.result_buffer.get(timeout=0.1)
+            if item is None:
+                continue
+            
+            captured_at, frame, result = item
+            start_time = time.perf_counter()
+            
+            try:
+                self.output_fn(frame, result)
+            except Exception as e:
+                self.logger.error(f"出力処理エラー: {e}")
+                continue
+            
+            finished_at = time.perf_counter()
+            self.stats['output'].record(finished_at - start_time)
+            self.stats['end_to_end'].record(finished_at - captured_at)
+    
+    def get_stats(self) -> Dict:
+        """パイプライン統計取得"""
+        stats = {stage: self.stats[stage].snapshot() for stage in self.STAGES}
+        stats['dropped_frames'] = {
+            'capture': self.capture_buffer.dropped,
+            'result': self.result_buffer.dropped
+        }
+        stats['queue_lengths'] = {
+            'capture': len(self.capture_buffer),
+            'result': len(self.result_buffer)
+        }
+        return stats
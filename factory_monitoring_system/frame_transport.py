@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - フレーム配信チャネル
+1フレーム1回のJPEGエンコードを全クライアントで共有するバイナリ配信
+"""
+
+import time
+import base64
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import cv2
+import numpy as np
+
+from config import PIPELINE_CONFIG, BROADCAST_CONFIG
+
+# multipart/x-mixed-replace 配信設定
+MJPEG_BOUNDARY = 'frame'
+MJPEG_MIMETYPE = f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}'
+
+
+def encode_jpeg(frame: np.ndarray, quality: Optional[int] = None) -> Optional[bytes]:
+    """
+    フレームをJPEGバイト列にエンコード
+    
+    Args:
+        frame: 入力画像フレーム
+        quality: JPEG品質（Noneの場合は設定値）
+    
+    Returns:
+        Optional[bytes]: JPEGデータ（失敗時はNone）
+    """
+    if quality is None:
+        quality = PIPELINE_CONFIG['jpeg_quality']
+    
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        return None
+    return buffer.tobytes()
+
+
+def mjpeg_part(jpeg: bytes) -> bytes:
+    """JPEGデータをmultipartパートに変換"""
+    return (b'--' + MJPEG_BOUNDARY.encode() + b'\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+
+
+class EncodedFrame:
+    """エンコード済みフレーム（JPEGバイト列 + メタデータ）"""
+    
+    __slots__ = ('seq', 'jpeg', 'timestamp', 'width', 'height', '_base64')
+    
+    def __init__(self, seq: int, jpeg: bytes, width: int, height: int,
+                 timestamp: Optional[float] = None):
+        """
+        初期化
+        
+        Args:
+            seq: フレーム連番
+            jpeg: JPEGデータ
+            width: 画像幅
+            height: 画像高さ
+            timestamp: 生成時刻（UNIX時間）
+        """
+        self.seq = seq
+        self.jpeg = jpeg
+        self.width = width
+        self.height = height
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self._base64 = None
+    
+    @property
+    def size(self) -> int:
+        """JPEGデータサイズ（バイト）"""
+        return len(self.jpeg)
+    
+    @property
+    def base64(self) -> str:
+        """Base64文字列（従来のJSONポーリング用・初回のみ変換）"""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.jpeg).decode('ascii')
+        return self._base64
+    
+    @property
+    def data_url(self) -> str:
+        """data: URL形式"""
+        return f"data:image/jpeg;base64,{self.base64}"
+    
+    def meta(self) -> Dict:
+        """バイナリ送信時に添付するメタデータ"""
+        return {
+            'seq': self.seq,
+            'timestamp': self.timestamp,
+            'width': self.width,
+            'height': self.height,
+            'size': self.size
+        }
+
+
+class FrameChannel:
+    """最新エンコード済みフレーム配信チャネル"""
+    
+    def __init__(self, quality: Optional[int] = None):
+        """
+        初期化
+        
+        Args:
+            quality: JPEG品質（Noneの場合は設定値）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.quality = quality if quality is not None else PIPELINE_CONFIG['jpeg_quality']
+        
+        self.condition = threading.Condition()
+        self._latest = None
+        self._seq = 0
+        
+        # 統計情報
+        self.stats = {
+            'frames': 0,
+            'bytes': 0,
+            'encode_time': 0.0
+        }
+        self.viewers = 0
+    
+    def publish(self, frame: np.ndarray) -> Optional[EncodedFrame]:
+        """
+        フレームを1回だけエンコードして配信
+        
+        Args:
+            frame: 配信する画像フレーム
+        
+        Returns:
+            Optional[EncodedFrame]: エンコード済みフレーム（失敗時はNone）
+        """
+        start_time = time.perf_counter()
+        try:
+            jpeg = encode_jpeg(frame, self.quality)
+        except Exception as e:
+            self.logger.error(f"フレームエンコードエラー: {e}")
+            return None
+        if jpeg is None:
+            return None
+        
+        height, width = frame.shape[:2]
+        return self._publish(jpeg, width, height, time.perf_counter() - start_time)
+    
+    def publish_jpeg(self, jpeg: bytes, width: int = 0, height: int = 0) -> EncodedFrame:
+        """エンコード済みJPEGをそのまま配信（カメラ映像のパススルー用）"""
+        return self._publish(bytes(jpeg), width, height, 0.0)
+    
+    def _publish(self, jpeg: bytes, width: int, height: int, encode_time: float) -> EncodedFrame:
+        """配信処理"""
+        with self.condition:
+            self._seq += 1
+            encoded = EncodedFrame(self._seq, jpeg, width, height)
+            self._latest = encoded
+            
+            self.stats['frames'] += 1
+            self.stats['bytes'] += encoded.size
+            self.stats['encode_time'] += encode_time
+            
+            self.condition.notify_all()
+        return encoded
+    
+    def latest(self) -> Optional[EncodedFrame]:
+        """最新フレーム取得"""
+        return self._latest
+    
+    def wait_for_next(self, last_seq: int = 0,
+                      timeout: Optional[float] = None) -> Optional[EncodedFrame]:
+        """
+        last_seqより新しいフレームを待機
+        
+        Args:
+            last_seq: 受信済みフレーム連番
+            timeout: 待機タイムアウト（秒）
+        
+        Returns:
+            Optional[EncodedFrame]: 新しいフレーム（タイムアウト時はNone）
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self._latest is not None and self._latest.seq > last_seq,
+                timeout=timeout
+            )
+            latest = self._latest
+        if latest is None or latest.seq <= last_seq:
+            return None
+        return latest
+    
+    def clear(self):
+        """最新フレーム破棄"""
+        with self.condition:
+            self._latest = None
+    
+    def get_stats(self) -> Dict:
+        """統計情報取得"""
+        stats = dict(self.stats)
+        frames = stats['frames']
+        stats['average_frame_bytes'] = stats['bytes'] / frames if frames else 0
+        stats['average_encode_ms'] = stats['encode_time'] * 1000 / frames if frames else 0
+        stats['latest_seq'] = self._seq
+        stats['viewers'] = self.viewers
+        return stats
+    
+    def iter_multipart(self, is_active: Optional[Callable[[], bool]] = None,
+                       keepalive: float = 5.0) -> Iterator[bytes]:
+        """
+        新着フレームをmultipartパートとして逐次出力（視聴者毎のジェネレータ）
+        
+        全視聴者が同じエンコード済みフレームを共有し、送信が遅い視聴者は
+        送信完了時点の最新フレームへ飛ぶ（古いフレームは溜めない）。
+        
+        Args:
+            is_active: 配信継続判定（Falseで終了）
+            keepalive: 新着がない場合に最新フレームを再送する間隔（秒）
+        
+        Yields:
+            bytes: multipartパート
+        """
+        with self.condition:
+            self.viewers += 1
+        
+        try:
+            last_seq = 0
+            last_sent = time.monotonic()
+            while is_active is None or is_active():
+                encoded = self.wait_for_next(last_seq, timeout=1.0)
+                if encoded is None:
+                    # 切断検出のため一定間隔で最新フレームを再送
+                    latest = self._latest
+                    if latest is None or time.monotonic() - last_sent < keepalive:
+                        continue
+                    encoded = latest
+                
+                last_seq = encoded.seq
+                last_sent = time.monotonic()
+                yield mjpeg_part(encoded.jpeg)
+        finally:
+            with self.condition:
+                self.viewers -= 1
+
+
+def resize_to_width(frame: np.ndarray, max_width: Optional[int]) -> np.ndarray:
+    """最大幅に収まるよう縮小（拡大はしない）"""
+    height, width = frame.shape[:2]
+    if not max_width or width <= max_width:
+        return frame
+    
+    scale = max_width / width
+    return cv2.resize(frame, (max_width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+
+
+@dataclass
+class ClientSlot:
+    """クライアント別送信状態（最新フレームのみ保持）"""
+    tier: str
+    in_flight: bool = False
+    sent_at: float = 0.0
+    pending: Optional[Dict] = None
+    sent: int = 0
+    skipped: int = 0
+
+
+class FrameBroadcaster:
+    """ティア別エンコード1回・全クライアント共有の配信クラス"""
+    
+    def __init__(self, socketio, event: str = 'frame_binary',
+                 tiers: Optional[Dict[str, Dict]] = None):
+        """
+        初期化
+        
+        Args:
+            socketio: Flask-SocketIOインスタンス
+            event: 送信イベント名
+            tiers: ティア設定（Noneの場合は設定値）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.socketio = socketio
+        self.event = event
+        self.tiers = tiers or BROADCAST_CONFIG['tiers']
+        self.default_tier = BROADCAST_CONFIG['default_tier']
+        self.ack_timeout = BROADCAST_CONFIG['ack_timeout']
+        
+        # ティア別チャネル（各ティア1フレーム1回エンコード）
+        self.channels = {
+            name: FrameChannel(quality=tier['quality']) for name, tier in self.tiers.items()
+        }
+        self._latest_payloads: Dict[str, Dict] = {}
+        
+        # クライアント管理
+        self.clients: Dict[str, ClientSlot] = {}
+        self.lock = threading.Lock()
+    
+    @property
+    def client_count(self) -> int:
+        """登録クライアント数"""
+        return len(self.clients)
+    
+    def subscribe(self, sid: str, tier: Optional[str] = None) -> bool:
+        """
+        クライアントをティアに登録（登録済みの場合はティア変更）
+        
+        Args:
+            sid: SocketIOセッションID
+            tier: ティア名（Noneの場合は既定ティア）
+        
+        Returns:
+            bool: 登録成功時True
+        """
+        tier = tier or self.default_tier
+        if tier not in self.tiers:
+            return False
+        
+        with self.lock:
+            slot = self.clients.get(sid)
+            if slot is None:
+                self.clients[sid] = ClientSlot(tier=tier)
+            else:
+                slot.tier = tier
+                slot.pending = None
+        return True
+    
+    def unsubscribe(self, sid: str):
+        """クライアント登録解除"""
+        with self.lock:
+            self.clients.pop(sid, None)
+    
+    def broadcast(self, frame: np.ndarray, extra: Optional[Dict[str, Any]] = None) -> int:
+        """
+        購読中ティアのみエンコードして全クライアントへ配信
+        
+        Args:
+            frame: 配信する画像フレーム
+            extra: 全クライアント共通の付加情報（カウント等）
+        
+        Returns:
+            int: 今回送信を開始したクライアント数
+        """
+        with self.lock:
+            active_tiers = {slot.tier for slot in self.clients.values()}
+        
+        payloads = {}
+        for tier in active_tiers:
+            encoded = self.channels[tier].publish(
+                resize_to_width(frame, self.tiers[tier].get('max_width'))
+            )
+            if encoded is None:
+                continue
+            payloads[tier] = self._build_payload(tier, encoded, extra)
+        
+        self._latest_payloads.update(payloads)
+        
+        to_send = []
+        now = time.monotonic()
+        with self.lock:
+            for sid, slot in self.clients.items():
+                payload = payloads.get(slot.tier)
+                if payload is None:
+                    continue
+                
+                # 受信確認が来ないまま期限切れのクライアントは送信可能に戻す
+                if slot.in_flight and now - slot.sent_at > self.ack_timeout:
+                    slot.in_flight = False
+                
+                if slot.in_flight:
+                    # 送信中: 最新フレームのみ保持して古い待機分は破棄
+                    if slot.pending is not None:
+                        slot.skipped += 1
+                    slot.pending = payload
+                else:
+                    self._mark_sent(slot, now)
+                    to_send.append((sid, payload))
+        
+        for sid, payload in to_send:
+            self._emit(sid, payload)
+        return len(to_send)
+    
+    def send_latest(self, sid: str, extra: Optional[Dict[str, Any]] = None) -> bool:
+        """クライアントのティアの最新フレームを再エンコードせずに送信"""
+        with self.lock:
+            slot = self.clients.get(sid)
+            if slot is None:
+                return False
+            payload = self._latest_payloads.get(slot.tier)
+            if payload is None or slot.in_flight:
+                return False
+            if extra:
+                payload = {**payload, **extra}
+            self._mark_sent(slot, time.monotonic())
+        
+        self._emit(sid, payload)
+        return True
+    
+    def _build_payload(self, tier: str, encoded: EncodedFrame,
+                       extra: Optional[Dict[str, Any]]) -> Dict:
+        """送信データ作成（同一ティアの全クライアントで共有）"""
+        meta = encoded.meta()
+        meta['tier'] = tier
+        payload = dict(extra or {})
+        payload['image'] = encoded.jpeg
+        payload['meta'] = meta
+        return payload
+    
+    def _mark_sent(self, slot: ClientSlot, now: float):
+        """送信開始状態に更新（ロック取得済みで呼び出す）"""
+        slot.in_flight = True
+        slot.sent_at = now
+        slot.sent += 1
+    
+    def _emit(self, sid: str, payload: Dict):
+        """個別クライアントへ送信（受信確認付き）"""
+        try:
+            self.socketio.emit(self.event, payload, to=sid,
+                               callback=lambda *args: self._on_ack(sid))
+        except Exception as e:
+            self.logger.error(f"フレーム送信エラー ({sid}): {e}")
+            with self.lock:
+                slot = self.clients.get(sid)
+                if slot is not None:
+                    slot.in_flight = False
+    
+    def _on_ack(self, sid: str):
+        """受信確認: 待機中の最新フレームがあれば続けて送信"""
+        with self.lock:
+            slot = self.clients.get(sid)
+            if slot is None:
+                return
+            slot.in_flight = False
+            payload, slot.pending = slot.pending, None
+            if payload is None:
+                return
+            self._mark_sent(slot, time.monotonic())
+        
+        self._emit(sid, payload)
+    
+    def get_stats(self) -> Dict:
+        """配信統計取得"""
+        with self.lock:
+            clients = {
+                sid: {'tier': slot.tier, 'sent': slot.sent, 'skipped': slot.skipped}
+                for sid, slot in self.clients.items()
+            }
+        
+        tier_clients = {name: 0 for name in self.tiers}
+        for client in clients.values():
+            tier_clients[client['tier']] += 1
+        
+        return {
+            'clients': clients,
+            'tier_clients': tier_clients,
+            'tiers': {name: channel.get_stats() for name, channel in self.channels.items()}
+        }
+
+
+if __name__ == "__main__":
+    # 比較: クライアント毎のBase64 data URL vs 共有バイナリ
+    client_count = 20
+    frame_count = 30
+    sample = cv2.GaussianBlur(
+        np.random.randint(0, 255, (720, 1280, 3), dtype=np.uint8), (15, 15), 0
+    )
+    
+    start = time.perf_counter()
+    legacy_bytes = 0
+    for _ in range(frame_count):
+        for _ in range(client_count):
+            _, buffer = cv2.imencode('.jpg', sample, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            legacy_bytes += len(f"data:image/jpeg;base64,{base64.b64encode(buffer).decode('utf-8')}")
+    legacy_time = time.perf_counter() - start
+    
+    channel = FrameChannel(quality=80)
+    start = time.perf_counter()
+    binary_bytes = 0
+    for _ in range(frame_count):
+        encoded = channel.publish(sample)
+        for _ in range(client_count):
+            binary_bytes += encoded.size
+    binary_time = time.perf_counter() - start
+    
+    print(f"クライアント数: {client_count}, フレーム数: {frame_count}")
+    print(f"従来方式 (Base64 data URL): {legacy_bytes / (frame_count * client_count) / 1024:.1f} KB/フレーム, "
+          f"CPU {legacy_time * 1000 / frame_count:.1f} ms/フレーム")
+    print(f"バイナリ共有: {binary_bytes / (frame_count * client_count) / 1024:.1f} KB/フレーム, "
+          f"CPU {binary_time * 1000 / frame_count:.1f} ms/フレーム")
+    
+    # 遅いクライアントが混在しても他クライアントの配信は遅れないことを確認
+    class _DemoSocketIO:
+        def emit(self, event, payload, to=None, callback=None):
+            delay = 0.5 if to == 'slow-tablet' else 0.0
+            threading.Timer(delay, callback).start()
+    
+    broadcaster = FrameBroadcaster(_DemoSocketIO())
+    broadcaster.subscribe('slow-tablet', 'low')
+    for i in range(client_count - 1):
+        broadcaster.subscribe(f'client-{i}', 'medium' if i % 2 else 'high')
+    
+    start = time.perf_counter()
+    for _ in range(frame_count):
+        broadcaster.broadcast(sample, {'counts': {}})
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    
+    stats = broadcaster.get_stats()
+    print(f"ティア配信: {frame_count}フレーム {elapsed:.2f}秒")
+    for tier, tier_stats in stats['tiers'].items():
+        print(f"  {tier}: {tier_stats['average_frame_bytes'] / 1024:.1f} KB/フレーム, "
+              f"エンコード {tier_stats['frames']}回, クライアント {stats['tier_clients'][tier]}")
+    slow = stats['clients']['slow-tablet']
+    fast = stats['clients']['client-0']
+    print(f"  遅いクライアント: 送信 {slow['sent']} / 破棄 {slow['skipped']}, "
+          f"通常クライアント: 送信 {fast['sent']} / 破棄 {fast['skipped']}")
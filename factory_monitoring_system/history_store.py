@@ -0,0 +1,701 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 検出履歴ストア
+SQLite(WAL)への追記専用テーブルに、バックグラウンド書き込みスレッドがまとめてコミット
+同じトランザクションで分・時・日単位のクラス別/ゾーン別集計（ロールアップ）も更新
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import HISTORY_STORE_CONFIG, ROLLUP_CONFIG
+from timeseries_store import to_epoch_ms, from_epoch_ms
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    timestamp_ms INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    counts TEXT NOT NULL,
+    zone_counts TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections(timestamp_ms);
+
+-- scope: '' = フレーム全体, それ以外 = ゾーン名
+CREATE TABLE IF NOT EXISTS rollup_buckets (
+    tier TEXT NOT NULL,
+    bucket_ms INTEGER NOT NULL,
+    scope TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    PRIMARY KEY (tier, bucket_ms, scope)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    tier TEXT NOT NULL,
+    bucket_ms INTEGER NOT NULL,
+    scope TEXT NOT NULL,
+    class_name TEXT NOT NULL,
+    samples INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    minimum INTEGER NOT NULL,
+    maximum INTEGER NOT NULL,
+    PRIMARY KEY (tier, bucket_ms, scope, class_name)
+) WITHOUT ROWID;
+"""
+
+UPSERT_BUCKET = """
+INSERT INTO rollup_buckets (tier, bucket_ms, scope, samples) VALUES (?, ?, ?, ?)
+ON CONFLICT (tier, bucket_ms, scope) DO UPDATE SET samples = samples + excluded.samples
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO rollups (tier, bucket_ms, scope, class_name, samples, total, minimum, maximum)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (tier, bucket_ms, scope, class_name) DO UPDATE SET
+    samples = samples + excluded.samples,
+    total = total + excluded.total,
+    minimum = MIN(minimum, excluded.minimum),
+    maximum = MAX(maximum, excluded.maximum)
+"""
+
+
+def local_utc_offset_ms() -> int:
+    """ローカル時刻のUTCオフセット（日単位バケットをローカルの0時に揃える）"""
+    return int(datetime.now().astimezone().utcoffset().total_seconds() * 1000)
+
+
+def bucket_start(timestamp_ms: int, width_ms: int, utc_offset_ms: int = 0) -> int:
+    """タイムスタンプが属するバケットの開始時刻（ローカル時刻で整列）"""
+    return timestamp_ms - (timestamp_ms + utc_offset_ms) % width_ms
+
+
+def aggregate_rollups(batch: Sequence[Tuple[int, Dict, Optional[Dict]]], tiers_ms: Dict[str, int],
+                      utc_offset_ms: int = 0) -> Tuple[Dict, Dict]:
+    """
+    記録バッチを階層・バケット・スコープ・クラス毎に集計
+    
+    Args:
+        batch: [(エポックミリ秒, クラス別カウント, ゾーン別カウント), ...]
+        tiers_ms: 階層名 -> バケット幅（ミリ秒）
+        utc_offset_ms: バケット整列用のUTCオフセット
+    
+    Returns:
+        Tuple[Dict, Dict]: ((階層, バケット, スコープ) -> 記録数,
+                            (階層, バケット, スコープ, クラス) -> [記録数, 合計, 最小, 最大])
+    """
+    buckets = defaultdict(int)
+    cells = {}
+    for timestamp_ms, counts, zone_counts in batch:
+        scopes = [('', counts)]
+        if zone_counts:
+            scopes.extend(zone_counts.items())
+        for tier, width_ms in tiers_ms.items():
+            bucket_ms = bucket_start(timestamp_ms, width_ms, utc_offset_ms)
+            for scope, scope_counts in scopes:
+                buckets[(tier, bucket_ms, scope)] += 1
+                for class_name, value in scope_counts.items():
+                    key = (tier, bucket_ms, scope, class_name)
+                    cell = cells.get(key)
+                    if cell is None:
+                        cells[key] = [1, value, value, value]
+                    else:
+                        cell[0] += 1
+                        cell[1] += value
+                        if value < cell[2]:
+                            cell[2] = value
+                        if value > cell[3]:
+                            cell[3] = value
+    return buckets, cells
+
+
+class HistoryStore:
+    """検出履歴の追記専用ストア（書き込みは呼び出し元をブロックしない）"""
+    
+    def __init__(self, db_path: str, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_queue: Optional[int] = None):
+        """
+        初期化（破損したDBは退避して作り直す）
+        
+        Args:
+            db_path: SQLiteファイルパス
+            batch_size: 1回のコミットにまとめる最大件数
+            flush_interval: 最初の1件から最大何秒でコミットするか
+            max_queue: 書き込み待ちキューの上限（超過分は破棄）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = db_path
+        self.batch_size = batch_size or HISTORY_STORE_CONFIG['batch_size']
+        self.flush_interval = (HISTORY_STORE_CONFIG['flush_interval'] if flush_interval is None
+                               else flush_interval)
+        self.write_queue = queue.Queue(maxsize=max_queue or HISTORY_STORE_CONFIG['max_queue'])
+        
+        # ロールアップ階層（細かい順）と保持期間
+        self.tiers_ms = {tier: int(seconds * 1000) for tier, seconds in
+                         sorted(ROLLUP_CONFIG['tiers'].items(), key=lambda item: item[1])}
+        self.retention_ms = {tier: int(days * 86400 * 1000) for tier, days in
+                             ROLLUP_CONFIG['retention_days'].items()}
+        self.utc_offset_ms = local_utc_offset_ms()
+        self._last_prune = 0.0
+        
+        self.writer_thread = None
+        self.is_running = False
+        self._start_lock = threading.Lock()
+        
+        # 統計情報
+        self.stats = {
+            'written': 0,
+            'dropped': 0,
+            'commits': 0,
+            'last_commit_ms': 0.0,
+            'pruned': 0,
+            'recovered': False
+        }
+        
+        self._initialize()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """接続作成（スレッド毎に1接続）"""
+        connection = sqlite3.connect(self.db_path, timeout=10.0)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # WALではNORMALでもコミット済みデータはプロセスクラッシュ後に残る
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+    
+    def _initialize(self):
+        """スキーマ作成・整合性確認"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        try:
+            connection = self._connect()
+            try:
+                result = connection.execute("PRAGMA quick_check").fetchone()[0]
+                if result != 'ok':
+                    raise sqlite3.DatabaseError(result)
+                self._migrate_schema(connection)
+                self._backfill_rollups(connection)
+                self._prune(connection)
+            finally:
+                connection.close()
+        except sqlite3.DatabaseError as e:
+            suffix = datetime.now().strftime('%Y%m%d_%H%M%S')
+            self.logger.error(f"履歴DB破損のため退避して再作成: {e} -> {self.db_path}.corrupt-{suffix}")
+            for extension in ('', '-wal', '-shm'):
+                if os.path.exists(self.db_path + extension):
+                    os.replace(self.db_path + extension, f"{self.db_path}{extension}.corrupt-{suffix}")
+            connection = self._connect()
+            try:
+                self._migrate_schema(connection)
+            finally:
+                connection.close()
+            self.stats['recovered'] = True
+    
+    def _migrate_schema(self, connection: sqlite3.Connection):
+        """スキーマ作成（ゾーン列のない旧テーブルには列を追加）"""
+        connection.executescript(SCHEMA)
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(detections)")}
+        if 'zone_counts' not in columns:
+            connection.execute("ALTER TABLE detections ADD COLUMN zone_counts TEXT")
+            connection.commit()
+    
+    def _backfill_rollups(self, connection: sqlite3.Connection, chunk_size: int = 10000):
+        """ロールアップ未作成の既存記録から集計を作成（旧バージョンのDB向け）"""
+        if connection.execute("SELECT 1 FROM rollup_buckets LIMIT 1").fetchone():
+            return
+        if not connection.execute("SELECT 1 FROM detections LIMIT 1").fetchone():
+            return
+        
+        start = time.perf_counter()
+        last_id = 0
+        backfilled = 0
+        while True:
+            rows = connection.execute(
+                "SELECT id, timestamp_ms, counts, zone_counts FROM detections "
+                "WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                break
+            batch = [(timestamp_ms, json.loads(counts), json.loads(zone_counts) if zone_counts else None)
+                     for _, timestamp_ms, counts, zone_counts in rows]
+            with connection:
+                self._write_rollups(connection, batch)
+            last_id = rows[-1][0]
+            backfilled += len(rows)
+        self.logger.info(f"ロールアップ作成: {backfilled}件 ({time.perf_counter() - start:.1f}秒)")
+    
+    def _prune(self, connection: sqlite3.Connection, now_ms: Optional[int] = None):
+        """保持期間を過ぎた記録・ロールアップの削除"""
+        now_ms = to_epoch_ms(None) if now_ms is None else now_ms
+        pruned = 0
+        with connection:
+            for tier, retention_ms in self.retention_ms.items():
+                cutoff = now_ms - retention_ms
+                if tier == 'raw':
+                    pruned += connection.execute(
+                        "DELETE FROM detections WHERE timestamp_ms < ?", (cutoff,)).rowcount
+                elif tier in self.tiers_ms:
+                    pruned += connection.execute(
+                        "DELETE FROM rollups WHERE tier = ? AND bucket_ms < ?", (tier, cutoff)).rowcount
+                    connection.execute(
+                        "DELETE FROM rollup_buckets WHERE tier = ? AND bucket_ms < ?", (tier, cutoff))
+        self.stats['pruned'] += pruned
+        self._last_prune = time.monotonic()
+    
+    def start(self):
+        """書き込みスレッド開始"""
+        with self._start_lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+            self.writer_thread.start()
+        self.logger.info(
+            f"履歴ストア開始: {self.db_path} (バッチ: {self.batch_size}件, "
+            f"最大待機: {self.flush_interval:.1f}秒)"
+        )
+    
+    def stop(self, timeout: float = 5.0):
+        """書き込みスレッド停止（キュー内の記録は書き込んでから終了）"""
+        with self._start_lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+        
+        self.write_queue.put(None)
+        if self.writer_thread and self.writer_thread.is_alive():
+            self.writer_thread.join(timeout=timeout)
+        self.logger.info(f"履歴ストア停止 (書き込み: {self.stats['written']}件)")
+    
+    def append(self, counts: Dict[str, int], timestamp=None,
+               zone_counts: Optional[Dict[str, Dict[str, int]]] = None) -> bool:
+        """
+        記録追加（キューに積むだけで即座に戻る）
+        
+        Args:
+            counts: クラス別カウント
+            timestamp: 記録時刻（Noneの場合は現在時刻）
+            zone_counts: ゾーン別・クラス別カウント
+        
+        Returns:
+            bool: キューに追加できたか（満杯の場合は破棄）
+        """
+        if not self.is_running:
+            self.start()
+        
+        try:
+            zone_counts = {zone: dict(counts) for zone, counts in zone_counts.items()} if zone_counts else None
+            self.write_queue.put_nowait((to_epoch_ms(timestamp), dict(counts), zone_counts))
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """キュー内の記録をコミットするまで待機"""
+        if not self.is_running:
+            return True
+        
+        done = threading.Event()
+        try:
+            self.write_queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+    
+    def _writer_loop(self):
+        """書き込みループ（最初の1件から flush_interval 以内にまとめてコミット）"""
+        connection = self._connect()
+        try:
+            while True:
+                item = self.write_queue.get()
+                batch = []
+                waiters = []
+                stopping = False
+                deadline = time.monotonic() + self.flush_interval
+                
+                while True:
+                    if item is None:
+                        stopping = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        batch.append(item)
+                    
+                    if stopping or waiters or len(batch) >= self.batch_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self.write_queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                
+                # 停止要求後にキューへ残った記録も書き込む
+                if stopping:
+                    while True:
+                        try:
+                            item = self.write_queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if isinstance(item, threading.Event):
+                            waiters.append(item)
+                        elif item is not None:
+                            batch.append(item)
+                
+                if batch:
+                    self._commit(connection, batch)
+                if time.monotonic() - self._last_prune >= ROLLUP_CONFIG['prune_interval']:
+                    try:
+                        self._prune(connection)
+                    except sqlite3.Error as e:
+                        self.logger.error(f"履歴削除エラー: {e}")
+                for waiter in waiters:
+                    waiter.set()
+                if stopping:
+                    break
+        finally:
+            connection.close()
+    
+    def _commit(self, connection: sqlite3.Connection, batch: List):
+        """1トランザクションでまとめて書き込み"""
+        start = time.perf_counter()
+        try:
+            with connection:
+                self._write(connection, batch)
+        except sqlite3.Error as e:
+            self.stats['dropped'] += len(batch)
+            self.logger.error(f"履歴書き込みエラー: {e}")
+            return
+        
+        self.stats['written'] += len(batch)
+        self.stats['commits'] += 1
+        self.stats['last_commit_ms'] = (time.perf_counter() - start) * 1000
+    
+    def _write(self, connection: sqlite3.Connection, batch: List):
+        """記録とロールアップの書き込み（トランザクションは呼び出し側）"""
+        rows = [
+            (timestamp_ms, sum(counts.values()), json.dumps(counts, ensure_ascii=False),
+             json.dumps(zone_counts, ensure_ascii=False) if zone_counts else None)
+            for timestamp_ms, counts, zone_counts in batch
+        ]
+        connection.executemany(
+            "INSERT INTO detections (timestamp_ms, total, counts, zone_counts) VALUES (?, ?, ?, ?)", rows
+        )
+        self._write_rollups(connection, batch)
+    
+    def _write_rollups(self, connection: sqlite3.Connection, batch: List):
+        """バッチ内で集計してからロールアップへ加算（バケット毎に1行のUPSERT）"""
+        buckets, cells = aggregate_rollups(batch, self.tiers_ms, self.utc_offset_ms)
+        connection.executemany(UPSERT_BUCKET, [key + (samples,) for key, samples in buckets.items()])
+        connection.executemany(UPSERT_ROLLUP, [key + tuple(cell) for key, cell in cells.items()])
+    
+    def query(self, since=None, until=None, limit: Optional[int] = None,
+              total_key: str = 'total') -> List[Dict]:
+        """
+        履歴取得（従来形式の辞書、古い順）
+        
+        Args:
+            since: 開始時刻（この時刻より後）
+            until: 終了時刻（この時刻以前）
+            limit: 直近件数
+            total_key: 合計値のキー名
+        
+        Returns:
+            List[Dict]: {'timestamp': ISO文字列, 'counts': {...}, total_key: 合計}
+        """
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append("timestamp_ms > ?")
+            params.append(to_epoch_ms(since))
+        if until is not None:
+            conditions.append("timestamp_ms <= ?")
+            params.append(to_epoch_ms(until))
+        sql = "SELECT timestamp_ms, total, counts FROM detections"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp_ms DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        
+        connection = self._connect()
+        try:
+            rows = connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+        
+        return [
+            {
+                'timestamp': from_epoch_ms(timestamp_ms).isoformat(),
+                'counts': json.loads(counts),
+                total_key: total
+            }
+            for timestamp_ms, total, counts in reversed(rows)
+        ]
+    
+    def count(self) -> int:
+        """保存済み件数"""
+        connection = self._connect()
+        try:
+            return connection.execute("SELECT COUNT(*) FROM detections").fetchone()[0]
+        finally:
+            connection.close()
+    
+    def migrate_json(self, json_path: str) -> int:
+        """
+        旧形式（JSON全件書き換え）の履歴を取り込み、元ファイルは .migrated に改名
+        
+        Args:
+            json_path: 旧履歴ファイル
+        
+        Returns:
+            int: 取り込んだ件数
+        """
+        if not os.path.exists(json_path):
+            return 0
+        
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                records = json.load(f).get('records', [])
+        except (OSError, ValueError) as e:
+            self.logger.error(f"旧履歴ファイル読み込みエラー: {e}")
+            return 0
+        
+        batch = [(to_epoch_ms(record.get('timestamp')), record.get('counts', {}), None)
+                 for record in records]
+        
+        connection = self._connect()
+        try:
+            with connection:
+                self._write(connection, batch)
+        finally:
+            connection.close()
+        
+        os.replace(json_path, json_path + '.migrated')
+        self.logger.info(f"旧履歴ファイルを取り込み: {len(batch)}件 ({json_path})")
+        return len(batch)
+    
+    def select_tier(self, since_ms: int, until_ms: int, now_ms: Optional[int] = None) -> str:
+        """
+        期間に対して十分な最も粗いロールアップ階層を選択
+        
+        Args:
+            since_ms: 開始時刻（エポックミリ秒）
+            until_ms: 終了時刻（エポックミリ秒）
+            now_ms: 現在時刻（保持期間の判定用）
+        
+        Returns:
+            str: 階層名（期間内のバケット数が min_buckets 以上、かつ保持期間内）
+        """
+        now_ms = to_epoch_ms(None) if now_ms is None else now_ms
+        span_ms = max(until_ms - since_ms, 0)
+        retained = [tier for tier in self.tiers_ms
+                    if since_ms >= now_ms - self.retention_ms.get(tier, float('inf'))]
+        for tier in reversed(retained):
+            if span_ms >= self.tiers_ms[tier] * ROLLUP_CONFIG['min_buckets']:
+                return tier
+        # 期間が短い場合は保持されている最も細かい階層（全階層の保持期間外なら最も粗い階層）
+        return retained[0] if retained else list(self.tiers_ms)[-1]
+    
+    def _rollup_range(self, since, until, resolution: Optional[str]) -> Tuple[str, int, int]:
+        """(階層, 先頭バケット, 終了時刻) の決定"""
+        until_ms = to_epoch_ms(until)
+        since_ms = to_epoch_ms(since) if since is not None else 0
+        tier = resolution if resolution in self.tiers_ms else self.select_tier(since_ms, until_ms)
+        return tier, bucket_start(since_ms, self.tiers_ms[tier], self.utc_offset_ms), until_ms
+    
+    def get_statistics(self, since=None, until=None, resolution: Optional[str] = None) -> Dict:
+        """
+        期間統計（ロールアップから集計、期間端はバケット単位）
+        
+        Args:
+            since: 開始時刻
+            until: 終了時刻（Noneの場合は現在時刻）
+            resolution: 階層の明示指定（'minute' / 'hour' / 'day'）
+        
+        Returns:
+            Dict: {'resolution', 'records', 'classes': {クラス: {average, min, max}},
+                   'zones': {ゾーン: {'records', 'classes': {...}}}}
+        """
+        tier, first_bucket, until_ms = self._rollup_range(since, until, resolution)
+        params = (tier, first_bucket, until_ms)
+        
+        connection = self._connect()
+        try:
+            scope_samples = dict(connection.execute(
+                "SELECT scope, SUM(samples) FROM rollup_buckets "
+                "WHERE tier = ? AND bucket_ms >= ? AND bucket_ms <= ? GROUP BY scope", params
+            ).fetchall())
+            cells = connection.execute(
+                "SELECT scope, class_name, SUM(samples), SUM(total), MIN(minimum), MAX(maximum) "
+                "FROM rollups WHERE tier = ? AND bucket_ms >= ? AND bucket_ms <= ? "
+                "GROUP BY scope, class_name", params
+            ).fetchall()
+        finally:
+            connection.close()
+        
+        scopes = {scope: {'records': samples, 'classes': {}} for scope, samples in scope_samples.items()}
+        for scope, class_name, samples, total, minimum, maximum in cells:
+            records = scope_samples.get(scope, 0)
+            if not records or not total:
+                continue
+            scopes[scope]['classes'][class_name] = {
+                'average': total / records,
+                # クラスが記録されていない記録は0として扱う
+                'min': minimum if samples >= records else min(minimum, 0),
+                'max': maximum
+            }
+        
+        overall = scopes.pop('', {'records': 0, 'classes': {}})
+        return {
+            'resolution': tier,
+            'records': overall['records'],
+            'classes': overall['classes'],
+            'zones': scopes
+        }
+    
+    def get_series(self, since=None, until=None, scope: str = '',
+                   resolution: Optional[str] = None, total_key: str = 'total') -> Dict:
+        """
+        バケット毎の時系列（ロールアップから取得）
+        
+        Args:
+            since: 開始時刻
+            until: 終了時刻（Noneの場合は現在時刻）
+            scope: '' = フレーム全体、ゾーン名 = そのゾーン
+            resolution: 階層の明示指定
+            total_key: 合計値のキー名
+        
+        Returns:
+            Dict: {'resolution', 'records': [{'timestamp', 'samples', 'counts'（平均）, 'max_counts', total_key}]}
+        """
+        tier, first_bucket, until_ms = self._rollup_range(since, until, resolution)
+        params = (tier, first_bucket, until_ms, scope)
+        
+        connection = self._connect()
+        try:
+            buckets = connection.execute(
+                "SELECT bucket_ms, samples FROM rollup_buckets "
+                "WHERE tier = ? AND bucket_ms >= ? AND bucket_ms <= ? AND scope = ? ORDER BY bucket_ms", params
+            ).fetchall()
+            cells = connection.execute(
+                "SELECT bucket_ms, class_name, total, maximum FROM rollups "
+                "WHERE tier = ? AND bucket_ms >= ? AND bucket_ms <= ? AND scope = ?", params
+            ).fetchall()
+        finally:
+            connection.close()
+        
+        records = {}
+        for bucket_ms, samples in buckets:
+            records[bucket_ms] = {
+                'timestamp': from_epoch_ms(bucket_ms).isoformat(),
+                'samples': samples,
+                'counts': {},
+                'max_counts': {},
+                total_key: 0.0
+            }
+        for bucket_ms, class_name, total, maximum in cells:
+            record = records.get(bucket_ms)
+            if record is None or not total:
+                continue
+            average = total / record['samples']
+            record['counts'][class_name] = round(average, 3)
+            record['max_counts'][class_name] = maximum
+            record[total_key] += average
+        for record in records.values():
+            record[total_key] = round(record[total_key], 3)
+        
+        return {'resolution': tier, 'records': list(records.values())}
+    
+    def get_stats(self) -> Dict:
+        """統計情報取得"""
+        stats = dict(self.stats)
+        stats['queued'] = self.write_queue.qsize()
+        return stats
+
+
+if __name__ == "__main__":
+    import tempfile
+    
+    # 検出スレッド側の記録コスト比較: JSON全件書き換え(60件毎) vs 追記ストア
+    records_to_write = 20000
+    max_history_records = 1000
+    save_interval = 60
+    
+    with tempfile.TemporaryDirectory() as directory:
+        # 従来方式: 直近1000件をindent付きJSONで書き換え
+        json_path = os.path.join(directory, 'detection_history.json')
+        history = []
+        worst_ms = 0.0
+        begin = time.perf_counter()
+        for i in range(records_to_write):
+            counts = {'car': i % 20, 'truck': i % 5, 'person': i % 3}
+            history.append({
+                'timestamp': datetime.now().isoformat(),
+                'counts': counts,
+                'total_objects': sum(counts.values())
+            })
+            history = history[-max_history_records:]
+            if (i + 1) % save_interval == 0:
+                save_start = time.perf_counter()
+                with open(json_path, 'w', encoding='utf-8') as f:
+                    json.dump({'last_updated': datetime.now().isoformat(), 'records': history},
+                              f, ensure_ascii=False, indent=2)
+                worst_ms = max(worst_ms, (time.perf_counter() - save_start) * 1000)
+        json_seconds = time.perf_counter() - begin
+        print(f"JSON書き換え: {records_to_write / json_seconds:,.0f} 件/秒 "
+              f"(検出スレッドの最大停止 {worst_ms:.1f} ms, 保持 {len(history)}件のみ)")
+        
+        # 追記ストア: 呼び出し側はキュー投入のみ（直近7日間に30秒間隔で分布）
+        store = HistoryStore(os.path.join(directory, 'history.db'), max_queue=records_to_write + 1)
+        store.start()
+        latencies_ms = []
+        first_timestamp = time.time() - records_to_write * 30
+        begin = time.perf_counter()
+        for i in range(records_to_write):
+            append_start = time.perf_counter()
+            store.append({'car': i % 20, 'truck': i % 5, 'person': i % 3},
+                         first_timestamp + i * 30, {'shelf_a': {'car': i % 4}})
+            latencies_ms.append((time.perf_counter() - append_start) * 1000)
+        enqueue_seconds = time.perf_counter() - begin
+        store.flush(timeout=60.0)
+        durable_seconds = time.perf_counter() - begin
+        stats = store.get_stats()
+        store.stop()
+        print(f"追記ストア: 投入 {records_to_write / enqueue_seconds:,.0f} 件/秒 "
+              f"(1件あたり p99 {sorted(latencies_ms)[int(len(latencies_ms) * 0.99)]:.3f} ms / "
+              f"最大 {max(latencies_ms):.2f} ms), "
+              f"コミット完了まで {records_to_write / durable_seconds:,.0f} 件/秒 "
+              f"({stats['commits']}回コミット, 保持 {store.count()}件)")
+        
+        # 期間統計: ロールアップ vs 生記録の全件走査
+        for hours in (1, 24, 168):
+            since = time.time() - hours * 3600
+            begin = time.perf_counter()
+            summary = store.get_statistics(since=since)
+            rollup_ms = (time.perf_counter() - begin) * 1000
+            
+            begin = time.perf_counter()
+            connection = store._connect()
+            rows = connection.execute("SELECT counts FROM detections WHERE timestamp_ms > ?",
+                                      (to_epoch_ms(since),)).fetchall()
+            connection.close()
+            raw_average = sum(json.loads(counts).get('car', 0) for counts, in rows) / max(len(rows), 1)
+            raw_ms = (time.perf_counter() - begin) * 1000
+            
+            print(f"{hours:>3}時間: {summary['resolution']:<6} {rollup_ms:6.2f} ms "
+                  f"(car平均 {summary['classes']['car']['average']:.2f}, "
+                  f"shelf_a {summary['zones']['shelf_a']['classes']['car']['average']:.2f}) / "
+                  f"生記録 {len(rows)}件 {raw_ms:7.2f} ms (car平均 {raw_average:.2f})")
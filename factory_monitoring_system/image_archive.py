@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 検出画像アーカイブ
+重複・類似画像を除外し、サムネイル・SQLite索引付きで容量上限内に保存（書き込みはバックグラウンド）
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from config import DATA_CONFIG, IMAGE_ARCHIVE_CONFIG
+from timeseries_store import to_epoch_ms, from_epoch_ms
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    dhash INTEGER NOT NULL,
+    timestamp_ms INTEGER NOT NULL,
+    camera_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    thumbnail_path TEXT,
+    bytes INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    counts TEXT NOT NULL,
+    last_access_ms INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_timestamp ON images(timestamp_ms);
+CREATE INDEX IF NOT EXISTS idx_images_camera ON images(camera_id, timestamp_ms);
+CREATE INDEX IF NOT EXISTS idx_images_access ON images(last_access_ms);
+CREATE TABLE IF NOT EXISTS image_classes (
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    class_name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (class_name, image_id)
+) WITHOUT ROWID;
+"""
+
+
+def dhash(frame: np.ndarray, hash_size: int = 8) -> int:
+    """差分ハッシュ（縮小グレースケールの横方向輝度差、64ビット）"""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(frame, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).reshape(-1)
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """ハッシュ間のビット差"""
+    return bin(a ^ b).count('1')
+
+
+def _to_signed64(value: int) -> int:
+    """SQLiteのINTEGER(符号付き64ビット)に格納できる値へ変換"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class ImageArchive:
+    """検出画像アーカイブ（送信側はキュー投入のみ）"""
+    
+    def __init__(self, root_dir: Optional[str] = None, index_path: Optional[str] = None,
+                 max_bytes: Optional[int] = None, max_age_days: Optional[float] = None,
+                 thumbnail_width: Optional[int] = None, dhash_threshold: Optional[int] = None,
+                 dhash_window: Optional[float] = None, max_queue: Optional[int] = None):
+        """
+        初期化
+        
+        Args:
+            root_dir: 画像保存ディレクトリ
+            index_path: 索引DBパス
+            max_bytes: 画像・サムネイルの合計容量上限（超過時は最終参照が古い順に削除）
+            max_age_days: 保存期間（日）
+            thumbnail_width: サムネイル幅
+            dhash_threshold: 類似とみなすハッシュのビット差
+            dhash_window: 類似判定の対象とする直近の秒数（カメラ毎）
+            max_queue: 書き込み待ちキュー上限（超過分は破棄）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.root_dir = root_dir or os.path.join(DATA_CONFIG['data_dir'], DATA_CONFIG['images_dir'])
+        self.index_path = index_path or os.path.join(self.root_dir, IMAGE_ARCHIVE_CONFIG['index_file'])
+        self.max_bytes = max_bytes or IMAGE_ARCHIVE_CONFIG['max_bytes']
+        self.max_age_days = (IMAGE_ARCHIVE_CONFIG['max_age_days'] if max_age_days is None
+                             else max_age_days)
+        self.thumbnail_width = thumbnail_width or IMAGE_ARCHIVE_CONFIG['thumbnail_width']
+        self.dhash_threshold = (IMAGE_ARCHIVE_CONFIG['dhash_threshold'] if dhash_threshold is None
+                                else dhash_threshold)
+        self.dhash_window = (IMAGE_ARCHIVE_CONFIG['dhash_window'] if dhash_window is None
+                             else dhash_window)
+        self.image_format = DATA_CONFIG['image_format']
+        self.encode_params = []
+        if self.image_format in ('jpg', 'jpeg'):
+            quality = (IMAGE_ARCHIVE_CONFIG['jpeg_quality'] if DATA_CONFIG['compress_images']
+                       else 95)
+            self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        
+        self.write_queue = queue.Queue(maxsize=max_queue or IMAGE_ARCHIVE_CONFIG['max_queue'])
+        self.worker_thread = None
+        self.is_running = False
+        self._start_lock = threading.Lock()
+        
+        # カメラ毎の直近ハッシュ: camera_id -> deque[(UNIX秒, dhash)]
+        self._recent_hashes = {}
+        self.total_bytes = 0
+        
+        # 統計情報
+        self.stats = {
+            'submitted': 0,
+            'saved': 0,
+            'duplicates': 0,
+            'near_duplicates': 0,
+            'evicted': 0,
+            'dropped': 0
+        }
+        
+        os.makedirs(self.root_dir, exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+            self.total_bytes = connection.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM images").fetchone()[0]
+        finally:
+            connection.close()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """索引DB接続"""
+        connection = sqlite3.connect(self.index_path, timeout=10.0)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+    
+    def start(self):
+        """書き込みスレッド開始"""
+        with self._start_lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            self.worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+            self.worker_thread.start()
+        self.logger.info(
+            f"画像アーカイブ開始: {self.root_dir} "
+            f"(上限 {self.max_bytes / 1024 ** 2:.0f}MB, 使用 {self.total_bytes / 1024 ** 2:.1f}MB)"
+        )
+    
+    def stop(self, timeout: float = 10.0):
+        """書き込みスレッド停止（キュー内の画像は保存してから終了）"""
+        with self._start_lock:
+            if not self.is_running:
+                return
+            self.is_running = False
+        
+        self.write_queue.put(None)
+        if self.worker_thread and self.worker_thread.is_alive():
+            self.worker_thread.join(timeout=timeout)
+        self.logger.info(f"画像アーカイブ停止 (保存: {self.stats['saved']}枚)")
+    
+    def submit(self, frame: np.ndarray, counts: Dict[str, int], camera_id: str = 'default',
+               timestamp=None) -> bool:
+        """
+        画像の保存要求（キューに積むだけで即座に戻る）
+        
+        Args:
+            frame: 保存する画像（投入後は変更しないこと）
+            counts: クラス別カウント（索引用）
+            camera_id: カメラ識別子
+            timestamp: 撮影時刻（Noneの場合は現在時刻）
+        
+        Returns:
+            bool: キューに追加できたか（満杯の場合は破棄）
+        """
+        if not self.is_running:
+            self.start()
+        
+        self.stats['submitted'] += 1
+        try:
+            self.write_queue.put_nowait((frame, dict(counts), str(camera_id), to_epoch_ms(timestamp)))
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+    
+    def flush(self, timeout: float = 10.0) -> bool:
+        """キュー内の画像を保存するまで待機"""
+        if not self.is_running:
+            return True
+        
+        done = threading.Event()
+        try:
+            self.write_queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+    
+    def _worker_loop(self):
+        """書き込みループ"""
+        connection = self._connect()
+        last_age_check = 0.0
+        try:
+            while True:
+                item = self.write_queue.get()
+                if item is None:
+                    break
+                if isinstance(item, threading.Event):
+                    item.set()
+                    continue
+                
+                try:
+                    self._archive(connection, *item)
+                    if time.monotonic() - last_age_check >= 600:
+                        self._evict_expired(connection)
+                        last_age_check = time.monotonic()
+                    self._evict_over_budget(connection)
+                except (OSError, sqlite3.Error, cv2.error) as e:
+                    self.logger.error(f"画像保存エラー: {e}")
+        finally:
+            connection.close()
+    
+    def _is_near_duplicate(self, camera_id: str, image_hash: int, timestamp: float) -> bool:
+        """同じカメラの直近画像と類似しているか（類似でなければ履歴に追加）"""
+        recent = self._recent_hashes.setdefault(camera_id, deque())
+        while recent and timestamp - recent[0][0] > self.dhash_window:
+            recent.popleft()
+        for _, recent_hash in recent:
+            if hamming_distance(image_hash, recent_hash) <= self.dhash_threshold:
+                return True
+        recent.append((timestamp, image_hash))
+        return False
+    
+    def _archive(self, connection: sqlite3.Connection, frame: np.ndarray, counts: Dict[str, int],
+                 camera_id: str, timestamp_ms: int):
+        """1枚保存（類似判定 → エンコード → 完全一致判定 → 書き込み → 索引登録）"""
+        image_hash = dhash(frame)
+        if self._is_near_duplicate(camera_id, image_hash, timestamp_ms / 1000.0):
+            self.stats['near_duplicates'] += 1
+            return
+        
+        ok, encoded = cv2.imencode(f".{self.image_format}", frame, self.encode_params)
+        if not ok:
+            raise OSError("画像エンコード失敗")
+        data = encoded.tobytes()
+        digest = hashlib.sha256(data).hexdigest()
+        
+        now_ms = to_epoch_ms(None)
+        if connection.execute("SELECT 1 FROM images WHERE sha256 = ?", (digest,)).fetchone():
+            with connection:
+                connection.execute("UPDATE images SET last_access_ms = ? WHERE sha256 = ?",
+                                   (now_ms, digest))
+            self.stats['duplicates'] += 1
+            return
+        
+        # 時刻(ミリ秒) + ハッシュ接頭辞で一意なファイル名（同一秒の上書きなし）
+        captured = from_epoch_ms(timestamp_ms)
+        directory = os.path.join(self.root_dir, captured.strftime('%Y%m%d'), captured.strftime('%H'))
+        name = f"{camera_id}_{captured.strftime('%Y%m%d_%H%M%S_%f')[:-3]}_{digest[:8]}"
+        path = os.path.join(directory, f"{name}.{self.image_format}")
+        thumbnail_path = os.path.join(directory, 'thumbs', f"{name}.jpg")
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        
+        self._write_file(path, data)
+        thumbnail_bytes = 0
+        height, width = frame.shape[:2]
+        if width > self.thumbnail_width:
+            thumbnail_height = max(int(height * self.thumbnail_width / width), 1)
+            thumbnail = cv2.resize(frame, (self.thumbnail_width, thumbnail_height),
+                                   interpolation=cv2.INTER_AREA)
+        else:
+            thumbnail = frame
+        ok, thumbnail_data = cv2.imencode('.jpg', thumbnail, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        if ok:
+            self._write_file(thumbnail_path, thumbnail_data.tobytes())
+            thumbnail_bytes = len(thumbnail_data)
+        else:
+            thumbnail_path = None
+        
+        size = len(data) + thumbnail_bytes
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO images (sha256, dhash, timestamp_ms, camera_id, path, thumbnail_path, "
+                "bytes, width, height, counts, last_access_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, _to_signed64(image_hash), timestamp_ms, camera_id, path, thumbnail_path,
+                 size, width, height, json.dumps(counts, ensure_ascii=False), now_ms)
+            )
+            connection.executemany(
+                "INSERT INTO image_classes (image_id, class_name, count) VALUES (?, ?, ?)",
+                [(cursor.lastrowid, class_name, count) for class_name, count in counts.items() if count]
+            )
+        self.total_bytes += size
+        self.stats['saved'] += 1
+    
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        """一時ファイル経由で書き込み（途中で停止しても壊れたファイルを残さない）"""
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+    
+    def _delete(self, connection: sqlite3.Connection, rows: List):
+        """索引から削除してからファイルを削除"""
+        if not rows:
+            return
+        with connection:
+            connection.executemany("DELETE FROM images WHERE id = ?", [(row[0],) for row in rows])
+        for _, path, thumbnail_path, size in rows:
+            for file_path in (path, thumbnail_path):
+                if file_path:
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+            self.total_bytes -= size
+        self.stats['evicted'] += len(rows)
+    
+    def _evict_expired(self, connection: sqlite3.Connection):
+        """保存期間を過ぎた画像の削除"""
+        if not self.max_age_days:
+            return
+        cutoff = to_epoch_ms(None) - int(self.max_age_days * 86400 * 1000)
+        rows = connection.execute(
+            "SELECT id, path, thumbnail_path, bytes FROM images WHERE timestamp_ms < ?", (cutoff,)
+        ).fetchall()
+        self._delete(connection, rows)
+    
+    def _evict_over_budget(self, connection: sqlite3.Connection):
+        """容量上限超過時に最終参照が古い順に削除（上限の90%まで）"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        rows = []
+        excess = self.total_bytes - target
+        for row in connection.execute(
+                "SELECT id, path, thumbnail_path, bytes FROM images ORDER BY last_access_ms, id"):
+            rows.append(row)
+            excess -= row[3]
+            if excess <= 0:
+                break
+        self._delete(connection, rows)
+    
+    def query(self, since=None, until=None, camera_id: Optional[str] = None,
+              class_name: Optional[str] = None, limit: int = 100, touch: bool = True) -> List[Dict]:
+        """
+        画像検索（新しい順）
+        
+        Args:
+            since: 開始時刻
+            until: 終了時刻
+            camera_id: カメラ識別子
+            class_name: このクラスを含む画像のみ
+            limit: 最大件数
+            touch: 最終参照時刻を更新するか（容量超過時の削除順に影響）
+        
+        Returns:
+            List[Dict]: 画像情報（パス・サムネイル・カウントなど）
+        """
+        sql = ("SELECT images.id, timestamp_ms, camera_id, path, thumbnail_path, width, height, counts "
+               "FROM images")
+        conditions = []
+        params = []
+        if class_name is not None:
+            sql += " JOIN image_classes ON image_classes.image_id = images.id"
+            conditions.append("image_classes.class_name = ?")
+            params.append(class_name)
+        if since is not None:
+            conditions.append("timestamp_ms > ?")
+            params.append(to_epoch_ms(since))
+        if until is not None:
+            conditions.append("timestamp_ms <= ?")
+            params.append(to_epoch_ms(until))
+        if camera_id is not None:
+            conditions.append("camera_id = ?")
+            params.append(str(camera_id))
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp_ms DESC LIMIT ?"
+        params.append(int(limit))
+        
+        connection = self._connect()
+        try:
+            rows = connection.execute(sql, params).fetchall()
+            if touch and rows:
+                with connection:
+                    connection.executemany(
+                        "UPDATE images SET last_access_ms = ? WHERE id = ?",
+                        [(to_epoch_ms(None), row[0]) for row in rows]
+                    )
+        finally:
+            connection.close()
+        
+        return [
+            {
+                'timestamp': from_epoch_ms(timestamp_ms).isoformat(),
+                'camera_id': camera,
+                'path': path,
+                'thumbnail_path': thumbnail_path,
+                'width': width,
+                'height': height,
+                'counts': json.loads(counts)
+            }
+            for _, timestamp_ms, camera, path, thumbnail_path, width, height, counts in rows
+        ]
+    
+    def get_stats(self) -> Dict:
+        """統計情報取得"""
+        stats = dict(self.stats)
+        stats['queued'] = self.write_queue.qsize()
+        stats['total_bytes'] = self.total_bytes
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+if __name__ == "__main__":
+    import tempfile
+    
+    # 静止シーン中心の300フレーム（時々物体が移動）を容量上限0.3MBで保存
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8), (31, 31), 0)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        archive = ImageArchive(root_dir=directory, max_bytes=300 * 1024, dhash_window=60.0,
+                               max_queue=300)
+        start_time = time.time() - 300
+        submit_ms = 0.0
+        for i in range(300):
+            frame = background.copy()
+            if i % 50 < 10:
+                x = 100 + (i % 50) * 100
+                cv2.rectangle(frame, (x, 200), (x + 200, 500), (20, 20, 20), -1)
+            begin = time.perf_counter()
+            archive.submit(frame, {'car': 1 + i % 50 // 10}, camera_id='cam0',
+                           timestamp=start_time + i)
+            submit_ms += (time.perf_counter() - begin) * 1000
+            time.sleep(0.002)
+        archive.flush(timeout=60.0)
+        
+        stats = archive.get_stats()
+        files = sum(len(names) for _, _, names in os.walk(directory))
+        print(f"投入: {stats['submitted']}枚 (平均 {submit_ms / 300:.3f} ms/枚, 破棄 {stats['dropped']})")
+        print(f"保存: {stats['saved']}枚 / 類似除外: {stats['near_duplicates']} / "
+              f"完全一致: {stats['duplicates']} / 容量超過で削除: {stats['evicted']}")
+        print(f"使用容量: {stats['total_bytes'] / 1024 ** 2:.2f}MB / 上限 {stats['max_bytes'] / 1024 ** 2:.1f}MB "
+              f"(ファイル数 {files})")
+        print("car=3 の画像:", [entry['path'].split(os.sep)[-1]
+                               for entry in archive.query(class_name='car', limit=3)])
+        archive.stop()
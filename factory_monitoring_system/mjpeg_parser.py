@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - MJPEGストリーム分離処理
+multipart/x-mixed-replace ストリームからJPEGをコピーなしで逐次抽出
+"""
+
+import re
+import time
+import logging
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# 1回の読み込みサイズ（従来の1KBから拡大）
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# JPEGマーカー
+JPEG_SOI = b'\xff\xd8'
+JPEG_EOI = b'\xff\xd9'
+
+HEADER_END = b'\r\n\r\n'
+_BOUNDARY_RE = re.compile(r'boundary="?([^";,]+)"?', re.IGNORECASE)
+_CONTENT_LENGTH_RE = re.compile(rb'content-length\s*:\s*(\d+)', re.IGNORECASE)
+
+
+def parse_boundary(content_type: Optional[str]) -> Optional[bytes]:
+    """
+    Content-Typeヘッダーからmultipart境界文字列を取得
+    
+    Args:
+        content_type: 例 "multipart/x-mixed-replace; boundary=--myboundary"
+    
+    Returns:
+        Optional[bytes]: 先頭の"--"を除いた境界文字列
+    """
+    if not content_type:
+        return None
+    
+    match = _BOUNDARY_RE.search(content_type)
+    if not match:
+        return None
+    
+    # カメラによっては境界自体に"--"を含めて宣言するため正規化
+    boundary = match.group(1).strip().lstrip('-')
+    return boundary.encode('ascii', 'ignore') or None
+
+
+class MJPEGDemuxer:
+    """MJPEGストリーム分離クラス（bytearray + memoryview）"""
+    
+    def __init__(self, boundary: Optional[bytes] = None):
+        """
+        初期化
+        
+        Args:
+            boundary: multipart境界（Noneの場合はJPEGマーカーで分割）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.buffer = bytearray()
+        
+        # 境界区切り（"--" + boundary）
+        self.delimiter = b'--' + boundary if boundary else None
+        
+        # 解析位置（バッファ全体を再走査しないよう保持）
+        self._pos = 0
+        self._scan_pos = 0
+        self._payload_start = -1
+        self._content_length = None
+        
+        # 統計情報
+        self.frames = 0
+        self.bytes_received = 0
+    
+    @classmethod
+    def from_content_type(cls, content_type: Optional[str]) -> 'MJPEGDemuxer':
+        """Content-Typeヘッダーから生成"""
+        return cls(parse_boundary(content_type))
+    
+    def feed(self, chunk: bytes) -> Iterator[memoryview]:
+        """
+        受信データ投入
+        
+        返されるmemoryviewは内部バッファへの参照のため、
+        次のfeed呼び出しまでに（デコード等で）消費すること。
+        
+        Args:
+            chunk: 受信データ
+        
+        Yields:
+            memoryview: JPEGデータ
+        """
+        if chunk:
+            self.buffer += chunk
+            self.bytes_received += len(chunk)
+        
+        while True:
+            span = self._next_payload()
+            if span is None:
+                break
+            
+            start, end = span
+            view = memoryview(self.buffer)[start:end]
+            try:
+                self.frames += 1
+                yield view
+            finally:
+                view.release()
+        
+        self._compact()
+    
+    def _next_payload(self) -> Optional[Tuple[int, int]]:
+        """次のJPEGデータ範囲を取得"""
+        if self.delimiter is None:
+            return self._next_by_markers()
+        return self._next_by_boundary()
+    
+    def _next_by_boundary(self) -> Optional[Tuple[int, int]]:
+        """multipart境界とContent-Lengthによる分割"""
+        buffer = self.buffer
+        delimiter = self.delimiter
+        
+        if self._payload_start < 0:
+            # パートヘッダー開始位置検索
+            part_start = buffer.find(delimiter, self._pos)
+            if part_start < 0:
+                self._pos = max(self._pos, len(buffer) - len(delimiter) + 1)
+                return None
+            
+            header_end = buffer.find(HEADER_END, part_start)
+            if header_end < 0:
+                self._pos = part_start
+                return None
+            
+            # ヘッダー部分のみ小さくコピーして解析
+            headers = bytes(buffer[part_start + len(delimiter):header_end])
+            match = _CONTENT_LENGTH_RE.search(headers)
+            self._content_length = int(match.group(1)) if match else None
+            self._payload_start = header_end + len(HEADER_END)
+            self._scan_pos = self._payload_start
+        
+        start = self._payload_start
+        
+        if self._content_length is not None:
+            end = start + self._content_length
+            if len(buffer) < end:
+                return None
+        else:
+            # Content-Lengthなし: 次の境界まで
+            next_part = buffer.find(delimiter, self._scan_pos)
+            if next_part < 0:
+                self._scan_pos = max(start, len(buffer) - len(delimiter) + 1)
+                return None
+            end = next_part
+            if buffer[end - 2:end] == b'\r\n':
+                end -= 2
+        
+        self._pos = end
+        self._payload_start = -1
+        self._content_length = None
+        return start, end
+    
+    def _next_by_markers(self) -> Optional[Tuple[int, int]]:
+        """JPEG開始/終了マーカーによる分割（境界不明時）"""
+        buffer = self.buffer
+        
+        if self._payload_start < 0:
+            start = buffer.find(JPEG_SOI, self._pos)
+            if start < 0:
+                self._pos = max(self._pos, len(buffer) - 1)
+                return None
+            self._payload_start = start
+            self._scan_pos = start + len(JPEG_SOI)
+        
+        end = buffer.find(JPEG_EOI, self._scan_pos)
+        if end < 0:
+            self._scan_pos = max(self._scan_pos, len(buffer) - 1)
+            return None
+        
+        start = self._payload_start
+        end += len(JPEG_EOI)
+        self._pos = end
+        self._payload_start = -1
+        return start, end
+    
+    def _compact(self):
+        """処理済みデータをバッファ先頭から削除"""
+        consumed = self._pos if self._payload_start < 0 else min(self._pos, self._payload_start)
+        if consumed <= 0:
+            return
+        
+        try:
+            del self.buffer[:consumed]
+        except BufferError:
+            # 呼び出し側がmemoryviewを保持している場合は新しいバッファへ移す
+            self.buffer = bytearray(memoryview(self.buffer)[consumed:])
+        
+        self._pos -= consumed
+        self._scan_pos = max(0, self._scan_pos - consumed)
+        if self._payload_start >= 0:
+            self._payload_start -= consumed
+    
+    def reset(self):
+        """状態リセット"""
+        self.buffer = bytearray()
+        self._pos = 0
+        self._scan_pos = 0
+        self._payload_start = -1
+        self._content_length = None
+
+
+def iter_mjpeg_frames(response, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[memoryview]:
+    """
+    requestsのストリーミングレスポンスからJPEGデータを逐次取得
+    
+    Args:
+        response: requests.get(..., stream=True) のレスポンス
+        chunk_size: 1回の読み込みサイズ
+    
+    Yields:
+        memoryview: JPEGデータ（次の要素取得前に消費すること）
+    """
+    demuxer = MJPEGDemuxer.from_content_type(response.headers.get('content-type'))
+    
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        yield from demuxer.feed(chunk)
+
+
+def decode_jpeg(jpeg: memoryview) -> Optional[np.ndarray]:
+    """JPEGデータをコピーなしでデコード"""
+    import cv2
+    
+    return cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def _legacy_split(chunks) -> int:
+    """従来方式（bytes連結 + 毎回全体走査）のフレーム分割"""
+    buffer = b''
+    frames = 0
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            start = buffer.find(JPEG_SOI)
+            end = buffer.find(JPEG_EOI)
+            if start != -1 and end != -1 and end > start:
+                buffer = buffer[end + 2:]
+                frames += 1
+            else:
+                break
+    return frames
+
+
+def _build_sample_capture(frame_count: int = 200, frame_size: int = 60000,
+                          boundary: bytes = b'myboundary') -> bytes:
+    """ベンチマーク用のmultipartキャプチャ生成"""
+    rng = np.random.default_rng(0)
+    parts = []
+    for _ in range(frame_count):
+        body = rng.integers(0, 0xfe, frame_size, dtype=np.uint8).tobytes()
+        jpeg = JPEG_SOI + body + JPEG_EOI
+        parts.append(
+            b'--' + boundary + b'\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n'
+        )
+    return b''.join(parts)
+
+
+def run_benchmark(capture: bytes, content_type: Optional[str]):
+    """分割スループット比較（従来方式 vs MJPEGDemuxer）"""
+    def chunked(data: bytes, size: int):
+        view = memoryview(data)
+        return [bytes(view[i:i + size]) for i in range(0, len(data), size)]
+    
+    megabytes = len(capture) / (1024 * 1024)
+    
+    legacy_chunks = chunked(capture, 1024)
+    start = time.perf_counter()
+    legacy_frames = _legacy_split(legacy_chunks)
+    legacy_time = time.perf_counter() - start
+    
+    demuxer = MJPEGDemuxer.from_content_type(content_type)
+    start = time.perf_counter()
+    new_frames = 0
+    for chunk in chunked(capture, DEFAULT_CHUNK_SIZE):
+        for _ in demuxer.feed(chunk):
+            new_frames += 1
+    new_time = time.perf_counter() - start
+    
+    print(f"キャプチャサイズ: {megabytes:.1f} MB")
+    print(f"従来方式 (1KB, bytes連結): {legacy_frames}フレーム "
+          f"{legacy_time:.3f}秒 ({megabytes / legacy_time:.1f} MB/s)")
+    print(f"MJPEGDemuxer (64KB, memoryview): {new_frames}フレーム "
+          f"{new_time:.3f}秒 ({megabytes / new_time:.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    import sys
+    
+    # 使い方: python mjpeg_parser.py [録画したmultipartファイル] [境界文字列]
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as f:
+            capture_data = f.read()
+        boundary_arg = sys.argv[2] if len(sys.argv) > 2 else None
+        header = f"multipart/x-mixed-replace; boundary={boundary_arg}" if boundary_arg else None
+        print(f"録画キャプチャ: {sys.argv[1]}")
+    else:
+        capture_data = _build_sample_capture()
+        header = "multipart/x-mixed-replace; boundary=myboundary"
+        print("合成キャプチャ: 200フレーム x 60KB")
+    
+    run_benchmark(capture_data, header)
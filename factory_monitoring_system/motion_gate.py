@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 動き検出ゲート
+縮小グレースケール差分で動きのないフレームの推論をスキップ
+"""
+
+import time
+import logging
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from config import MOTION_CONFIG
+
+
+class MotionGate:
+    """フレーム差分による推論ゲート（カメラ毎に1つ）"""
+    
+    def __init__(self, downscale_width: Optional[int] = None,
+                 pixel_threshold: Optional[int] = None,
+                 min_changed_ratio: Optional[float] = None,
+                 max_staleness: Optional[float] = None):
+        """
+        初期化
+        
+        Args:
+            downscale_width: 差分計算用の縮小幅
+            pixel_threshold: 画素変化とみなす輝度差
+            min_changed_ratio: 推論を行う変化画素率
+            max_staleness: 強制推論までの最大秒数
+        """
+        self.logger = logging.getLogger(__name__)
+        self.downscale_width = downscale_width or MOTION_CONFIG['downscale_width']
+        self.pixel_threshold = (MOTION_CONFIG['pixel_threshold'] if pixel_threshold is None
+                                else pixel_threshold)
+        self.min_changed_ratio = (MOTION_CONFIG['min_changed_ratio'] if min_changed_ratio is None
+                                  else min_changed_ratio)
+        self.max_staleness = (MOTION_CONFIG['max_staleness'] if max_staleness is None
+                              else max_staleness)
+        
+        # 最後に推論したフレーム（縮小グレースケール）と結果
+        self.reference = None
+        self.reference_time = 0.0
+        self.last_result = None
+        self.last_motion_ratio = 0.0
+        
+        # 統計情報
+        self.stats = {
+            'frames': 0,
+            'inferred': 0,
+            'skipped': 0,
+            'motion_triggered': 0,
+            'staleness_triggered': 0
+        }
+    
+    def _preprocess(self, frame: np.ndarray) -> np.ndarray:
+        """縮小・グレースケール化・平滑化（ノイズによる誤検出抑制）"""
+        height, width = frame.shape[:2]
+        if width > self.downscale_width:
+            small_height = max(int(height * self.downscale_width / width), 1)
+            frame = cv2.resize(frame, (self.downscale_width, small_height),
+                               interpolation=cv2.INTER_AREA)
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(frame, (5, 5), 0)
+    
+    def should_infer(self, frame: np.ndarray) -> bool:
+        """
+        推論要否の判定（推論する場合は基準フレームを更新）
+        
+        Args:
+            frame: 入力フレーム
+        
+        Returns:
+            bool: 推論が必要か（Falseの場合は last_result を再利用）
+        """
+        now = time.monotonic()
+        small = self._preprocess(frame)
+        self.stats['frames'] += 1
+        
+        reason = None
+        if self.reference is None or self.reference.shape != small.shape:
+            reason = 'initial'
+        else:
+            # 前回推論時のフレームとの差分（ゆっくりした変化も蓄積して検出）
+            diff = cv2.absdiff(small, self.reference)
+            changed = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255,
+                                                     cv2.THRESH_BINARY)[1])
+            self.last_motion_ratio = changed / float(small.size)
+            
+            if self.last_motion_ratio >= self.min_changed_ratio:
+                reason = 'motion_triggered'
+            elif now - self.reference_time >= self.max_staleness:
+                reason = 'staleness_triggered'
+            elif self.last_result is None:
+                reason = 'initial'
+        
+        if reason is None:
+            self.stats['skipped'] += 1
+            return False
+        
+        if reason != 'initial':
+            self.stats[reason] += 1
+        self.stats['inferred'] += 1
+        self.reference = small
+        self.reference_time = now
+        return True
+    
+    def store(self, result: Any):
+        """推論結果の保持（スキップ時に再利用）"""
+        self.last_result = result
+    
+    def reset(self):
+        """基準フレーム・結果の破棄（カメラ切替時など）"""
+        self.reference = None
+        self.last_result = None
+    
+    def get_stats(self) -> Dict:
+        """統計情報取得"""
+        stats = dict(self.stats)
+        stats['skip_ratio'] = stats['skipped'] / stats['frames'] if stats['frames'] else 0.0
+        stats['last_motion_ratio'] = self.last_motion_ratio
+        return stats
+
+
+def create_motion_gate() -> Optional[MotionGate]:
+    """設定に応じてゲート生成（無効時はNone）"""
+    if not MOTION_CONFIG['enable_motion_gate']:
+        return None
+    return MotionGate()
+
+
+if __name__ == "__main__":
+    # 静止した倉庫映像に一時的な動きが入る場面を想定
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 255, (1080, 1920, 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(background, (31, 31), 0)
+    gate = MotionGate(max_staleness=2.0)
+    
+    gate_time = 0.0
+    for i in range(300):
+        frame = background.copy()
+        # センサーノイズ
+        frame = cv2.add(frame, rng.integers(0, 6, frame.shape, dtype=np.uint8))
+        # 100〜130フレーム目にフォークリフトが通過
+        if 100 <= i < 130:
+            x = 200 + (i - 100) * 40
+            cv2.rectangle(frame, (x, 500), (x + 300, 800), (20, 20, 20), -1)
+        start = time.perf_counter()
+        if gate.should_infer(frame):
+            gate.store(i)
+        gate_time += time.perf_counter() - start
+    
+    stats = gate.get_stats()
+    print(f"判定コスト: {gate_time * 1000 / stats['frames']:.2f} ms/フレーム")
+    print(f"推論: {stats['inferred']} / スキップ: {stats['skipped']} "
+          f"(スキップ率 {stats['skip_ratio']:.0%})")
+    print(f"動き起因: {stats['motion_triggered']} / 経過時間起因: {stats['staleness_triggered']}")
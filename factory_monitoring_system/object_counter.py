@@ -9,13 +9,18 @@ import cv2
 import numpy as np
 import json
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 from collections import defaultdict, deque
 from typing import Dict, List, Tuple, Optional, Set
 import logging
 from dataclasses import dataclass
 
-from config import PRODUCT_MASTER, INVENTORY_ALERTS
+from config import PRODUCT_MASTER, INVENTORY_ALERTS, TRACKING_CONFIG
+from detection_results import DetectionArray
+from object_tracker import ObjectTracker, TrackUpdate
+from zone_map import ZoneLabelMap, ZoneOverlay
+from timeseries_store import CountRingBuffer
+from rolling_stats import RollingStats
 
 
 @dataclass
@@ -39,6 +44,89 @@ class CountingZone:
     enabled: bool = True
 
 
+class SpatialDedupIndex:
+    """クラス別空間グリッド索引（近傍セルのみ比較・時刻で失効）"""
+    
+    def __init__(self, radius: float = 50.0, ttl: float = 1.0):
+        """
+        初期化
+        
+        Args:
+            radius: 同一物体とみなす中心間距離（ピクセル、セル幅を兼ねる）
+            ttl: 同一物体とみなす時間差（秒）
+        """
+        self.radius = radius
+        self.ttl = ttl
+        self._radius_sq = radius * radius
+        
+        # (クラス名, セルX, セルY) -> deque[(x, y, 時刻)]（挿入順 = 時刻順）
+        self.cells = {}
+        # 失効処理用の挿入順キュー (時刻, セルキー)
+        self._expiry = deque()
+    
+    def __len__(self) -> int:
+        return len(self._expiry)
+    
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        """座標 -> セル番号"""
+        return int(x // self.radius), int(y // self.radius)
+    
+    def evict(self, now: float):
+        """ttlを過ぎたエントリを削除"""
+        expire_before = now - self.ttl
+        while self._expiry and self._expiry[0][0] <= expire_before:
+            _, key = self._expiry.popleft()
+            entries = self.cells[key]
+            entries.popleft()
+            if not entries:
+                del self.cells[key]
+    
+    def contains_near(self, class_name: str, x: float, y: float, timestamp: float) -> bool:
+        """同一クラスの近傍（3x3セル）に有効なエントリがあるか"""
+        cell_x, cell_y = self._cell(x, y)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                entries = self.cells.get((class_name, cell_x + dx, cell_y + dy))
+                if not entries:
+                    continue
+                for ex, ey, et in entries:
+                    if ((ex - x) ** 2 + (ey - y) ** 2 < self._radius_sq and
+                            abs(timestamp - et) < self.ttl):
+                        return True
+        return False
+    
+    def insert(self, class_name: str, x: float, y: float, timestamp: float):
+        """エントリ追加"""
+        key = (class_name,) + self._cell(x, y)
+        entries = self.cells.get(key)
+        if entries is None:
+            entries = self.cells[key] = deque()
+        entries.append((x, y, timestamp))
+        self._expiry.append((timestamp, key))
+    
+    def filter_new(self, class_names: List[str], centers: List[Tuple[float, float]],
+                   timestamp: float) -> List[bool]:
+        """
+        既存エントリと重複しない検出を判定し、索引に追加
+        
+        Args:
+            class_names: 検出のクラス名
+            centers: 検出の中心座標
+            timestamp: 検出時刻（UNIX秒）
+        
+        Returns:
+            List[bool]: 新規検出か（同一フレーム内の検出同士は比較しない）
+        """
+        self.evict(timestamp)
+        
+        is_new = [not self.contains_near(class_name, x, y, timestamp)
+                  for class_name, (x, y) in zip(class_names, centers)]
+        for new, class_name, (x, y) in zip(is_new, class_names, centers):
+            if new:
+                self.insert(class_name, x, y, timestamp)
+        return is_new
+
+
 class AdvancedObjectCounter:
     """高度な物体カウントシステム"""
     
@@ -47,15 +135,24 @@ class AdvancedObjectCounter:
         self.logger = logging.getLogger(__name__)
         
         # カウント履歴
-        self.count_history = deque(maxlen=1000)
+        self.count_history = CountRingBuffer(1000)
+        self.rolling_stats = RollingStats()
         self.current_counts = defaultdict(int)
-        self.object_buffer = deque(maxlen=100)  # 最近検出された物体
+        
+        # 重複除去用（直近1秒・50px以内の同一クラスを同一物体とみなす）
+        self.dedup_index = SpatialDedupIndex(radius=50.0, ttl=1.0)
         
         # カウントゾーン
         self.counting_zones = []
+        self.zone_map = None
+        self.zone_overlay = None
+        self.zone_counts = {}
         
         # 重複除去用
         self.processed_objects = set()
+        
+        # 物体追跡（object_id -> 最新のDetectedObject）
+        self.tracker = ObjectTracker() if TRACKING_CONFIG['enable_tracking'] else None
         self.object_tracking = {}
         
         # 統計情報
@@ -71,13 +168,26 @@ class AdvancedObjectCounter:
     def add_counting_zone(self, zone: CountingZone):
         """カウントゾーン追加"""
         self.counting_zones.append(zone)
+        self.invalidate_zone_map()
         self.logger.info(f"カウントゾーン追加: {zone.name}")
     
     def remove_counting_zone(self, zone_name: str):
         """カウントゾーン削除"""
-        self.counting_zones = [z for z in self.counting_zones if z.name != zone_name]
+        self.counting_zones[:] = [z for z in self.counting_zones if z.name != zone_name]
+        self.invalidate_zone_map()
         self.logger.info(f"カウントゾーン削除: {zone_name}")
     
+    def invalidate_zone_map(self):
+        """ゾーンラベルラスタ・表示レイヤー破棄（ゾーンのポリゴン・対象クラスを変更した場合に呼び出す）"""
+        self.zone_map = None
+        self.zone_overlay = None
+    
+    def _get_zone_map(self) -> ZoneLabelMap:
+        """ゾーンラベルラスタ取得（ゾーン変更後の初回のみ作成）"""
+        if self.zone_map is None:
+            self.zone_map = ZoneLabelMap(self.counting_zones)
+        return self.zone_map
+    
     def count_objects_in_frame(self, detections: List[DetectedObject]) -> Dict[str, int]:
         """
         フレーム内の物体カウント
@@ -96,7 +206,7 @@ class AdvancedObjectCounter:
                 frame_counts[obj.class_name] += 1
         
         # ゾーン別カウント
-        zone_counts = self._count_objects_in_zones(detections)
+        self.zone_counts = self._count_objects_in_zones(detections)
         
         # 重複除去処理
         filtered_counts = self._remove_duplicates(frame_counts, detections)
@@ -109,6 +219,78 @@ class AdvancedObjectCounter:
         
         return dict(filtered_counts)
     
+    def count_objects_in_array(self, detections: DetectionArray) -> Dict[str, int]:
+        """
+        検出結果配列から直接カウント（追跡有効時は追跡中の物体数）
+        
+        Args:
+            detections: FactoryMonitor.detect() の検出結果
+        
+        Returns:
+            Dict[str, int]: クラス別カウント結果
+        """
+        if self.tracker is not None:
+            # 低信頼度検出も追跡の2段目対応付けに使用
+            candidates = detections.filter(
+                min_conf=self.tracker.low_threshold,
+                class_names=self._inventory_class_names(),
+                min_area=100,
+                max_area=500000
+            )
+            return self._apply_track_update(self.tracker.update(candidates))
+        
+        valid = detections.filter(
+            min_conf=0.5,
+            class_names=self._inventory_class_names(),
+            min_area=100,
+            max_area=500000
+        )
+        
+        # 重複除去は有効な検出のみ対象（DetectedObjectを生成せず配列から直接判定）
+        class_names = valid.class_names
+        centers = valid.centers
+        self.zone_counts = self._count_centers_in_zones(class_names, centers)
+        is_new = self.dedup_index.filter_new(class_names, centers.tolist(), time.time())
+        filtered_counts = defaultdict(int)
+        for new, class_name in zip(is_new, class_names):
+            if new:
+                filtered_counts[class_name] += 1
+        
+        self._update_count_history(filtered_counts)
+        self._update_statistics(filtered_counts)
+        
+        return dict(filtered_counts)
+    
+    def advance_tracks(self) -> Dict[str, int]:
+        """
+        推論しなかったフレームで追跡を予測のみ進める
+        
+        Returns:
+            Dict[str, int]: 追跡中物体のクラス別カウント
+        """
+        if self.tracker is None:
+            return dict(self.current_counts)
+        return self._apply_track_update(self.tracker.coast())
+    
+    def _apply_track_update(self, update: TrackUpdate) -> Dict[str, int]:
+        """追跡結果からカウント・統計を更新（累計は新規確定した物体のみ加算）"""
+        counts = update.class_counts()
+        self.zone_counts = self._count_centers_in_zones(update.detections.class_names,
+                                                        update.detections.centers)
+        self.object_tracking = {obj.object_id: obj for obj in update.to_detected_objects()}
+        
+        self._update_count_history(counts)
+        self._update_statistics(counts, update.new_class_counts())
+        
+        return counts
+    
+    def _inventory_class_names(self) -> Set[str]:
+        """在庫カウント対象のクラス名"""
+        return {
+            class_name for class_name, product_info in PRODUCT_MASTER.items()
+            if product_info.get('count_as_inventory', True)
+        }
+    
     def _is_valid_detection(self, obj: DetectedObject) -> bool:
         """検出の有効性チェック"""
         # 信頼度チェック
@@ -132,94 +314,53 @@ class AdvancedObjectCounter:
     
     def _count_objects_in_zones(self, detections: List[DetectedObject]) -> Dict[str, Dict[str, int]]:
         """ゾーン別物体カウント"""
-        zone_counts = {}
-        
-        for zone in self.counting_zones:
-            if not zone.enabled:
-                continue
-            
-            zone_count = defaultdict(int)
-            
-            for obj in detections:
-                if obj.class_name in zone.target_classes:
-                    if self._point_in_polygon(obj.center, zone.polygon):
-                        zone_count[obj.class_name] += 1
-            
-            zone_counts[zone.name] = dict(zone_count)
-        
-        return zone_counts
-    
-    def _point_in_polygon(self, point: Tuple[int, int], polygon: List[Tuple[int, int]]) -> bool:
-        """点がポリゴン内にあるかチェック"""
-        x, y = point
-        n = len(polygon)
-        inside = False
-        
-        p1x, p1y = polygon[0]
-        for i in range(1, n + 1):
-            p2x, p2y = polygon[i % n]
-            if y > min(p1y, p2y):
-                if y <= max(p1y, p2y):
-                    if x <= max(p1x, p2x):
-                        if p1y != p2y:
-                            xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                        if p1x == p2x or x <= xinters:
-                            inside = not inside
-            p1x, p1y = p2x, p2y
-        
-        return inside
+        return self._count_centers_in_zones(
+            [obj.class_name for obj in detections],
+            [obj.center for obj in detections]
+        )
+    
+    def _count_centers_in_zones(self, class_names: List[str], centers) -> Dict[str, Dict[str, int]]:
+        """ゾーン別物体カウント（ラベルラスタで全検出を一括判定）"""
+        if not self.counting_zones:
+            return {}
+        return self._get_zone_map().count(class_names, np.asarray(centers).reshape(-1, 2))
     
     def _remove_duplicates(self, counts: Dict[str, int], detections: List[DetectedObject]) -> Dict[str, int]:
-        """重複検出除去"""
-        # 単純な重複除去（位置ベース）
-        filtered_detections = []
-        
-        for obj in detections:
-            is_duplicate = False
-            
-            # 既存の検出と比較
-            for existing in self.object_buffer:
-                if (obj.class_name == existing.class_name and 
-                    self._calculate_distance(obj.center, existing.center) < 50 and
-                    abs((obj.timestamp - existing.timestamp).total_seconds()) < 1.0):
-                    is_duplicate = True
-                    break
-            
-            if not is_duplicate:
-                filtered_detections.append(obj)
-        
-        # バッファ更新
-        self.object_buffer.extend(filtered_detections)
+        """重複検出除去（空間グリッド索引で近傍セルのみ比較）"""
+        filtered_counts = defaultdict(int)
+        if not detections:
+            return filtered_counts
+        
+        # 同一フレームの検出は同時刻として扱う
+        timestamp = detections[0].timestamp.timestamp()
+        is_new = self.dedup_index.filter_new(
+            [obj.class_name for obj in detections],
+            [obj.center for obj in detections],
+            timestamp
+        )
         
         # フィルター後のカウント
-        filtered_counts = defaultdict(int)
-        for obj in filtered_detections:
-            if self._is_valid_detection(obj):
+        for new, obj in zip(is_new, detections):
+            if new and self._is_valid_detection(obj):
                 filtered_counts[obj.class_name] += 1
         
         return filtered_counts
     
-    def _calculate_distance(self, point1: Tuple[int, int], point2: Tuple[int, int]) -> float:
-        """2点間の距離計算"""
-        return np.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2)
-    
     def _update_count_history(self, counts: Dict[str, int]):
         """カウント履歴更新"""
-        history_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'counts': dict(counts),
-            'total': sum(counts.values())
-        }
-        
-        self.count_history.append(history_entry)
+        self.count_history.append(counts)
+        self.rolling_stats.add(counts)
         self.current_counts = counts.copy()
     
-    def _update_statistics(self, counts: Dict[str, int]):
-        """統計情報更新"""
-        self.session_stats['total_detections'] += sum(counts.values())
+    def _update_statistics(self, counts: Dict[str, int],
+                           new_counts: Optional[Dict[str, int]] = None):
+        """統計情報更新（new_counts指定時は累計に新規物体数のみ加算）"""
+        totals = counts if new_counts is None else new_counts
+        self.session_stats['total_detections'] += sum(totals.values())
+        for class_name, count in totals.items():
+            self.session_stats['class_totals'][class_name] += count
         
         for class_name, count in counts.items():
-            self.session_stats['class_totals'][class_name] += count
             if count > self.session_stats['peak_counts'][class_name]:
                 self.session_stats['peak_counts'][class_name] = count
     
@@ -230,6 +371,7 @@ class AdvancedObjectCounter:
             'current_counts': dict(self.current_counts),
             'total_items': sum(self.current_counts.values()),
             'by_category': defaultdict(int),
+            'zone_counts': dict(self.zone_counts),
             'alerts': []
         }
         
@@ -240,48 +382,72 @@ class AdvancedObjectCounter:
                 summary['by_category'][category] += count
         
         # アラートチェック
+        summary['alerts'] = self.get_inventory_alerts()
+        
+        return summary
+    
+    def get_inventory_alerts(self) -> List[Dict]:
+        """在庫アラート取得（現在のカウントがしきい値以下のクラス）"""
+        alerts = []
         for class_name, count in self.current_counts.items():
             if class_name in INVENTORY_ALERTS['alert_thresholds']:
                 threshold = INVENTORY_ALERTS['alert_thresholds'][class_name]
                 if count <= threshold:
-                    summary['alerts'].append({
+                    alerts.append({
                         'class_name': class_name,
                         'current_count': count,
                         'threshold': threshold,
                         'severity': 'warning' if count > 0 else 'critical'
                     })
-        
-        return summary
+        return alerts
     
     def get_trend_analysis(self, hours: int = 24) -> Dict:
-        """トレンド分析"""
-        cutoff_time = datetime.now() - timedelta(hours=hours)
+        """トレンド分析（1h/24h/7dはローリング統計から定数時間で応答）"""
+        summary = self.rolling_stats.summary(hours)
+        if summary is not None:
+            if summary['samples'] == 0:
+                return {}
+            
+            trends = {}
+            if summary['samples'] > 1:
+                for class_name, values in summary['classes'].items():
+                    slope = values['trend_slope']
+                    trends[class_name] = dict(
+                        values,
+                        trend_direction='increasing' if slope > 0.1 else 'decreasing' if slope < -0.1 else 'stable'
+                    )
+            
+            return {
+                'period_hours': hours,
+                'analysis_time': datetime.now().isoformat(),
+                'trends': trends,
+                'total_records': summary['samples']
+            }
         
-        # 指定時間内の履歴を抽出
-        recent_history = [
-            entry for entry in self.count_history
-            if datetime.fromisoformat(entry['timestamp']) > cutoff_time
-        ]
+        # 指定時間内の履歴を抽出（タイムスタンプ列の二分探索）
+        timestamps, values = self.count_history.window(since=time.time() - hours * 3600)
         
-        if not recent_history:
+        if len(timestamps) == 0:
             return {}
         
         # トレンド計算
         trends = {}
         
-        for class_name in set().union(*[entry['counts'].keys() for entry in recent_history]):
-            counts = [entry['counts'].get(class_name, 0) for entry in recent_history]
+        if len(timestamps) > 1:
+            # 線形回帰による傾向（全クラスの傾きを最小二乗の閉形式で一括計算）
+            x = np.arange(len(timestamps), dtype=np.float64)
+            x -= x.mean()
+            slopes = (x @ values) / (x @ x)
             
-            if len(counts) > 1:
-                # 線形回帰による傾向
-                x = np.arange(len(counts))
-                slope = np.polyfit(x, counts, 1)[0]
+            for class_name in self.count_history.active_columns(values):
+                counts = self.count_history.column(values, class_name)
+                slope = float(slopes[self.count_history.columns.index(class_name)])
                 
                 trends[class_name] = {
-                    'current': counts[-1],
-                    'average': np.mean(counts),
-                    'max': max(counts),
-                    'min': min(counts),
+                    'current': int(counts[-1]),
+                    'average': float(counts.mean()),
+                    'max': int(counts.max()),
+                    'min': int(counts.min()),
                     'trend_slope': slope,
                     'trend_direction': 'increasing' if slope > 0.1 else 'decreasing' if slope < -0.1 else 'stable'
                 }
@@ -290,7 +456,7 @@ class AdvancedObjectCounter:
             'period_hours': hours,
             'analysis_time': datetime.now().isoformat(),
             'trends': trends,
-            'total_records': len(recent_history)
+            'total_records': len(timestamps)
         }
     
     def export_count_data(self, filepath: str, format: str = 'json'):
@@ -300,7 +466,7 @@ class AdvancedObjectCounter:
                 'export_time': datetime.now().isoformat(),
                 'session_stats': dict(self.session_stats),
                 'current_counts': dict(self.current_counts),
-                'count_history': list(self.count_history),
+                'count_history': self.count_history.to_records(),
                 'counting_zones': [
                     {
                         'name': zone.name,
@@ -324,37 +490,10 @@ class AdvancedObjectCounter:
             return False
     
     def draw_counting_zones(self, frame: np.ndarray) -> np.ndarray:
-        """カウントゾーン描画"""
-        annotated_frame = frame.copy()
-        
-        for zone in self.counting_zones:
-            if not zone.enabled:
-                continue
-            
-            # ポリゴン描画
-            points = np.array(zone.polygon, np.int32)
-            cv2.polylines(annotated_frame, [points], True, (0, 255, 255), 2)
-            
-            # 半透明塗りつぶし
-            overlay = annotated_frame.copy()
-            cv2.fillPoly(overlay, [points], (0, 255, 255))
-            cv2.addWeighted(annotated_frame, 0.8, overlay, 0.2, 0, annotated_frame)
-            
-            # ゾーン名表示
-            if zone.polygon:
-                center_x = int(np.mean([p[0] for p in zone.polygon]))
-                center_y = int(np.mean([p[1] for p in zone.polygon]))
-                cv2.putText(
-                    annotated_frame,
-                    zone.name,
-                    (center_x - 50, center_y),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.7,
-                    (255, 255, 255),
-                    2
-                )
-        
-        return annotated_frame
+        """カウントゾーン描画（事前描画したレイヤーを外接矩形内で1回合成）"""
+        if self.zone_overlay is None or not self.zone_overlay.matches(self.counting_zones, frame.shape):
+            self.zone_overlay = ZoneOverlay(self.counting_zones, frame.shape)
+        return self.zone_overlay.apply(frame)
     
     def reset_session_stats(self):
         """セッション統計リセット"""
@@ -370,18 +509,64 @@ class AdvancedObjectCounter:
 class ObjectCountVisualizer:
     """物体カウント可視化クラス"""
     
+    DASHBOARD_HEIGHT = 200
+    # 項目毎の描画行範囲（値が変わった項目の範囲のみ再描画）
+    FIELD_ROWS = {
+        'time': (42, 70),
+        'counts': (70, 105),
+        'alerts': (105, 200)
+    }
+    
     def __init__(self, counter: AdvancedObjectCounter):
         """初期化"""
         self.counter = counter
         self.logger = logging.getLogger(__name__)
+        
+        # 出力バッファ（フレーム + ダッシュボード）と静的部分の描画済みパネル
+        self._output = None
+        self._static_panel = None
+        self._field_values = {}
     
     def create_count_dashboard(self, frame: np.ndarray, counts: Dict[str, int]) -> np.ndarray:
-        """カウントダッシュボード作成"""
-        dashboard_frame = frame.copy()
+        """
+        カウントダッシュボード作成
+        
+        Args:
+            frame: 入力フレーム
+            counts: クラス別カウント
         
-        # ダッシュボード背景
-        dashboard_height = 200
-        dashboard = np.zeros((dashboard_height, frame.shape[1], 3), dtype=np.uint8)
+        Returns:
+            np.ndarray: フレーム下部にダッシュボードを付けた画像（次回呼び出しで上書きされる）
+        """
+        output = self._prepare_output(frame)
+        height = frame.shape[0]
+        output[:height] = frame
+        dashboard = output[height:]
+        
+        # 現在時刻
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._update_field(dashboard, 'time', current_time, self._draw_time)
+        
+        # カウント情報
+        self._update_field(dashboard, 'counts', tuple(counts.items()), self._draw_counts)
+        
+        # アラート表示（最大3つまで）
+        alerts = tuple(
+            (alert['class_name'], alert['current_count'], alert['threshold'])
+            for alert in self.counter.get_inventory_alerts()[:3]
+        )
+        self._update_field(dashboard, 'alerts', alerts, self._draw_alerts)
+        
+        return output
+    
+    def _prepare_output(self, frame: np.ndarray) -> np.ndarray:
+        """出力バッファ確保（フレームサイズ変更時のみ再確保し、静的部分を描画）"""
+        shape = (frame.shape[0] + self.DASHBOARD_HEIGHT,) + frame.shape[1:]
+        if self._output is not None and self._output.shape == shape and self._output.dtype == frame.dtype:
+            return self._output
+        
+        self._output = np.zeros(shape, dtype=frame.dtype)
+        dashboard = self._output[frame.shape[0]:]
         
         # タイトル
         cv2.putText(
@@ -394,8 +579,21 @@ class ObjectCountVisualizer:
             2
         )
         
-        # 現在時刻
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._static_panel = dashboard.copy()
+        self._field_values = {}
+        return self._output
+    
+    def _update_field(self, dashboard: np.ndarray, field: str, value, draw_fn):
+        """値が変わった項目のみ行範囲を静的パネルから戻して再描画"""
+        if field in self._field_values and self._field_values[field] == value:
+            return
+        top, bottom = self.FIELD_ROWS[field]
+        dashboard[top:bottom] = self._static_panel[top:bottom]
+        draw_fn(dashboard, value)
+        self._field_values[field] = value
+    
+    def _draw_time(self, dashboard: np.ndarray, current_time: str):
+        """現在時刻描画"""
         cv2.putText(
             dashboard,
             f"Time: {current_time}",
@@ -405,10 +603,11 @@ class ObjectCountVisualizer:
             (200, 200, 200),
             1
         )
-        
-        # カウント情報
+    
+    def _draw_counts(self, dashboard: np.ndarray, counts: Tuple[Tuple[str, int], ...]):
+        """合計・クラス別カウント描画"""
         y_offset = 90
-        total_count = sum(counts.values())
+        total_count = sum(count for _, count in counts)
         cv2.putText(
             dashboard,
             f"Total Objects: {total_count}",
@@ -421,7 +620,7 @@ class ObjectCountVisualizer:
         
         # クラス別カウント
         x_offset = 250
-        for i, (class_name, count) in enumerate(counts.items()):
+        for i, (class_name, count) in enumerate(counts):
             color = self._get_class_color(class_name)
             cv2.putText(
                 dashboard,
@@ -432,37 +631,34 @@ class ObjectCountVisualizer:
                 color,
                 2
             )
+    
+    def _draw_alerts(self, dashboard: np.ndarray, alerts: Tuple[Tuple[str, int, int], ...]):
+        """アラート描画"""
+        if not alerts:
+            return
         
-        # アラート表示
-        alerts = self.counter.get_inventory_summary().get('alerts', [])
-        if alerts:
-            alert_y = 130
+        alert_y = 130
+        cv2.putText(
+            dashboard,
+            "ALERTS:",
+            (20, alert_y),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.6,
+            (0, 0, 255),
+            2
+        )
+        
+        for i, (class_name, current_count, threshold) in enumerate(alerts):
+            alert_text = f"{class_name}: {current_count}/{threshold}"
             cv2.putText(
                 dashboard,
-                "ALERTS:",
-                (20, alert_y),
+                alert_text,
+                (100 + (i * 200), alert_y),
                 cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
+                0.5,
                 (0, 0, 255),
-                2
+                1
             )
-            
-            for i, alert in enumerate(alerts[:3]):  # 最大3つまで表示
-                alert_text = f"{alert['class_name']}: {alert['current_count']}/{alert['threshold']}"
-                cv2.putText(
-                    dashboard,
-                    alert_text,
-                    (100 + (i * 200), alert_y),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5,
-                    (0, 0, 255),
-                    1
-                )
-        
-        # ダッシュボードを元フレームに結合
-        result_frame = np.vstack([dashboard_frame, dashboard])
-        
-        return result_frame
     
     def _get_class_color(self, class_name: str) -> Tuple[int, int, int]:
         """クラス別色取得"""
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 複数物体追跡
+ByteTrack方式（高/低信頼度の2段階IoU対応付け + カルマンフィルタ）で安定したIDを付与
+"""
+
+import time
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import TRACKING_CONFIG
+from detection_results import DETECTION_DTYPE, DetectionArray
+
+# 状態ベクトル: [cx, cy, w, h, vcx, vcy, vw, vh]
+_STATE_DIM = 8
+_MEASURE_DIM = 4
+_H = np.hstack([np.eye(_MEASURE_DIM), np.zeros((_MEASURE_DIM, _MEASURE_DIM))])
+
+# 位置・速度のノイズ係数（矩形サイズに比例、速度は1秒あたり）
+_STD_POSITION = 1.0 / 20
+_STD_VELOCITY = 1.0
+
+
+def _xyxy_to_cxcywh(boxes: np.ndarray) -> np.ndarray:
+    """(x1, y1, x2, y2) -> (cx, cy, w, h)"""
+    return np.stack([
+        (boxes[:, 0] + boxes[:, 2]) / 2,
+        (boxes[:, 1] + boxes[:, 3]) / 2,
+        boxes[:, 2] - boxes[:, 0],
+        boxes[:, 3] - boxes[:, 1]
+    ], axis=1)
+
+
+def _cxcywh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    """(cx, cy, w, h) -> (x1, y1, x2, y2)"""
+    half_w = boxes[:, 2] / 2
+    half_h = boxes[:, 3] / 2
+    return np.stack([
+        boxes[:, 0] - half_w,
+        boxes[:, 1] - half_h,
+        boxes[:, 0] + half_w,
+        boxes[:, 1] + half_h
+    ], axis=1)
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU行列 (len(a), len(b))"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)))
+    
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def greedy_match(scores: np.ndarray, threshold: float):
+    """
+    スコア降順の貪欲マッチング
+    
+    Args:
+        scores: スコア行列 (行, 列)
+        threshold: 最小スコア
+    
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 対応した行・列インデックス
+    """
+    rows, cols = np.nonzero(scores >= threshold)
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    used_rows = set()
+    used_cols = set()
+    matched_rows = []
+    matched_cols = []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matched_rows.append(row)
+        matched_cols.append(col)
+    return np.array(matched_rows, dtype=np.int64), np.array(matched_cols, dtype=np.int64)
+
+
+@dataclass
+class TrackUpdate:
+    """追跡結果（確定トラックのみ）"""
+    detections: DetectionArray          # 今回の矩形（検出 or 予測）
+    track_ids: np.ndarray               # トラックID
+    coasting: np.ndarray                # 今回未検出で予測のみのトラック
+    new_track_ids: List[int] = field(default_factory=list)  # 今回確定したトラック
+    
+    def __len__(self) -> int:
+        return len(self.track_ids)
+    
+    def class_counts(self) -> Dict[str, int]:
+        """クラス別の追跡中物体数"""
+        return self.detections.class_counts()
+    
+    def new_class_counts(self) -> Dict[str, int]:
+        """今回新たに確定した物体のクラス別数"""
+        if not self.new_track_ids:
+            return {}
+        return self.detections[np.isin(self.track_ids, self.new_track_ids)].class_counts()
+    
+    def to_detected_objects(self, timestamp: Optional[datetime] = None) -> List:
+        """object_id付きのDetectedObjectリスト"""
+        objects = self.detections.to_detected_objects(timestamp)
+        for obj, track_id in zip(objects, self.track_ids.tolist()):
+            obj.object_id = f"{obj.class_name}_{track_id}"
+        return objects
+
+
+class ObjectTracker:
+    """ByteTrack方式の複数物体追跡（トラック状態はNumPy配列で一括管理）"""
+    
+    def __init__(self, high_threshold: Optional[float] = None,
+                 low_threshold: Optional[float] = None,
+                 new_track_threshold: Optional[float] = None,
+                 match_iou: Optional[float] = None,
+                 low_match_iou: Optional[float] = None,
+                 min_hits: Optional[int] = None,
+                 max_coast: Optional[float] = None):
+        """
+        初期化
+        
+        Args:
+            high_threshold: 1段目の対応付けに使う検出の信頼度
+            low_threshold: 2段目（低信頼度検出）の下限
+            new_track_threshold: 新規トラック生成に必要な信頼度
+            match_iou: 1段目の最小IoU
+            low_match_iou: 2段目の最小IoU
+            min_hits: トラック確定までの検出回数
+            max_coast: 未検出のまま予測で維持する秒数
+        """
+        self.logger = logging.getLogger(__name__)
+        
+        def option(value, key):
+            return TRACKING_CONFIG[key] if value is None else value
+        
+        self.high_threshold = option(high_threshold, 'high_threshold')
+        self.low_threshold = option(low_threshold, 'low_threshold')
+        self.new_track_threshold = option(new_track_threshold, 'new_track_threshold')
+        self.match_iou = option(match_iou, 'match_iou')
+        self.low_match_iou = option(low_match_iou, 'low_match_iou')
+        self.min_hits = option(min_hits, 'min_hits')
+        self.max_coast = option(max_coast, 'max_coast')
+        
+        self.names = {}
+        self.next_id = 1
+        self.last_update_time = None
+        self.unique_counts = {}
+        self.stats = {'updates': 0, 'coasts': 0, 'tracks_created': 0, 'tracks_confirmed': 0}
+        self._reset_tracks()
+    
+    def _reset_tracks(self):
+        """トラック配列初期化"""
+        self.ids = np.empty(0, dtype=np.int64)
+        self.class_ids = np.empty(0, dtype=np.int32)
+        self.conf = np.empty(0, dtype=np.float32)
+        self.mean = np.empty((0, _STATE_DIM))
+        self.covariance = np.empty((0, _STATE_DIM, _STATE_DIM))
+        self.hits = np.empty(0, dtype=np.int32)
+        self.confirmed = np.empty(0, dtype=bool)
+        self.last_seen = np.empty(0)
+    
+    def reset(self):
+        """全トラック破棄（カメラ切替時など）"""
+        self._reset_tracks()
+        self.last_update_time = None
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def _predict(self, dt: float):
+        """全トラックの状態予測（等速モデル）"""
+        if len(self.ids) == 0 or dt <= 0:
+            return
+        
+        transition = np.eye(_STATE_DIM)
+        transition[:_MEASURE_DIM, _MEASURE_DIM:] = np.eye(_MEASURE_DIM) * dt
+        
+        size = np.repeat(np.maximum(self.mean[:, 2:4], 1.0), 2, axis=1)[:, [0, 2, 1, 3]]
+        std = np.hstack([size * _STD_POSITION, size * _STD_VELOCITY]) * dt
+        process_noise = np.zeros_like(self.covariance)
+        process_noise[:, np.arange(_STATE_DIM), np.arange(_STATE_DIM)] = std ** 2
+        
+        self.mean = self.mean @ transition.T
+        self.covariance = transition @ self.covariance @ transition.T + process_noise
+        
+        # 幅・高さが負にならないよう制限
+        np.maximum(self.mean[:, 2:4], 1.0, out=self.mean[:, 2:4])
+    
+    def _correct(self, indices: np.ndarray, measurements: np.ndarray):
+        """対応したトラックの観測更新"""
+        if len(indices) == 0:
+            return
+        
+        mean = self.mean[indices]
+        covariance = self.covariance[indices]
+        size = np.maximum(measurements[:, 2:4], 1.0)
+        std = np.repeat(size, 2, axis=1)[:, [0, 2, 1, 3]] * _STD_POSITION
+        measurement_noise = np.zeros((len(indices), _MEASURE_DIM, _MEASURE_DIM))
+        measurement_noise[:, np.arange(_MEASURE_DIM), np.arange(_MEASURE_DIM)] = std ** 2
+        
+        projected_cov = _H @ covariance @ _H.T + measurement_noise
+        # K = P H^T S^-1 （Sは対称なので solve(S, H P) の転置）
+        gain = np.linalg.solve(projected_cov, _H @ covariance).transpose(0, 2, 1)
+        innovation = measurements - mean[:, :_MEASURE_DIM]
+        
+        self.mean[indices] = mean + np.einsum('nij,nj->ni', gain, innovation)
+        self.covariance[indices] = covariance - gain @ _H @ covariance
+    
+    def _spawn(self, boxes: np.ndarray, class_ids: np.ndarray, conf: np.ndarray, now: float):
+        """新規トラック生成"""
+        count = len(boxes)
+        if count == 0:
+            return
+        
+        measurements = _xyxy_to_cxcywh(boxes)
+        mean = np.hstack([measurements, np.zeros((count, _MEASURE_DIM))])
+        size = np.repeat(np.maximum(measurements[:, 2:4], 1.0), 2, axis=1)[:, [0, 2, 1, 3]]
+        std = np.hstack([size * _STD_POSITION * 2, size * _STD_VELOCITY * 2])
+        covariance = np.zeros((count, _STATE_DIM, _STATE_DIM))
+        covariance[:, np.arange(_STATE_DIM), np.arange(_STATE_DIM)] = std ** 2
+        
+        ids = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+        self.next_id += count
+        self.stats['tracks_created'] += count
+        
+        self.ids = np.concatenate([self.ids, ids])
+        self.class_ids = np.concatenate([self.class_ids, class_ids.astype(np.int32)])
+        self.conf = np.concatenate([self.conf, conf.astype(np.float32)])
+        self.mean = np.concatenate([self.mean, mean])
+        self.covariance = np.concatenate([self.covariance, covariance])
+        self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int32)])
+        self.confirmed = np.concatenate([self.confirmed, np.full(count, self.min_hits <= 1)])
+        self.last_seen = np.concatenate([self.last_seen, np.full(count, now)])
+    
+    def _keep(self, mask: np.ndarray):
+        """トラック配列の絞り込み"""
+        self.ids = self.ids[mask]
+        self.class_ids = self.class_ids[mask]
+        self.conf = self.conf[mask]
+        self.mean = self.mean[mask]
+        self.covariance = self.covariance[mask]
+        self.hits = self.hits[mask]
+        self.confirmed = self.confirmed[mask]
+        self.last_seen = self.last_seen[mask]
+    
+    def _associate(self, track_indices: np.ndarray, boxes: np.ndarray,
+                   class_ids: np.ndarray, threshold: float):
+        """同一クラス間のIoU貪欲マッチング（トラック・検出のインデックスを返す）"""
+        if len(track_indices) == 0 or len(boxes) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        
+        predicted = _cxcywh_to_xyxy(self.mean[track_indices, :_MEASURE_DIM])
+        scores = iou_matrix(predicted, boxes)
+        scores[self.class_ids[track_indices][:, None] != class_ids[None, :]] = 0.0
+        rows, cols = greedy_match(scores, threshold)
+        return track_indices[rows], cols
+    
+    def update(self, detections: DetectionArray,
+               timestamp: Optional[float] = None) -> TrackUpdate:
+        """
+        検出結果でトラックを更新
+        
+        Args:
+            detections: 今回フレームの検出結果（低信頼度も含めて渡すと2段目で活用）
+            timestamp: フレーム時刻（UNIX秒、Noneの場合は現在時刻）
+        
+        Returns:
+            TrackUpdate: 確定トラックの追跡結果
+        """
+        now = time.time() if timestamp is None else timestamp
+        if detections.names:
+            self.names = detections.names
+        self._predict(now - self.last_update_time if self.last_update_time is not None else 0.0)
+        self.last_update_time = now
+        self.stats['updates'] += 1
+        
+        boxes = detections.xyxy.astype(np.float64)
+        class_ids = detections.cls
+        conf = detections.conf
+        track_count = len(self.ids)
+        matched = np.zeros(track_count, dtype=bool)
+        
+        # 1段目: 高信頼度検出 × 全トラック
+        high = np.flatnonzero(conf >= self.high_threshold)
+        track_rows, det_cols = self._associate(
+            np.arange(track_count), boxes[high], class_ids[high], self.match_iou
+        )
+        high_matched = high[det_cols]
+        matched[track_rows] = True
+        
+        # 2段目: 低信頼度検出 × 未対応の確定トラック（遮蔽・ブレで信頼度が落ちた物体）
+        low = np.flatnonzero((conf >= self.low_threshold) & (conf < self.high_threshold))
+        remaining = np.flatnonzero(~matched & self.confirmed)
+        low_rows, low_cols = self._associate(remaining, boxes[low], class_ids[low],
+                                             self.low_match_iou)
+        matched[low_rows] = True
+        
+        all_rows = np.concatenate([track_rows, low_rows])
+        all_dets = np.concatenate([high_matched, low[low_cols]])
+        self._correct(all_rows, _xyxy_to_cxcywh(boxes[all_dets]))
+        self.conf[all_rows] = conf[all_dets]
+        self.hits[all_rows] += 1
+        self.last_seen[all_rows] = now
+        
+        # 確定判定（確定した瞬間のトラックを新規物体として記録）
+        newly_confirmed = matched & ~self.confirmed & (self.hits >= self.min_hits)
+        self.confirmed |= newly_confirmed
+        
+        # 未確定で未対応のトラックは即削除・確定トラックは max_coast まで予測で維持
+        alive = np.where(self.confirmed, now - self.last_seen <= self.max_coast, matched)
+        new_ids = self.ids[newly_confirmed].tolist()
+        new_classes = self.class_ids[newly_confirmed].tolist()
+        self._keep(alive)
+        
+        # 未対応の高信頼度検出から新規トラック
+        unmatched_high = np.setdiff1d(high, high_matched)
+        spawn = unmatched_high[conf[unmatched_high] >= self.new_track_threshold]
+        spawn_start = len(self.ids)
+        self._spawn(boxes[spawn], class_ids[spawn], conf[spawn], now)
+        if self.min_hits <= 1:
+            new_ids += self.ids[spawn_start:].tolist()
+            new_classes += self.class_ids[spawn_start:].tolist()
+        
+        self._record_new(new_classes)
+        return self._result(matched_ids=self.ids[self.last_seen == now], new_ids=new_ids)
+    
+    def coast(self, timestamp: Optional[float] = None) -> TrackUpdate:
+        """
+        検出なしで予測のみ進める（推論を間引いたフレーム用）
+        
+        Args:
+            timestamp: フレーム時刻（UNIX秒）
+        
+        Returns:
+            TrackUpdate: 予測位置の追跡結果
+        """
+        now = time.time() if timestamp is None else timestamp
+        if self.last_update_time is not None:
+            self._predict(now - self.last_update_time)
+        self.last_update_time = now
+        self.stats['coasts'] += 1
+        
+        self._keep(self.confirmed & (now - self.last_seen <= self.max_coast))
+        return self._result(matched_ids=np.empty(0, dtype=np.int64), new_ids=[])
+    
+    def _record_new(self, class_ids: List[int]):
+        """新規確定物体のクラス別累計"""
+        self.stats['tracks_confirmed'] += len(class_ids)
+        for class_id in class_ids:
+            class_name = self.names.get(class_id, str(class_id))
+            self.unique_counts[class_name] = self.unique_counts.get(class_name, 0) + 1
+    
+    def _result(self, matched_ids: np.ndarray, new_ids: List[int]) -> TrackUpdate:
+        """確定トラックの結果生成"""
+        mask = self.confirmed
+        data = np.empty(int(mask.sum()), dtype=DETECTION_DTYPE)
+        if len(data):
+            boxes = _cxcywh_to_xyxy(self.mean[mask, :_MEASURE_DIM])
+            data['x1'], data['y1'], data['x2'], data['y2'] = boxes.T
+            data['conf'] = self.conf[mask]
+            data['cls'] = self.class_ids[mask]
+        ids = self.ids[mask]
+        return TrackUpdate(
+            detections=DetectionArray(data, self.names),
+            track_ids=ids,
+            coasting=~np.isin(ids, matched_ids),
+            new_track_ids=new_ids
+        )
+    
+    def get_stats(self) -> Dict:
+        """統計情報取得"""
+        stats = dict(self.stats)
+        stats['active_tracks'] = int(self.confirmed.sum())
+        stats['tentative_tracks'] = int((~self.confirmed).sum())
+        stats['unique_counts'] = dict(self.unique_counts)
+        return stats
+
+
+if __name__ == "__main__":
+    # 3台の車が横移動し、1台は途中で検出が途切れる（遮蔽）場面を想定
+    names = {0: 'car', 1: 'truck'}
+    tracker = ObjectTracker(min_hits=2, max_coast=1.0)
+    rng = np.random.default_rng(0)
+    
+    frame_interval = 0.1
+    start = time.perf_counter()
+    for frame_index in range(60):
+        t = frame_index * frame_interval
+        boxes, conf, classes = [], [], []
+        for lane, speed in enumerate((20, 35, 50)):
+            x = 100 + speed * frame_index
+            y = 200 + lane * 200
+            # 2台目は20〜27フレームで遮蔽（低信頼度 or 未検出）
+            if lane == 1 and 20 <= frame_index < 28:
+                if frame_index % 2:
+                    continue
+                score = 0.3
+            else:
+                score = 0.85
+            jitter = rng.normal(0, 2, 4)
+            boxes.append([x, y, x + 120, y + 80] + jitter)
+            conf.append(score)
+            classes.append(lane % 2)
+        result = tracker.update(
+            DetectionArray.from_arrays(np.array(boxes), np.array(conf), np.array(classes), names), t
+        )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    print(f"最終フレームのトラックID: {result.track_ids.tolist()}")
+    print(f"ユニーク物体数: {tracker.unique_counts}")
+    print(f"統計: {tracker.get_stats()}")
+    print(f"処理時間: {elapsed_ms / 60:.3f} ms/フレーム")
+    
+    # 推論を間引いたフレームは予測のみ
+    coasted = tracker.coast(60 * frame_interval)
+    print(f"予測のみ: {len(coasted)}件 (coasting: {coasted.coasting.tolist()})")
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 関心領域（ROI）切り出し・タイル推論
+カウントゾーンの外接矩形のみを推論し、必要に応じて重なり付きタイルに分割
+"""
+
+import time
+import threading
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import ROI_CONFIG
+from detection_results import DETECTION_DTYPE, DetectionArray
+
+Region = Tuple[int, int, int, int]  # (x1, y1, x2, y2)
+
+
+def polygon_bounds(polygon: Sequence[Tuple[int, int]], frame_shape: Tuple[int, ...],
+                   padding: int = 0) -> Optional[Region]:
+    """
+    ポリゴンの外接矩形（フレーム内にクリップ）
+    
+    Args:
+        polygon: 頂点リスト
+        frame_shape: フレームのshape
+        padding: 余白（ピクセル）
+    
+    Returns:
+        Optional[Region]: 外接矩形（フレーム外の場合はNone）
+    """
+    if not polygon:
+        return None
+    
+    height, width = frame_shape[:2]
+    points = np.asarray(polygon, dtype=np.int64).reshape(-1, 2)
+    x1 = max(int(points[:, 0].min()) - padding, 0)
+    y1 = max(int(points[:, 1].min()) - padding, 0)
+    x2 = min(int(points[:, 0].max()) + padding, width)
+    y2 = min(int(points[:, 1].max()) + padding, height)
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return x1, y1, x2, y2
+
+
+def merge_regions(regions: List[Region]) -> List[Region]:
+    """重なる矩形を統合（同じ画素を2回推論しない）"""
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for region in merged:
+            for i, other in enumerate(result):
+                if (region[0] < other[2] and other[0] < region[2] and
+                        region[1] < other[3] and other[1] < region[3]):
+                    result[i] = (min(region[0], other[0]), min(region[1], other[1]),
+                                 max(region[2], other[2]), max(region[3], other[3]))
+                    changed = True
+                    break
+            else:
+                result.append(region)
+        merged = result
+    return merged
+
+
+def _tile_starts(start: int, end: int, tile_size: int, stride: int) -> List[int]:
+    """1軸方向のタイル開始位置（最後のタイルは端に揃える）"""
+    if end - start <= tile_size:
+        return [start]
+    starts = list(range(start, end - tile_size, stride))
+    starts.append(end - tile_size)
+    return starts
+
+
+def tile_region(region: Region, tile_size: int, overlap: float) -> List[Region]:
+    """
+    領域を重なり付きタイルに分割
+    
+    Args:
+        region: 分割対象領域
+        tile_size: タイル一辺（ピクセル）
+        overlap: 重なり率（0〜1未満）
+    
+    Returns:
+        List[Region]: タイル領域リスト
+    """
+    x1, y1, x2, y2 = region
+    stride = max(int(tile_size * (1.0 - overlap)), 1)
+    return [
+        (tx, ty, min(tx + tile_size, x2), min(ty + tile_size, y2))
+        for ty in _tile_starts(y1, y2, tile_size, stride)
+        for tx in _tile_starts(x1, x2, tile_size, stride)
+    ]
+
+
+def shift_detections(detections: DetectionArray, dx: int, dy: int) -> DetectionArray:
+    """切り出し座標系の検出結果をフレーム座標系に変換"""
+    if len(detections) == 0 or (dx == 0 and dy == 0):
+        return detections
+    
+    data = detections.data.copy()
+    data['x1'] += dx
+    data['x2'] += dx
+    data['y1'] += dy
+    data['y2'] += dy
+    return DetectionArray(data, detections.names)
+
+
+def nms_merge(detections: DetectionArray, threshold: float,
+              metric: str = 'ios', merge_boxes: bool = False) -> DetectionArray:
+    """
+    クラス別NMS（タイル境界の重複検出を統合）
+    
+    Args:
+        detections: フレーム座標系の検出結果
+        threshold: 抑制閾値
+        metric: 'ios'（小さい方の面積に対する重なり）または 'iou'
+        merge_boxes: 抑制した検出の矩形を残す検出に統合するか（タイルで分断された物体用）
+    
+    Returns:
+        DetectionArray: 重複除去後の検出結果
+    """
+    if len(detections) < 2:
+        return detections
+    
+    # クラス毎に座標をずらし、1回のNMSでクラス別処理
+    boxes = detections.xyxy.astype(np.float64)
+    offset = boxes.max() + 1.0
+    boxes += (detections.cls.astype(np.float64) * offset)[:, None]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    
+    data = detections.data.copy() if merge_boxes else detections.data
+    order = np.argsort(-detections.conf, kind='stable')
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        
+        inter_w = np.clip(np.minimum(boxes[best, 2], boxes[rest, 2]) -
+                          np.maximum(boxes[best, 0], boxes[rest, 0]), 0, None)
+        inter_h = np.clip(np.minimum(boxes[best, 3], boxes[rest, 3]) -
+                          np.maximum(boxes[best, 1], boxes[rest, 1]), 0, None)
+        inter = inter_w * inter_h
+        if metric == 'iou':
+            denom = areas[best] + areas[rest] - inter
+        else:
+            denom = np.minimum(areas[best], areas[rest])
+        overlap = inter / np.maximum(denom, 1e-9)
+        suppressed = rest[overlap >= threshold]
+        if merge_boxes and suppressed.size:
+            for lo, hi in (('x1', 'x2'), ('y1', 'y2')):
+                data[lo][best] = min(data[lo][best], data[lo][suppressed].min())
+                data[hi][best] = max(data[hi][best], data[hi][suppressed].max())
+        order = rest[overlap < threshold]
+    
+    return DetectionArray(data[np.sort(np.asarray(keep))], detections.names)
+
+
+class ROITiler:
+    """カウントゾーン由来のROI切り出し・タイル分割"""
+    
+    def __init__(self, zones: Optional[List] = None, padding: Optional[int] = None,
+                 enable_tiling: Optional[bool] = None, tile_size: Optional[int] = None,
+                 tile_overlap: Optional[float] = None, merge_threshold: Optional[float] = None):
+        """
+        初期化
+        
+        Args:
+            zones: CountingZoneリスト（参照を保持し、追加・削除に追従）
+            padding: 外接矩形の余白
+            enable_tiling: タイル分割有効
+            tile_size: タイル一辺
+            tile_overlap: タイル重なり率
+            merge_threshold: タイル間重複除去の閾値
+        """
+        self.logger = logging.getLogger(__name__)
+        self.zones = zones if zones is not None else []
+        self.padding = ROI_CONFIG['roi_padding'] if padding is None else padding
+        self.enable_tiling = ROI_CONFIG['enable_tiling'] if enable_tiling is None else enable_tiling
+        self.tile_size = tile_size or ROI_CONFIG['tile_size']
+        self.tile_overlap = ROI_CONFIG['tile_overlap'] if tile_overlap is None else tile_overlap
+        self.merge_threshold = (ROI_CONFIG['merge_threshold'] if merge_threshold is None
+                                else merge_threshold)
+        
+        # 領域計画キャッシュ（フレームサイズ・ゾーン形状が変わった時のみ再計算）
+        # 複数の推論スレッドから呼ばれるため、キーと計画の組は同じロック内で更新
+        self._plan_lock = threading.Lock()
+        self._plan_key = None
+        self._plan = []
+        
+        # 統計情報
+        self.stats = {
+            'frames': 0,
+            'regions': 0,
+            'inferred_pixels': 0,
+            'frame_pixels': 0
+        }
+    
+    def set_zones(self, zones: List):
+        """カウントゾーン設定"""
+        with self._plan_lock:
+            self.zones = zones
+            self._plan_key = None
+    
+    def _zone_polygons(self) -> Tuple:
+        """有効ゾーンのポリゴン（キャッシュキー兼用）"""
+        return tuple(
+            tuple(map(tuple, zone.polygon)) for zone in self.zones
+            if getattr(zone, 'enabled', True) and zone.polygon
+        )
+    
+    @property
+    def is_active(self) -> bool:
+        """全体推論以外の領域計画になるか"""
+        return self.enable_tiling or any(
+            getattr(zone, 'enabled', True) and zone.polygon for zone in self.zones
+        )
+    
+    def plan(self, frame_shape: Tuple[int, ...]) -> List[Region]:
+        """
+        推論領域の計画
+        
+        Args:
+            frame_shape: フレームのshape
+        
+        Returns:
+            List[Region]: 推論領域リスト（ゾーン未設定時はフレーム全体）
+        """
+        with self._plan_lock:
+            polygons = self._zone_polygons()
+            key = (frame_shape[:2], polygons)
+            if key == self._plan_key:
+                return self._plan
+            
+            height, width = frame_shape[:2]
+            regions = [polygon_bounds(polygon, frame_shape, self.padding) for polygon in polygons]
+            regions = merge_regions([region for region in regions if region is not None])
+            if not regions:
+                regions = [(0, 0, width, height)]
+            
+            if self.enable_tiling:
+                regions = [tile for region in regions
+                           for tile in tile_region(region, self.tile_size, self.tile_overlap)]
+            
+            covered = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+            self.logger.info(
+                f"推論領域計画: {len(regions)}領域 "
+                f"(フレーム比 {covered / float(width * height):.0%})"
+            )
+            self._plan_key = key
+            self._plan = regions
+            return regions
+    
+    @staticmethod
+    def crop(frame: np.ndarray, regions: List[Region]) -> List[np.ndarray]:
+        """領域の切り出し（コピーなしのビュー）"""
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]
+    
+    def merge(self, region_detections: List[DetectionArray], regions: List[Region],
+              names: Optional[Dict[int, str]] = None) -> DetectionArray:
+        """
+        領域毎の検出結果をフレーム座標に統合
+        
+        Args:
+            region_detections: 領域毎の検出結果
+            regions: 推論領域リスト
+            names: クラス名辞書
+        
+        Returns:
+            DetectionArray: 統合後の検出結果
+        """
+        shifted = [shift_detections(dets, x1, y1)
+                   for dets, (x1, y1, _, _) in zip(region_detections, regions) if len(dets)]
+        if names is None:
+            names = region_detections[0].names if region_detections else {}
+        if not shifted:
+            return DetectionArray.empty(names)
+        
+        merged = DetectionArray(np.concatenate([dets.data for dets in shifted]), names)
+        if len(regions) > 1:
+            merged = nms_merge(merged, self.merge_threshold, merge_boxes=True)
+        return merged
+    
+    def detect(self, frame: np.ndarray,
+               infer_fn: Callable[[List[np.ndarray]], List[DetectionArray]]) -> DetectionArray:
+        """
+        ROI・タイル単位で推論して統合
+        
+        Args:
+            frame: 入力フレーム
+            infer_fn: 切り出し画像リスト -> 検出結果リスト
+        
+        Returns:
+            DetectionArray: フレーム座標系の検出結果
+        """
+        regions = self.plan(frame.shape)
+        region_detections = infer_fn(self.crop(frame, regions))
+        
+        with self._plan_lock:
+            self.stats['frames'] += 1
+            self.stats['regions'] += len(regions)
+            self.stats['inferred_pixels'] += sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+            self.stats['frame_pixels'] += frame.shape[0] * frame.shape[1]
+        
+        return self.merge(region_detections, regions)
+    
+    def get_stats(self) -> Dict:
+        """統計情報取得"""
+        stats = dict(self.stats)
+        stats['pixel_ratio'] = (stats['inferred_pixels'] / stats['frame_pixels']
+                                if stats['frame_pixels'] else 0.0)
+        return stats
+
+
+if __name__ == "__main__":
+    from object_counter import CountingZone
+    
+    # 1920x1080で棚2か所のみをカウント対象とした場合の推論領域
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    zones = [
+        CountingZone("Shelf A", [(100, 600), (700, 600), (700, 1000), (100, 1000)], {'car'}),
+        CountingZone("Shelf B", [(1300, 200), (1800, 200), (1800, 500), (1300, 500)], {'truck'})
+    ]
+    names = {0: 'car', 1: 'truck'}
+    
+    for tiling in (False, True):
+        tiler = ROITiler(zones, enable_tiling=tiling)
+        regions = tiler.plan(frame.shape)
+        print(f"タイル分割: {tiling} -> 領域数 {len(regions)}")
+        for region in regions:
+            print(f"  {region}")
+    
+    # タイル境界で分断された同一物体の統合
+    tiler = ROITiler(zones, enable_tiling=True, tile_size=256, tile_overlap=0.25)
+    regions = tiler.plan(frame.shape)
+    
+    def fake_infer(crops):
+        # 各タイル内で見える部分のみ検出されたと仮定（フレーム座標 (300, 700)-(360, 760) の物体）
+        results = []
+        for (x1, y1, x2, y2), crop in zip(regions, crops):
+            bx1, by1 = max(300, x1), max(700, y1)
+            bx2, by2 = min(360, x2), min(760, y2)
+            if bx2 > bx1 and by2 > by1:
+                results.append(DetectionArray.from_arrays(
+                    [[bx1 - x1, by1 - y1, bx2 - x1, by2 - y1]], [0.9], [0], names))
+            else:
+                results.append(DetectionArray.empty(names))
+        return results
+    
+    start = time.perf_counter()
+    detections = tiler.detect(frame, fake_infer)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"タイル {len(regions)}枚 -> 統合後 {len(detections)}件 ({elapsed_ms:.2f} ms)")
+    print(f"統合後の矩形: {detections.xyxy.astype(int).tolist()}")
+    print(f"統計: {tiler.get_stats()}")
+    
+    # NMSのベンチマーク（混雑フレーム想定）
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 1800, (2000, 2)).astype(np.float32)
+    data = np.empty(2000, dtype=DETECTION_DTYPE)
+    data['x1'], data['y1'] = xy.T
+    data['x2'], data['y2'] = (xy + 60).T
+    data['conf'] = rng.uniform(0.3, 1.0, 2000)
+    data['cls'] = rng.integers(0, 2, 2000)
+    start = time.perf_counter()
+    kept = nms_merge(DetectionArray(data, names), 0.5, metric='iou')
+    print(f"NMS 2000件 -> {len(kept)}件 ({(time.perf_counter() - start) * 1000:.2f} ms)")
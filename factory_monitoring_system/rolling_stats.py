@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 逐次ローリング統計
+カウント更新毎に時間バケット単位の累積和・単調デックを更新し、平均・最小・最大・傾きを定数時間で返す
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from config import ROLLING_STATS_CONFIG
+
+
+class _Bucket:
+    """時間バケットの集計値"""
+    
+    __slots__ = ('bucket_id', 'first_index', 'samples', 'sum_x', 'sum_xx', 'classes')
+    
+    def __init__(self, bucket_id: int, first_index: int):
+        self.bucket_id = bucket_id
+        self.first_index = first_index
+        self.samples = 0
+        self.sum_x = 0
+        self.sum_xx = 0
+        # クラス名 -> [Σy, Σxy, 0以外の件数]
+        self.classes = {}
+
+
+class RollingWindowStats:
+    """1ウィンドウ分のローリング統計（ウィンドウ端はバケット幅単位で失効）"""
+    
+    def __init__(self, window_seconds: float, buckets: Optional[int] = None):
+        """
+        初期化
+        
+        Args:
+            window_seconds: ウィンドウ長（秒）
+            buckets: ウィンドウ内のバケット数（失効の粒度）
+        """
+        self.window_seconds = window_seconds
+        self.bucket_count = buckets or ROLLING_STATS_CONFIG['buckets_per_window']
+        self.bucket_seconds = window_seconds / self.bucket_count
+        
+        self.buckets = deque()
+        self.samples = 0
+        self.sum_x = 0
+        self.sum_xx = 0
+        # クラス名 -> [Σy, Σxy, 0以外の件数]
+        self.classes = {}
+        # 最小・最大の単調デック: クラス名 -> deque[(バケットID, 値)]
+        self.min_deques = {}
+        self.max_deques = {}
+        # クラス初出のサンプル番号（それ以前のサンプルは0とみなす）
+        self.first_seen = {}
+        self.latest = {}
+    
+    def _evict(self, bucket_id: int):
+        """ウィンドウ外のバケットを集計から除外"""
+        oldest = bucket_id - self.bucket_count + 1
+        while self.buckets and self.buckets[0].bucket_id < oldest:
+            bucket = self.buckets.popleft()
+            self.samples -= bucket.samples
+            self.sum_x -= bucket.sum_x
+            self.sum_xx -= bucket.sum_xx
+            for class_name, (sum_y, sum_xy, nonzero) in bucket.classes.items():
+                totals = self.classes[class_name]
+                totals[0] -= sum_y
+                totals[1] -= sum_xy
+                totals[2] -= nonzero
+        
+        for deques in (self.min_deques, self.max_deques):
+            for values in deques.values():
+                while values and values[0][0] < oldest:
+                    values.popleft()
+    
+    @staticmethod
+    def _push_monotonic(values: deque, bucket_id: int, value: int, is_min: bool):
+        """単調デック更新（同一バケット内は最小/最大値のみ保持）"""
+        def dominated(existing):
+            return existing >= value if is_min else existing <= value
+        
+        if values and values[-1][0] == bucket_id:
+            if not dominated(values[-1][1]):
+                return
+            values.pop()
+        while values and dominated(values[-1][1]):
+            values.pop()
+        values.append((bucket_id, value))
+    
+    def add(self, index: int, timestamp: float, counts: Dict[str, int]):
+        """
+        サンプル追加
+        
+        Args:
+            index: サンプル番号（回帰のx座標）
+            timestamp: UNIX秒
+            counts: クラス別カウント（含まれないクラスは0）
+        """
+        bucket_id = int(timestamp // self.bucket_seconds)
+        self._evict(bucket_id)
+        
+        if not self.buckets or self.buckets[-1].bucket_id != bucket_id:
+            self.buckets.append(_Bucket(bucket_id, index))
+        bucket = self.buckets[-1]
+        
+        bucket.samples += 1
+        bucket.sum_x += index
+        bucket.sum_xx += index * index
+        self.samples += 1
+        self.sum_x += index
+        self.sum_xx += index * index
+        
+        for class_name in counts:
+            if class_name not in self.classes:
+                self.classes[class_name] = [0, 0, 0]
+                self.min_deques[class_name] = deque()
+                self.max_deques[class_name] = deque()
+                self.first_seen[class_name] = index
+        
+        for class_name, totals in self.classes.items():
+            value = int(counts.get(class_name, 0))
+            if value:
+                bucket_totals = bucket.classes.get(class_name)
+                if bucket_totals is None:
+                    bucket_totals = bucket.classes[class_name] = [0, 0, 0]
+                bucket_totals[0] += value
+                bucket_totals[1] += index * value
+                bucket_totals[2] += 1
+                totals[0] += value
+                totals[1] += index * value
+                totals[2] += 1
+            self._push_monotonic(self.min_deques[class_name], bucket_id, value, True)
+            self._push_monotonic(self.max_deques[class_name], bucket_id, value, False)
+        
+        self.latest = counts
+    
+    def summary(self, now: Optional[float] = None) -> Dict:
+        """
+        ウィンドウ内のクラス別統計（クラス数に比例、サンプル数に依存しない）
+        
+        Args:
+            now: 現在時刻（UNIX秒）
+        
+        Returns:
+            Dict: {'samples': 件数, 'classes': {クラス名: {...}}}
+        """
+        now = time.time() if now is None else now
+        self._evict(int(now // self.bucket_seconds))
+        
+        result = {'samples': self.samples, 'classes': {}}
+        if self.samples == 0:
+            return result
+        
+        samples = self.samples
+        window_first_index = self.buckets[0].first_index
+        denominator = samples * self.sum_xx - self.sum_x * self.sum_x
+        
+        for class_name, (sum_y, sum_xy, nonzero) in self.classes.items():
+            if nonzero == 0:
+                continue
+            
+            minimum = self.min_deques[class_name][0][1]
+            maximum = self.max_deques[class_name][0][1]
+            # 初出前のサンプルがウィンドウ内にあれば、その0も最小・最大の候補
+            if self.first_seen[class_name] > window_first_index:
+                minimum = min(minimum, 0)
+                maximum = max(maximum, 0)
+            
+            slope = ((samples * sum_xy - self.sum_x * sum_y) / denominator
+                     if denominator else 0.0)
+            result['classes'][class_name] = {
+                'current': int(self.latest.get(class_name, 0)),
+                'average': sum_y / samples,
+                'min': minimum,
+                'max': maximum,
+                'trend_slope': slope
+            }
+        return result
+
+
+class RollingStats:
+    """複数ウィンドウ（1h/24h/7dなど）のローリング統計"""
+    
+    def __init__(self, window_hours: Optional[List[float]] = None,
+                 buckets: Optional[int] = None):
+        """
+        初期化
+        
+        Args:
+            window_hours: 対応するウィンドウ（時間）
+            buckets: ウィンドウ毎のバケット数
+        """
+        window_hours = window_hours or ROLLING_STATS_CONFIG['window_hours']
+        self.windows = {
+            hours: RollingWindowStats(hours * 3600, buckets) for hours in window_hours
+        }
+        self.next_index = 0
+        self._lock = threading.Lock()
+    
+    def add(self, counts: Dict[str, int], timestamp: Optional[float] = None):
+        """カウント更新を全ウィンドウに反映"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            index = self.next_index
+            self.next_index += 1
+            for window in self.windows.values():
+                window.add(index, timestamp, counts)
+    
+    def rebuild(self, buffer):
+        """CountRingBuffer の保持履歴から再構築（履歴読み込み時）"""
+        timestamps, values = buffer.window()
+        columns = list(buffer.columns)
+        with self._lock:
+            self.windows = {
+                hours: RollingWindowStats(window.window_seconds, window.bucket_count)
+                for hours, window in self.windows.items()
+            }
+            self.next_index = 0
+        for timestamp_ms, row in zip(timestamps.tolist(), values.tolist()):
+            counts = {column: value for column, value in zip(columns, row) if value}
+            self.add(counts, timestamp_ms / 1000.0)
+    
+    def supports(self, hours: float) -> bool:
+        """指定時間のウィンドウを保持しているか"""
+        return hours in self.windows
+    
+    def summary(self, hours: float, now: Optional[float] = None) -> Optional[Dict]:
+        """指定ウィンドウの統計（未対応のウィンドウはNone）"""
+        window = self.windows.get(hours)
+        if window is None:
+            return None
+        with self._lock:
+            return window.summary(now)
+
+
+if __name__ == "__main__":
+    import numpy as np
+    
+    # 5秒間隔で2日分のカウントを流し込み、1h/24hの統計をnp.polyfitと比較
+    stats = RollingStats([1, 24], buckets=720)
+    rng = np.random.default_rng(0)
+    start_time = 1_700_000_000.0
+    interval = 5.0
+    total = int(48 * 3600 / interval)
+    history = []
+    for i in range(total):
+        counts = {'car': int(10 + i * 0.001 + rng.integers(0, 5))}
+        if i > total - 300:
+            counts['truck'] = int(rng.integers(1, 4))
+        timestamp = start_time + i * interval
+        stats.add(counts, timestamp)
+        history.append(counts)
+    now = start_time + total * interval
+    
+    for hours in (1, 24):
+        begin = time.perf_counter()
+        for _ in range(1000):
+            summary = stats.summary(hours, now)
+        query_us = (time.perf_counter() - begin) * 1000
+        
+        samples = summary['samples']
+        recent = history[-samples:]
+        for class_name, values in summary['classes'].items():
+            column = np.array([entry.get(class_name, 0) for entry in recent])
+            expected_slope = np.polyfit(np.arange(len(column)), column, 1)[0]
+            assert abs(values['average'] - column.mean()) < 1e-9
+            assert values['min'] == column.min() and values['max'] == column.max()
+            assert abs(values['trend_slope'] - expected_slope) < 1e-9
+        print(f"{hours}hウィンドウ: {samples}件 / クエリ {query_us:.1f} µs / "
+              f"{ {name: round(v['average'], 2) for name, v in summary['classes'].items()} }")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - 映像URLキャッシュ
+カメラ毎に前回動作したURL・認証方式・セッションIDを保存し、
+再起動時は1回の確認で再利用（失敗時のみ探索をやり直す）
+"""
+
+import os
+import json
+import time
+import threading
+import logging
+from typing import Dict, Optional
+
+from config import DATA_CONFIG, STREAM_CACHE_CONFIG
+from stream_prober import probe_stream
+
+
+class StreamCache:
+    """発見済み映像URLのキャッシュ（JSONファイル、有効期限付き）"""
+    
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None,
+                 session_ttl: Optional[float] = None):
+        """
+        初期化
+        
+        Args:
+            path: キャッシュファイル
+            ttl: 有効期限（秒）
+            session_ttl: セッションIDを含む場合の有効期限（秒）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path or os.path.join(DATA_CONFIG['data_dir'], STREAM_CACHE_CONFIG['cache_file'])
+        self.ttl = STREAM_CACHE_CONFIG['ttl'] if ttl is None else ttl
+        self.session_ttl = STREAM_CACHE_CONFIG['session_ttl'] if session_ttl is None else session_ttl
+        self._lock = threading.Lock()
+        self.entries = self._load()
+    
+    def _load(self) -> Dict[str, Dict]:
+        """キャッシュ読み込み（壊れている場合は空）"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"URLキャッシュ読み込みエラー（破棄）: {e}")
+            return {}
+    
+    def _save(self):
+        """キャッシュ保存（一時ファイル + リネーム）"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = self.path + '.tmp'
+        try:
+            with open(temporary_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"URLキャッシュ保存エラー: {e}")
+    
+    def _expired(self, entry: Dict, now: float) -> bool:
+        """有効期限切れか（セッションIDを含むものは短い期限）"""
+        ttl = self.session_ttl if entry.get('session_id') else self.ttl
+        return now - entry.get('saved_at', 0) > ttl
+    
+    def get(self, camera_key: str) -> Optional[Dict]:
+        """
+        キャッシュ取得（期限切れはNone）
+        
+        Args:
+            camera_key: カメラ識別キー
+        
+        Returns:
+            Optional[Dict]: {'url', 'auth_mode', 'session_id', 'content_type', 'saved_at', ...}
+        """
+        with self._lock:
+            entry = self.entries.get(camera_key)
+            if entry is None:
+                return None
+            if self._expired(entry, time.time()):
+                del self.entries[camera_key]
+                self._save()
+                return None
+            return dict(entry)
+    
+    def put(self, camera_key: str, url: str, auth_mode: str = 'none',
+            session_id: Optional[str] = None, content_type: Optional[str] = None):
+        """
+        動作したURLを保存
+        
+        Args:
+            camera_key: カメラ識別キー
+            url: 映像URL
+            auth_mode: 認証方式（'none' / 'basic' / 'session' / 'url'）
+            session_id: セッションID（セッション方式の場合）
+            content_type: 映像のContent-Type
+        """
+        with self._lock:
+            self.entries[camera_key] = {
+                'url': url,
+                'auth_mode': auth_mode,
+                'session_id': session_id,
+                'content_type': content_type,
+                'saved_at': time.time()
+            }
+            self._save()
+    
+    def invalidate(self, camera_key: str):
+        """キャッシュ破棄"""
+        with self._lock:
+            if self.entries.pop(camera_key, None) is not None:
+                self._save()
+    
+    def get_validated(self, camera_key: str, **probe_options) -> Optional[Dict]:
+        """
+        キャッシュ取得 + 1回の試行で確認（失敗時は破棄してNone）
+        
+        Args:
+            camera_key: カメラ識別キー
+            **probe_options: probe_stream() の引数（session, auth, verify など）
+        
+        Returns:
+            Optional[Dict]: 確認済みのキャッシュ
+        """
+        entry = self.get(camera_key)
+        if entry is None:
+            return None
+        
+        probe_options.setdefault('timeout', STREAM_CACHE_CONFIG['validate_timeout'])
+        result = probe_stream(entry['url'], **probe_options)
+        if result['success']:
+            self.logger.info(f"キャッシュURLを再利用: {camera_key} -> {entry['url']}")
+            return entry
+        
+        self.logger.info(f"キャッシュURLが無効のため再探索: {camera_key} ({result['error']})")
+        self.invalidate(camera_key)
+        return None
+
+
+if __name__ == "__main__":
+    import tempfile
+    from stream_prober import FakeMJPEGServer, StreamProber
+    
+    # 応答しない候補の後ろにある映像URLを、初回は探索・2回目はキャッシュで取得
+    fake = FakeMJPEGServer({'/hang': {'delay': 30}, '/admin': {'kind': 'html'},
+                            '/video.mjpg': {'delay': 0.5}})
+    candidates = [fake.url('/hang'), fake.url('/admin'), fake.url('/video.mjpg')]
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stream_cache.json')
+        for attempt in ('初回起動', '再起動'):
+            cache = StreamCache(path)
+            requests_before = fake.requests
+            begin = time.perf_counter()
+            entry = cache.get_validated('demo')
+            if entry is None:
+                working, _ = StreamProber(stagger=1.0).probe_first(candidates)
+                cache.put('demo', working['url'], content_type=working['content_type'])
+                url = working['url']
+            else:
+                url = entry['url']
+            print(f"{attempt}: {time.perf_counter() - begin:.2f}秒 / "
+                  f"リクエスト {fake.requests - requests_before}回 -> {url}")
+        
+        # カメラ側のURLが変わった場合は確認に失敗して探索に戻る
+        fake.routes.pop('/video.mjpg')
+        print(f"URL変更後: {StreamCache(path).get_validated('demo')}")
+    fake.close()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - カメラURL並列探索
+候補URLを時間差で並列に試行し、全体の期限内で最初に映像を返したURLを採用
+"""
+
+import time
+import base64
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import requests
+
+from config import PROBE_CONFIG
+from mjpeg_parser import JPEG_SOI
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
+    'Accept': 'multipart/x-mixed-replace,*/*',
+    'Connection': 'keep-alive'
+}
+
+
+def _looks_like_video(content_type: str, head: bytes) -> bool:
+    """Content-Type または先頭バイトからMJPEG/JPEGか判定"""
+    content_type = content_type.lower()
+    if 'multipart' in content_type or 'image' in content_type or 'mjpeg' in content_type:
+        return True
+    return (head.startswith(JPEG_SOI) or b'--boundary' in head or
+            b'content-type: image/jpeg' in head.lower())
+
+
+def probe_stream(url: str, session: Optional[requests.Session] = None, auth=None,
+                 headers: Optional[Dict] = None, timeout: Optional[float] = None,
+                 verify: bool = True, cancel: Optional[threading.Event] = None) -> Dict:
+    """
+    単一URLの試行（GET 1回でヘッダー確認、不明な場合は先頭バイトを確認）
+    
+    Args:
+        url: 候補URL
+        session: requests.Session（セッションCookieを使う場合）
+        auth: 認証情報（HTTPBasicAuthなど）
+        headers: リクエストヘッダー
+        timeout: タイムアウト（秒）
+        verify: HTTPS証明書検証
+        cancel: 中断イベント（他の候補が先に成功した場合）
+    
+    Returns:
+        Dict: {'url', 'success', 'status', 'content_type', 'elapsed', 'message' / 'error'}
+    """
+    timeout = PROBE_CONFIG['timeout'] if timeout is None else timeout
+    client = session or requests
+    result = {'url': url, 'success': False, 'status': None, 'content_type': None}
+    start_time = time.monotonic()
+    
+    try:
+        with client.get(url, auth=auth, headers=headers or DEFAULT_HEADERS, timeout=timeout,
+                        stream=True, verify=verify, allow_redirects=True) as response:
+            content_type = response.headers.get('content-type', '')
+            result['status'] = response.status_code
+            result['content_type'] = content_type
+            
+            if response.status_code == 401:
+                result['error'] = '認証エラー (401)'
+            elif response.status_code != 200:
+                result['error'] = f'HTTP {response.status_code}'
+            else:
+                head = b''
+                if not _looks_like_video(content_type, head):
+                    for data in response.iter_content(chunk_size=1024):
+                        head += data
+                        if len(head) >= PROBE_CONFIG['sniff_bytes'] or (cancel and cancel.is_set()):
+                            break
+                if _looks_like_video(content_type, head):
+                    result['success'] = True
+                    result['message'] = f'HTTP {response.status_code}, Content-Type: {content_type}'
+                else:
+                    result['error'] = f'映像形式不明 (Content-Type: {content_type})'
+    
+    except requests.exceptions.SSLError:
+        result['error'] = 'SSL証明書エラー'
+    except (requests.exceptions.ConnectTimeout, requests.exceptions.ReadTimeout):
+        result['error'] = 'タイムアウト'
+    except requests.exceptions.ConnectionError as e:
+        result['error'] = f'接続エラー: {str(e)[:50]}'
+    except Exception as e:
+        result['error'] = f'エラー: {str(e)[:50]}'
+    
+    result['elapsed'] = round(time.monotonic() - start_time, 3)
+    return result
+
+
+class StreamProber:
+    """候補URLの並列試行（全体の期限付き）"""
+    
+    def __init__(self, session: Optional[requests.Session] = None, auth=None,
+                 headers: Optional[Dict] = None, timeout: Optional[float] = None,
+                 deadline: Optional[float] = None, stagger: Optional[float] = None,
+                 verify: bool = True):
+        """
+        初期化
+        
+        Args:
+            session: requests.Session（全候補で共有）
+            auth: 認証情報
+            headers: リクエストヘッダー
+            timeout: 1候補あたりのタイムアウト（秒）
+            deadline: 全体の期限（秒）
+            stagger: 候補を開始する時間差（秒、前の候補が失敗したら即開始）
+            verify: HTTPS証明書検証
+        """
+        self.logger = logging.getLogger(__name__)
+        self.session = session
+        self.auth = auth
+        self.headers = headers
+        self.timeout = PROBE_CONFIG['timeout'] if timeout is None else timeout
+        self.deadline = PROBE_CONFIG['deadline'] if deadline is None else deadline
+        self.stagger = PROBE_CONFIG['stagger'] if stagger is None else stagger
+        self.verify = verify
+    
+    def _probe(self, url: str, cancel: threading.Event, remaining: float) -> Dict:
+        """1候補の試行（期限の残り時間を超えないタイムアウト）"""
+        return probe_stream(url, session=self.session, auth=self.auth, headers=self.headers,
+                            timeout=max(min(self.timeout, remaining), 0.1), verify=self.verify,
+                            cancel=cancel)
+    
+    def _run(self, urls: Sequence[str], stop_on_success: bool) -> Tuple[Optional[Dict], List[Dict]]:
+        """試行本体（stop_on_success=Trueで最初の成功時に打ち切り）"""
+        urls = list(urls)
+        results: List[Optional[Dict]] = [None] * len(urls)
+        if not urls:
+            return None, []
+        
+        stagger = self.stagger if stop_on_success else 0.0
+        cancel = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=min(len(urls), PROBE_CONFIG['max_workers']),
+                                      thread_name_prefix='stream-probe')
+        start_time = time.monotonic()
+        deadline_at = start_time + self.deadline
+        in_flight = {}
+        next_index = 0
+        next_launch = start_time
+        winner = None
+        
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    break
+                
+                # 時間差で次の候補を開始（実行中の候補が失敗したらすぐに開始）
+                while next_index < len(urls) and now >= next_launch:
+                    future = executor.submit(self._probe, urls[next_index], cancel, deadline_at - now)
+                    in_flight[future] = next_index
+                    next_index += 1
+                    next_launch = now + stagger
+                
+                if not in_flight:
+                    break
+                
+                timeout = deadline_at - now
+                if next_index < len(urls):
+                    timeout = min(timeout, next_launch - now)
+                done, _ = wait(in_flight, timeout=max(timeout, 0.0), return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    index = in_flight.pop(future)
+                    results[index] = future.result()
+                    result = results[index]
+                    if not result['success']:
+                        next_launch = time.monotonic()
+                    elif winner is None or index < winner[0]:
+                        winner = (index, result)
+                if winner is not None and stop_on_success:
+                    break
+        finally:
+            cancel.set()
+            # 打ち切った候補は各自のタイムアウトで終了する（待たない）
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        for index, url in enumerate(urls):
+            if results[index] is None:
+                results[index] = {'url': url, 'success': False, 'status': None,
+                                  'content_type': None, 'elapsed': None,
+                                  'error': '未完了（他の候補が成功）' if winner else '全体の期限切れ'}
+        self.logger.info(f"URL探索完了: {len(urls)}件 / {time.monotonic() - start_time:.2f}秒")
+        return (winner[1] if winner else None), results
+    
+    def probe_first(self, urls: Sequence[str]) -> Tuple[Optional[Dict], List[Dict]]:
+        """
+        最初に映像を返した候補を採用（候補は優先順、時間差で順次開始）
+        
+        Args:
+            urls: 候補URL（優先順）
+        
+        Returns:
+            Tuple[Optional[Dict], List[Dict]]: (成功した候補の結果, 全候補の結果)
+        """
+        return self._run(urls, stop_on_success=True)
+    
+    def probe_all(self, urls: Sequence[str]) -> List[Dict]:
+        """全候補を同時に試行（診断用、期限内に終わらない候補は失敗扱い）"""
+        return self._run(urls, stop_on_success=False)[1]
+
+
+class FakeMJPEGServer:
+    """ローカル疑似MJPEGカメラ（探索・再接続の動作確認用）"""
+    
+    BOUNDARY = 'fakeframe'
+    
+    def __init__(self, routes: Optional[Dict[str, Dict]] = None, host: str = '127.0.0.1',
+                 port: int = 0, fps: float = 10.0, frame_size: Tuple[int, int] = (320, 240)):
+        """
+        初期化（port=0で空きポートを使用）
+        
+        Args:
+            routes: パス -> {'kind': 'mjpeg' / 'jpeg' / 'html', 'delay': 応答までの秒数,
+                             'auth': (ユーザー, パスワード)}
+            host: 待ち受けアドレス
+            port: 待ち受けポート
+            fps: MJPEGの配信レート
+            frame_size: フレームサイズ (幅, 高さ)
+        """
+        self.routes = routes or {'/video.mjpg': {'kind': 'mjpeg'}}
+        self.fps = fps
+        self.frame_size = frame_size
+        self.requests = 0
+        self.stop_event = threading.Event()
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                route = server.routes.get(self.path)
+                if route is None:
+                    self.send_error(404)
+                    return
+                if route.get('delay') and server.stop_event.wait(route['delay']):
+                    return
+                if route.get('auth') and not server._authorized(self.headers, route['auth']):
+                    self.send_response(401)
+                    self.send_header('WWW-Authenticate', 'Basic realm="camera"')
+                    self.end_headers()
+                    return
+                
+                kind = route.get('kind', 'mjpeg')
+                try:
+                    if kind == 'html':
+                        body = b'<html><body>camera admin</body></html>'
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'text/html')
+                        self.send_header('Content-Length', str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                    elif kind == 'jpeg':
+                        body = server.frame_jpeg(0)
+                        self.send_response(200)
+                        self.send_header('Content-Type', 'image/jpeg')
+                        self.send_header('Content-Length', str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                    else:
+                        self.send_response(200)
+                        self.send_header('Content-Type',
+                                         f'multipart/x-mixed-replace; boundary={server.BOUNDARY}')
+                        self.end_headers()
+                        index = 0
+                        while not server.stop_event.is_set():
+                            body = server.frame_jpeg(index)
+                            self.wfile.write(f'--{server.BOUNDARY}\r\nContent-Type: image/jpeg\r\n'
+                                             f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii'))
+                            self.wfile.write(body + b'\r\n')
+                            index += 1
+                            server.stop_event.wait(1.0 / server.fps)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+    
+    @staticmethod
+    def _authorized(headers, credentials: Tuple[str, str]) -> bool:
+        """Basic認証の確認"""
+        expected = base64.b64encode(f'{credentials[0]}:{credentials[1]}'.encode()).decode()
+        return headers.get('Authorization') == f'Basic {expected}'
+    
+    def frame_jpeg(self, index: int) -> bytes:
+        """フレーム番号入りのテスト画像"""
+        width, height = self.frame_size
+        frame = np.full((height, width, 3), 64, dtype=np.uint8)
+        cv2.putText(frame, str(index), (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 1.5,
+                    (255, 255, 255), 2)
+        return cv2.imencode('.jpg', frame)[1].tobytes()
+    
+    def url(self, path: str = '/video.mjpg') -> str:
+        """パスのURL"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+    
+    def close(self):
+        """サーバー停止"""
+        self.stop_event.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    # 応答しない候補・管理画面・認証必須の候補に混ざった映像URLを探索
+    fake = FakeMJPEGServer({
+        '/hang': {'kind': 'mjpeg', 'delay': 30},
+        '/admin': {'kind': 'html'},
+        '/auth': {'kind': 'mjpeg', 'auth': ('admin', 'secret')},
+        '/cgi-bin/guest/Video.cgi': {'kind': 'mjpeg'},
+        '/snapshot.jpg': {'kind': 'jpeg'},
+    })
+    candidates = [fake.url('/hang'), fake.url('/missing'), fake.url('/admin'), fake.url('/auth'),
+                  fake.url('/cgi-bin/guest/Video.cgi'), fake.url('/snapshot.jpg')]
+    
+    prober = StreamProber(timeout=8.0, deadline=15.0)
+    
+    begin = time.perf_counter()
+    sequential = [probe_stream(url, timeout=8.0) for url in candidates]
+    sequential_first = next(r['url'] for r in sequential if r['success'])
+    print(f"逐次試行: {time.perf_counter() - begin:.2f}秒 -> {sequential_first}")
+    
+    begin = time.perf_counter()
+    winner, results = prober.probe_first(candidates)
+    print(f"並列試行（最初の成功）: {time.perf_counter() - begin:.2f}秒 -> {winner['url']}")
+    
+    begin = time.perf_counter()
+    results = StreamProber(timeout=2.0, deadline=3.0).probe_all(candidates)
+    print(f"並列試行（全候補）: {time.perf_counter() - begin:.2f}秒")
+    for result in results:
+        status = result.get('message') or result.get('error')
+        print(f"  {'✅' if result['success'] else '❌'} {result['url']}: {status}")
+    fake.close()
@@ -18,6 +18,8 @@ from factory_monitor import FactoryMonitor
 from camera_connection import FactoryCameraConnection
 from object_counter import AdvancedObjectCounter, CountingZone, DetectedObject, ObjectCountVisualizer
 from web_dashboard import WebDashboard
+from youtube_stream_monitor import YouTubeStreamMonitor
+from config import DATA_CONFIG
 
 
 class SystemTester:
@@ -239,6 +241,37 @@ class SystemTester:
             print(f"❌ Webダッシュボードテスト失敗: {e}")
             return False
     
+    def test_motion_gate(self):
+        """動き検出ゲートテスト（同一フレームの連続は推論をスキップ）"""
+        print("\n📋 6. 動き検出ゲートテスト")
+        print("-" * 40)
+        
+        try:
+            stream_monitor = YouTubeStreamMonitor("https://www.youtube.com/live/test")
+            if stream_monitor.motion_gate is None:
+                print("⚠️  動き検出ゲート無効のためスキップ")
+                return True
+            
+            # 同一フレームを5回投入（初回のみ推論、以降は前回結果を再利用）
+            test_image = self.create_test_image()
+            results = [stream_monitor.detect_people_gated(test_image) for _ in range(5)]
+            gate_stats = stream_monitor.motion_gate.get_stats()
+            print(f"   推論: {gate_stats['inferred']}回 / スキップ: {gate_stats['skipped']}回")
+            
+            if gate_stats['inferred'] != 1 or gate_stats['skipped'] != 4:
+                print("❌ 同一フレームの推論がスキップされていません")
+                return False
+            if any(result[0] != results[0][0] for result in results):
+                print("❌ スキップ時の人数が前回の検出結果と一致しません")
+                return False
+            
+            print("✅ 動き検出ゲート正常（前回の検出結果を再利用）")
+            return True
+        
+        except Exception as e:
+            print(f"❌ 動き検出ゲートテスト失敗: {e}")
+            return False
+    
     def create_test_image(self):
         """テスト用画像作成"""
         # 640x480の背景画像作成
@@ -342,7 +375,8 @@ class SystemTester:
                     print(f"     {item}: {count}個")
         
         print("\n💾 データファイル:")
-        for filename in ['factory_monitor.log', 'detection_history.json']:
+        for filename in ['factory_monitor.log',
+                         os.path.join(DATA_CONFIG['data_dir'], DATA_CONFIG['history_db'])]:
             if os.path.exists(filename):
                 size = os.path.getsize(filename)
                 print(f"   {filename}: {size} bytes")
@@ -360,6 +394,7 @@ class SystemTester:
         test_results.append(("物体検出", self.test_object_detection()))
         test_results.append(("高度カウント", self.test_advanced_counting()))
         test_results.append(("Webダッシュボード", self.test_web_dashboard()))
+        test_results.append(("動き検出ゲート", self.test_motion_gate()))
         
         # 結果サマリー
         print("\n" + "=" * 50)
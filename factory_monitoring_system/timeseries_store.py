@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - カウント時系列リングバッファ
+int64エポックミリ秒 + クラス別カウント列の固定容量カラム形式で履歴を保持
+"""
+
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def to_epoch_ms(timestamp) -> int:
+    """datetime / ISO文字列 / UNIX秒 -> エポックミリ秒"""
+    if timestamp is None:
+        return int(time.time() * 1000)
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    if isinstance(timestamp, datetime):
+        return int(timestamp.timestamp() * 1000)
+    return int(float(timestamp) * 1000)
+
+
+def from_epoch_ms(timestamp_ms: int) -> datetime:
+    """エポックミリ秒 -> ローカル時刻のdatetime"""
+    return datetime.fromtimestamp(timestamp_ms / 1000.0)
+
+
+class CountRingBuffer:
+    """固定容量のカウント履歴（列はクラス出現時に追加）"""
+    
+    def __init__(self, capacity: int, columns: Optional[Sequence[str]] = None,
+                 dtype=np.int32):
+        """
+        初期化
+        
+        Args:
+            capacity: 最大保持件数（超過分は古い順に上書き）
+            columns: 初期列名
+            dtype: カウント列の型
+        """
+        self.capacity = capacity
+        self.columns: List[str] = []
+        self._column_index: Dict[str, int] = {}
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, 0), dtype=dtype)
+        self._next = 0
+        self._size = 0
+        self.appended = 0  # 累計追加件数（上書き分を含む）
+        
+        for column in columns or ():
+            self._ensure_column(column)
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    @property
+    def nbytes(self) -> int:
+        """使用メモリ（バイト）"""
+        return self.timestamps.nbytes + self.values.nbytes
+    
+    def _ensure_column(self, column: str) -> int:
+        """列追加（既存の行は0で埋める）"""
+        index = self._column_index.get(column)
+        if index is None:
+            index = len(self.columns)
+            self.columns.append(column)
+            self._column_index[column] = index
+            self.values = np.hstack([self.values, np.zeros((self.capacity, 1), dtype=self.values.dtype)])
+        return index
+    
+    def append(self, counts: Dict[str, int], timestamp=None):
+        """
+        1件追加
+        
+        Args:
+            counts: 列名 -> 値
+            timestamp: 記録時刻（datetime / ISO文字列 / UNIX秒、Noneの場合は現在時刻）
+        """
+        row = self._next
+        self.timestamps[row] = to_epoch_ms(timestamp)
+        self.values[row] = 0
+        for column, value in counts.items():
+            index = self._ensure_column(column)
+            self.values[row, index] = value
+        
+        self._next = (row + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+        self.appended += 1
+    
+    def clear(self):
+        """全件削除"""
+        self._next = 0
+        self._size = 0
+    
+    def _segments(self) -> List[Tuple[int, int]]:
+        """時系列順の連続区間 [(開始行, 終了行), ...]（一周後は2区間）"""
+        if self._size < self.capacity:
+            return [(0, self._size)]
+        return [(self._next, self.capacity), (0, self._next)]
+    
+    def _gather(self, ranges: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """行区間の連結"""
+        ranges = [(start, end) for start, end in ranges if end > start]
+        if not ranges:
+            return self.timestamps[:0], self.values[:0]
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            return self.timestamps[start:end], self.values[start:end]
+        return (np.concatenate([self.timestamps[start:end] for start, end in ranges]),
+                np.concatenate([self.values[start:end] for start, end in ranges]))
+    
+    def window(self, since=None, until=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        期間指定の取得（各区間をnp.searchsortedで二分探索）
+        
+        Args:
+            since: 開始時刻（この時刻より後）
+            until: 終了時刻（この時刻以前）
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (タイムスタンプ[ms], カウント行列[件数, 列数])
+        """
+        since_ms = None if since is None else to_epoch_ms(since)
+        until_ms = None if until is None else to_epoch_ms(until)
+        
+        ranges = []
+        for start, end in self._segments():
+            timestamps = self.timestamps[start:end]
+            first = start if since_ms is None else start + int(np.searchsorted(timestamps, since_ms, 'right'))
+            last = end if until_ms is None else start + int(np.searchsorted(timestamps, until_ms, 'right'))
+            ranges.append((first, last))
+        return self._gather(ranges)
+    
+    def last(self, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """直近limit件の取得"""
+        ranges = []
+        remaining = max(min(limit, self._size), 0)
+        for start, end in reversed(self._segments()):
+            take = min(remaining, end - start)
+            ranges.insert(0, (end - take, end))
+            remaining -= take
+        return self._gather(ranges)
+    
+    def latest(self) -> Dict[str, int]:
+        """最新1件のカウント（0の列は除く）"""
+        if self._size == 0:
+            return {}
+        row = (self._next - 1) % self.capacity
+        return self._row_dict(self.values[row])
+    
+    def column(self, values: np.ndarray, name: str) -> np.ndarray:
+        """window()/last() の結果から列を取得（未登録の列は0）"""
+        index = self._column_index.get(name)
+        if index is None:
+            return np.zeros(len(values), dtype=self.values.dtype)
+        return values[:, index]
+    
+    def active_columns(self, values: np.ndarray) -> List[str]:
+        """期間内に0以外の値を持つ列"""
+        if len(values) == 0:
+            return []
+        return [self.columns[i] for i in np.flatnonzero(values.any(axis=0)).tolist()]
+    
+    def _row_dict(self, row: np.ndarray) -> Dict[str, int]:
+        """行 -> 辞書（0の列は除く）"""
+        return {self.columns[i]: int(row[i]) for i in np.flatnonzero(row).tolist()}
+    
+    def iter_records(self, since=None, limit: Optional[int] = None,
+                     total_key: str = 'total') -> Iterator[Dict]:
+        """
+        従来形式の辞書として走査（JSON保存・API応答用）
+        
+        Args:
+            since: 開始時刻
+            limit: 直近件数（指定時はsinceより優先）
+            total_key: 合計値のキー名
+        
+        Yields:
+            Dict: {'timestamp': ISO文字列, 'counts': {...}, total_key: 合計}
+        """
+        timestamps, values = self.last(limit) if limit is not None else self.window(since)
+        totals = values.sum(axis=1).tolist() if values.size else [0] * len(timestamps)
+        for timestamp_ms, row, total in zip(timestamps.tolist(), values, totals):
+            yield {
+                'timestamp': from_epoch_ms(timestamp_ms).isoformat(),
+                'counts': self._row_dict(row),
+                total_key: int(total)
+            }
+    
+    def to_records(self, since=None, limit: Optional[int] = None,
+                   total_key: str = 'total') -> List[Dict]:
+        """従来形式の辞書リスト"""
+        return list(self.iter_records(since, limit, total_key))
+    
+    def load_records(self, records: Sequence[Dict], counts_key: str = 'counts'):
+        """従来形式の辞書リストから復元（ISO文字列の解析は読み込み時の1回のみ）"""
+        self.clear()
+        for record in records:
+            counts = record.get(counts_key)
+            if counts is None:
+                counts = {key: value for key, value in record.items()
+                          if key != 'timestamp' and isinstance(value, (int, float))}
+            self.append(counts, record.get('timestamp'))
+
+
+if __name__ == "__main__":
+    # 1日分（5秒間隔）の3クラス履歴を保持した場合のメモリ・集計時間
+    capacity = 17280
+    buffer = CountRingBuffer(capacity)
+    rng = np.random.default_rng(0)
+    start_time = time.time() - capacity * 5
+    dict_history = []
+    for i in range(capacity):
+        counts = {'car': int(rng.integers(0, 20)), 'truck': int(rng.integers(0, 5))}
+        if i % 7 == 0:
+            counts['person'] = int(rng.integers(1, 4))
+        timestamp = start_time + i * 5
+        buffer.append(counts, timestamp)
+        dict_history.append({
+            'timestamp': datetime.fromtimestamp(timestamp).isoformat(),
+            'counts': counts,
+            'total': sum(counts.values())
+        })
+    
+    cutoff = time.time() - 3600
+    
+    begin = time.perf_counter()
+    recent = [entry for entry in dict_history
+              if datetime.fromisoformat(entry['timestamp']) > datetime.fromtimestamp(cutoff)]
+    dict_average = sum(entry['counts'].get('car', 0) for entry in recent) / len(recent)
+    dict_ms = (time.perf_counter() - begin) * 1000
+    
+    begin = time.perf_counter()
+    timestamps, values = buffer.window(since=cutoff)
+    ring_average = float(buffer.column(values, 'car').mean())
+    ring_ms = (time.perf_counter() - begin) * 1000
+    
+    print(f"件数: {len(buffer)} / 列: {buffer.columns}")
+    print(f"メモリ: {buffer.nbytes / len(buffer):.0f} バイト/件")
+    print(f"直近1時間の平均(dict + fromisoformat): {dict_average:.2f} ({dict_ms:.2f} ms)")
+    print(f"直近1時間の平均(リングバッファ): {ring_average:.2f} ({ring_ms:.3f} ms)")
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 
-from flask import Flask, render_template_string, jsonify, request
-import cv2
-import numpy as np
-from ultralytics import YOLO
-import base64
+from flask import Flask, render_template_string, jsonify, request, Response
+from batch_inference import get_shared_engine
+from detection_results import DetectionArray, draw_detections
+from frame_transport import FrameChannel, MJPEG_MIMETYPE
+from mjpeg_parser import iter_mjpeg_frames, decode_jpeg
 import threading
 import time
 import os
@@ -16,6 +16,8 @@ app = Flask(__name__)
 class VercelIntegratedYOLO:
     def __init__(self):
         self.model = None
+        self.inference_engine = None
+        self.frame_channel = FrameChannel()
         self.current_frame = None
         self.detection_data = {
             'detections': [],
@@ -34,7 +36,9 @@ class VercelIntegratedYOLO:
             # Vercel環境でのモデル読み込み
             model_path = 'yolo11n.pt'
             if os.path.exists(model_path):
-                self.model = YOLO(model_path)
+                # 同一プロセス内のストリームでバッチ推論エンジンを共有
+                self.inference_engine = get_shared_engine(model_path)
+                self.model = self.inference_engine.model
                 print("✅ YOLOモデル読み込み成功")
             else:
                 print("❌ YOLOモデルファイルが見つかりません")
@@ -47,31 +51,15 @@ class VercelIntegratedYOLO:
             return frame, []
         
         try:
-            results = self.model(frame, verbose=False)
-            detections = []
+            results = [self.inference_engine.infer(frame)]
             
-            for result in results:
-                boxes = result.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        conf = box.conf[0].cpu().numpy()
-                        cls = int(box.cls[0].cpu().numpy())
-                        
-                        if conf > 0.5:  # 信頼度閾値
-                            class_name = self.model.names[cls]
-                            detections.append({
-                                'class': class_name,
-                                'confidence': float(conf),
-                                'bbox': [int(x1), int(y1), int(x2), int(y2)]
-                            })
-                            
-                            # バウンディングボックスを描画
-                            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                            cv2.putText(frame, f'{class_name}: {conf:.2f}', 
-                                      (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            # 検出結果をNumPyへ一括変換・信頼度でフィルタ
+            detections = DetectionArray.from_yolo_result(results[0], self.model.names, conf_threshold=0.5)
+            
+            # バウンディングボックス・ラベル描画
+            draw_detections(frame, detections, label_background=False)
             
-            return frame, detections
+            return frame, detections.to_dicts()
             
         except Exception as e:
             print(f"❌ 検出エラー: {e}")
@@ -86,36 +74,47 @@ class VercelIntegratedYOLO:
         self.detection_data['status'] = 'streaming'
         frame_count = 0
         
+        # カメラへの接続は1本のみ（全視聴者は/api/video_feedで共有）
+        session = requests.Session()
+        
         while self.is_streaming:
             try:
                 # HTTPストリームから画像を取得
-                response = requests.get(self.camera_url, timeout=10, stream=True)
+                response = session.get(self.camera_url, timeout=10, stream=True)
                 if response.status_code == 200:
-                    # バイトデータから画像を作成
-                    img_array = np.frombuffer(response.content, np.uint8)
-                    frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+                    if response.headers.get('content-type', '').startswith('multipart/'):
+                        # MJPEG: 接続を維持したまま連続受信
+                        jpeg_frames = iter_mjpeg_frames(response)
+                    else:
+                        # 静止画URL: 1リクエスト1フレーム
+                        jpeg_frames = [response.content]
                     
-                    if frame is not None:
-                        # オブジェクト検出
-                        processed_frame, detections = self.detect_objects(frame)
-                        
-                        # JPEGエンコード
-                        _, buffer = cv2.imencode('.jpg', processed_frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                        frame_base64 = base64.b64encode(buffer).decode('utf-8')
+                    for jpeg_data in jpeg_frames:
+                        if not self.is_streaming:
+                            break
                         
-                        # データ更新
-                        self.current_frame = frame_base64
-                        self.detection_data.update({
-                            'detections': detections,
-                            'detection_count': len(detections),
-                            'timestamp': datetime.now().isoformat(),
-                            'frame_count': frame_count,
-                            'status': 'streaming'
-                        })
+                        # バイトデータから画像を作成
+                        frame = decode_jpeg(jpeg_data)
                         
-                        frame_count += 1
+                        if frame is not None:
+                            # オブジェクト検出
+                            processed_frame, detections = self.detect_objects(frame)
+                            
+                            # JPEGエンコード・データ更新
+                            self.current_frame = self.frame_channel.publish(processed_frame)
+                            self.detection_data.update({
+                                'detections': detections,
+                                'detection_count': len(detections),
+                                'timestamp': datetime.now().isoformat(),
+                                'frame_count': frame_count,
+                                'status': 'streaming'
+                            })
+                            
+                            frame_count += 1
                         
-                    time.sleep(0.1)  # 10 FPS
+                        time.sleep(0.1)  # 10 FPS
+                    
+                    response.close()
                 else:
                     print(f"❌ カメラ接続エラー: {response.status_code}")
                     time.sleep(2)
@@ -385,7 +384,7 @@ def index():
                     if (data.success) {
                         document.getElementById('status').textContent = '✅ YOLO検出開始';
                         document.getElementById('status').className = 'status';
-                        updateInterval = setInterval(updateFrame, 100);
+                        updateInterval = setInterval(updateFrame, 1000); // 検出結果のみ更新（映像は/api/video_feed）
                     }
                 });
             }
@@ -403,6 +402,7 @@ def index():
                 .then(response => response.json())
                 .then(data => {
                     document.getElementById('status').textContent = '⏹️ 検出停止';
+                    document.getElementById('video').removeAttribute('src');
                     document.getElementById('video').style.display = 'none';
                     document.getElementById('loading').style.display = 'block';
                     document.getElementById('loading').textContent = '⏸️ 検出停止中';
@@ -419,12 +419,14 @@ def index():
                 if (!isStreaming) return;
                 
                 try {
-                    const response = await fetch('/api/get_frame');
+                    const response = await fetch('/api/get_frame?binary=1');
                     const data = await response.json();
                     
-                    if (data.success && data.frame) {
+                    if (data.success && data.frame_url) {
                         const video = document.getElementById('video');
-                        video.src = 'data:image/jpeg;base64,' + data.frame;
+                        if (!video.getAttribute('src')) {
+                            video.src = '/api/video_feed';
+                        }
                         video.style.display = 'block';
                         document.getElementById('loading').style.display = 'none';
                         
@@ -511,21 +513,43 @@ def stop_stream():
 def get_frame():
     """現在のフレームと検出データを取得"""
     try:
-        if yolo_system.current_frame:
-            return jsonify({
+        frame = yolo_system.current_frame
+        if frame:
+            data = {
                 'success': True,
-                'frame': yolo_system.current_frame,
+                'seq': frame.seq,
                 'detections': yolo_system.detection_data['detections'],
                 'detection_count': yolo_system.detection_data['detection_count'],
                 'timestamp': yolo_system.detection_data['timestamp'],
                 'frame_count': yolo_system.detection_data['frame_count'],
                 'status': yolo_system.detection_data['status']
-            })
+            }
+            if request.args.get('binary') == '1':
+                # 画像本体は/api/frame.jpgからバイナリで取得
+                data['frame_url'] = f'/api/frame.jpg?seq={frame.seq}'
+            else:
+                data['frame'] = frame.base64
+            return jsonify(data)
         else:
             return jsonify({'success': False, 'error': 'No frame available'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/video_feed')
+def video_feed():
+    """MJPEGストリーム配信（全視聴者で1キャプチャ・1エンコードを共有）"""
+    return Response(yolo_system.frame_channel.iter_multipart(lambda: yolo_system.is_streaming),
+                    mimetype=MJPEG_MIMETYPE)
+
+@app.route('/api/frame.jpg')
+def frame_jpeg():
+    """最新フレーム取得（JPEGバイナリ）"""
+    frame = yolo_system.current_frame
+    if not frame:
+        return Response(status=204)
+    return Response(frame.jpeg, mimetype='image/jpeg',
+                    headers={'Cache-Control': 'no-store', 'X-Frame-Seq': str(frame.seq)})
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False) 
\ No newline at end of file
@@ -8,13 +8,10 @@ Flask-SocketIOを使用したリアルタイム監視ダッシュボード
 import os
 import json
 import time
-import base64
 from datetime import datetime, timedelta
 from threading import Thread
 import logging
 
-import cv2
-import numpy as np
 from flask import Flask, render_template, request, jsonify
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
@@ -23,6 +20,7 @@ from config import WEB_CONFIG, DATA_CONFIG
 from factory_monitor import FactoryMonitor
 from camera_connection import FactoryCameraConnection
 from object_counter import AdvancedObjectCounter, ObjectCountVisualizer
+from frame_transport import FrameBroadcaster
 
 
 class WebDashboard:
@@ -46,11 +44,18 @@ class WebDashboard:
         self.counter = AdvancedObjectCounter()
         self.visualizer = ObjectCountVisualizer(self.counter)
         
+        # カウントゾーンの外接矩形のみ推論
+        self.monitor.set_roi_zones(self.counter.counting_zones)
+        
+        # フレーム配信（ティア毎に1フレーム1回エンコード・全クライアント共有）
+        self.broadcaster = FrameBroadcaster(self.socketio)
+        
         # ダッシュボード状態
         self.is_streaming = False
         self.connected_clients = 0
         self.last_frame = None
         self.last_counts = {}
+        self.last_inventory_summary = None
         
         # ルート設定
         self.setup_routes()
@@ -72,9 +77,12 @@ class WebDashboard:
             return jsonify({
                 'monitor_status': self.monitor.get_current_status(),
                 'camera_info': self.camera.get_camera_info(),
-                'inventory_summary': self.counter.get_inventory_summary(),
+                'inventory_summary': self.get_inventory_summary(),
                 'is_streaming': self.is_streaming,
-                'connected_clients': self.connected_clients
+                'connected_clients': self.connected_clients,
+                'frame_transport': self.broadcaster.get_stats(),
+                'motion_gate': self.camera.motion_gate.get_stats() if self.camera.motion_gate else {},
+                'tracking': self.counter.tracker.get_stats() if self.counter.tracker else {}
             })
         
         @self.app.route('/api/statistics')
@@ -88,9 +96,19 @@ class WebDashboard:
         
         @self.app.route('/api/history')
         def get_history():
-            """履歴データAPI"""
+            """履歴データAPI（hours指定時はロールアップの時系列）"""
+            hours = request.args.get('hours', type=float)
+            if hours is not None:
+                series = self.monitor.history_store.get_series(
+                    since=time.time() - hours * 3600,
+                    scope=request.args.get('zone', ''),
+                    resolution=request.args.get('resolution'),
+                    total_key='total_objects'
+                )
+                return jsonify({'history': series['records'], 'resolution': series['resolution']})
+            
             limit = request.args.get('limit', 100, type=int)
-            history = list(self.monitor.detection_history)[-limit:]
+            history = self.monitor.detection_history.to_records(limit=limit, total_key='total_objects')
             return jsonify({'history': history})
         
         @self.app.route('/api/connect_camera', methods=['POST'])
@@ -155,25 +173,36 @@ class WebDashboard:
         def handle_connect():
             """クライアント接続"""
             self.connected_clients += 1
+            self.broadcaster.subscribe(request.sid)
             self.logger.info(f"クライアント接続: {self.connected_clients}人")
-            emit('status', {'message': '接続されました', 'clients': self.connected_clients})
+            emit('status', {
+                'message': '接続されました',
+                'clients': self.connected_clients,
+                'tiers': list(self.broadcaster.tiers),
+                'tier': self.broadcaster.default_tier
+            })
         
         @self.socketio.on('disconnect')
         def handle_disconnect():
             """クライアント切断"""
             self.connected_clients = max(0, self.connected_clients - 1)
+            self.broadcaster.unsubscribe(request.sid)
             self.logger.info(f"クライアント切断: {self.connected_clients}人")
         
+        @self.socketio.on('subscribe_tier')
+        def handle_subscribe_tier(data):
+            """配信ティア変更"""
+            tier = (data or {}).get('tier')
+            success = self.broadcaster.subscribe(request.sid, tier)
+            emit('tier_subscribed', {'success': success, 'tier': tier})
+        
         @self.socketio.on('request_frame')
         def handle_frame_request():
             """フレーム要求"""
-            if self.last_frame is not None:
-                frame_data = self.encode_frame(self.last_frame)
-                emit('frame_data', {
-                    'image': frame_data,
-                    'counts': self.last_counts,
-                    'timestamp': datetime.now().isoformat()
-                })
+            self.broadcaster.send_latest(request.sid, {
+                'counts': self.last_counts,
+                'timestamp': datetime.now().isoformat()
+            })
         
         @self.socketio.on('request_status')
         def handle_status_request():
@@ -181,20 +210,16 @@ class WebDashboard:
             status = {
                 'monitor_status': self.monitor.get_current_status(),
                 'camera_info': self.camera.get_camera_info(),
-                'inventory_summary': self.counter.get_inventory_summary(),
+                'inventory_summary': self.get_inventory_summary(),
                 'is_streaming': self.is_streaming
             }
             emit('status_update', status)
     
-    def encode_frame(self, frame: np.ndarray) -> str:
-        """フレームをBase64エンコード"""
-        try:
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-            frame_data = base64.b64encode(buffer).decode('utf-8')
-            return f"data:image/jpeg;base64,{frame_data}"
-        except Exception as e:
-            self.logger.error(f"フレームエンコードエラー: {e}")
-            return ""
+    def get_inventory_summary(self):
+        """在庫サマリー取得（ストリーミング中は直近ティックの計算結果を共有）"""
+        if self.is_streaming and self.last_inventory_summary is not None:
+            return self.last_inventory_summary
+        return self.counter.get_inventory_summary()
     
     def start_video_streaming(self):
         """ビデオストリーミング開始"""
@@ -219,27 +244,36 @@ class WebDashboard:
                 ret, frame = self.camera.capture_single_frame()
                 
                 if ret and frame is not None:
-                    # 物体検出
-                    counts, annotated_frame = self.monitor.detect_objects(frame)
+                    # 物体検出（描画は視聴者がいる場合のみ）
+                    result = self.monitor.detect_frame(frame, motion_gate=self.camera.motion_gate)
+                    
+                    # 在庫カウント更新（推論しなかったフレームは追跡を予測のみ進める）
+                    if result.inferred:
+                        counts = self.counter.count_objects_in_array(result.detections)
+                    else:
+                        counts = self.counter.advance_tracks()
                     
-                    # ダッシュボード作成
-                    dashboard_frame = self.visualizer.create_count_dashboard(annotated_frame, counts)
+                    # クリップ録画用バッファ投入（アラート発動時のプリロールに含める）
+                    self.camera.record_clip_frame(frame, counts)
                     
-                    # カウントゾーン描画
-                    final_frame = self.counter.draw_counting_zones(dashboard_frame)
+                    # 履歴記録（永続化・ロールアップはバックグラウンドで更新）
+                    self.monitor.record_detection(counts, self.counter.zone_counts)
                     
-                    # フレーム・カウント更新
-                    self.last_frame = final_frame
+                    # カウント更新（在庫サマリーは1ティック1回計算）
                     self.last_counts = counts
+                    self.last_inventory_summary = self.counter.get_inventory_summary()
                     
-                    # クライアントに送信
-                    if self.connected_clients > 0:
-                        frame_data = self.encode_frame(final_frame)
-                        self.socketio.emit('frame_update', {
-                            'image': frame_data,
+                    # クライアントに送信（購読中ティアのみエンコード・遅いクライアントは最新のみ）
+                    if self.broadcaster.client_count > 0:
+                        # ダッシュボード作成・カウントゾーン描画
+                        dashboard_frame = self.visualizer.create_count_dashboard(result.annotated, counts)
+                        final_frame = self.counter.draw_counting_zones(dashboard_frame)
+                        self.last_frame = final_frame
+                        
+                        self.broadcaster.broadcast(final_frame, {
                             'counts': counts,
                             'timestamp': datetime.now().isoformat(),
-                            'inventory_summary': self.counter.get_inventory_summary()
+                            'inventory_summary': self.last_inventory_summary
                         })
                 
                 # フレームレート制御
@@ -400,6 +434,15 @@ class WebDashboard:
             <button class="btn" onclick="startStreaming()" id="start-btn" disabled>▶️ 開始</button>
             <button class="btn" onclick="stopStreaming()" id="stop-btn" disabled>⏹️ 停止</button>
             
+            <div class="input-group">
+                <label for="stream-tier">配信画質:</label>
+                <select id="stream-tier" onchange="changeTier()">
+                    <option value="high">高画質（原寸）</option>
+                    <option value="medium">標準</option>
+                    <option value="low">低画質（タブレット向け）</option>
+                </select>
+            </div>
+            
             <hr style="margin: 20px 0;">
             
             <h3>📊 システム状態</h3>
@@ -467,11 +510,24 @@ class WebDashboard:
             updateConnectionStatus(false);
         });
 
-        socket.on('frame_update', function(data) {
-            updateVideoStream(data);
+        socket.on('frame_binary', function(data, ack) {
+            // 描画完了後に受信確認（サーバー側はそれまで次フレームを最新1枚に間引く）
+            updateVideoStream(data, ack || function() {});
             updateInventoryDisplay(data);
         });
 
+        socket.on('status', function(data) {
+            const tierSelect = document.getElementById('stream-tier');
+            if (data.tier && tierSelect) {
+                const preferred = localStorage.getItem('streamTier') ||
+                    (window.innerWidth < 800 ? 'low' : data.tier);
+                tierSelect.value = preferred;
+                if (preferred !== data.tier) {
+                    changeTier();
+                }
+            }
+        });
+
         socket.on('status_update', function(data) {
             updateSystemStatus(data);
         });
@@ -537,16 +593,39 @@ class WebDashboard:
             });
         }
 
-        // ビデオストリーム更新
-        function updateVideoStream(data) {
+        // ビデオストリーム更新（JPEGバイナリ -> Blob URL）
+        let currentFrameUrl = null;
+        let lastFrameSeq = 0;
+
+        function updateVideoStream(data, done) {
             const videoElement = document.getElementById('video-stream');
             const noStreamElement = document.getElementById('no-stream');
             
-            if (data.image) {
-                videoElement.src = data.image;
-                videoElement.style.display = 'block';
-                noStreamElement.style.display = 'none';
+            if (!data.image || (data.meta && data.meta.seq <= lastFrameSeq)) {
+                done();
+                return;
+            }
+            lastFrameSeq = data.meta ? data.meta.seq : lastFrameSeq;
+            
+            const blob = new Blob([data.image], {type: 'image/jpeg'});
+            const previousUrl = currentFrameUrl;
+            currentFrameUrl = URL.createObjectURL(blob);
+            videoElement.onload = done;
+            videoElement.onerror = done;
+            videoElement.src = currentFrameUrl;
+            if (previousUrl) {
+                URL.revokeObjectURL(previousUrl);
             }
+            videoElement.style.display = 'block';
+            noStreamElement.style.display = 'none';
+        }
+
+        // 配信ティア変更
+        function changeTier() {
+            const tier = document.getElementById('stream-tier').value;
+            localStorage.setItem('streamTier', tier);
+            lastFrameSeq = 0;
+            socket.emit('subscribe_tier', {tier: tier});
         }
 
         // 在庫表示更新
@@ -670,6 +749,9 @@ def main():
         print("\nダッシュボードを終了します...")
     except Exception as e:
         print(f"エラー: {e}")
+    finally:
+        dashboard.camera.disconnect_camera()
+        dashboard.monitor.close()
 
 
 if __name__ == "__main__":
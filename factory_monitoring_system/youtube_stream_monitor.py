@@ -11,7 +11,6 @@ import time
 import json
 import os
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
 from typing import Dict, List, Tuple, Optional
 import logging
 import threading
@@ -20,6 +19,9 @@ import requests
 
 from factory_monitor import FactoryMonitor
 from object_counter import AdvancedObjectCounter, CountingZone, DetectedObject
+from detection_results import DetectionArray, draw_detections
+from motion_gate import create_motion_gate
+from timeseries_store import CountRingBuffer, from_epoch_ms
 
 
 class YouTubeStreamMonitor:
@@ -44,8 +46,11 @@ class YouTubeStreamMonitor:
         self.is_streaming = False
         self.stream_url = None
         
+        # 動きのないフレームは人検出をスキップ
+        self.motion_gate = create_motion_gate()
+        
         # 人数カウント専用設定
-        self.person_counts = deque(maxlen=1000)
+        self.person_counts = CountRingBuffer(1000, columns=['count', 'max_today'])
         self.current_person_count = 0
         self.max_person_count = 0
         self.total_detections = 0
@@ -158,55 +163,13 @@ class YouTubeStreamMonitor:
                 verbose=False
             )
             
-            detected_objects = []
-            annotated_frame = frame.copy()
-            person_count = 0
+            # 検出結果をNumPyへ一括変換（人検出の信頼度閾値: 0.3）
+            detections = DetectionArray.from_yolo_result(results[0], self.monitor.model.names, conf_threshold=0.3)
+            detected_objects = detections.to_detected_objects()
+            person_count = len(detections)
             
-            if results and len(results) > 0:
-                result = results[0]
-                
-                if result.boxes is not None and len(result.boxes) > 0:
-                    boxes = result.boxes.xyxy.cpu().numpy()
-                    confidences = result.boxes.conf.cpu().numpy()
-                    
-                    for i, (box, conf) in enumerate(zip(boxes, confidences)):
-                        if conf >= 0.3:  # 人検出の信頼度閾値
-                            x1, y1, x2, y2 = box.astype(int)
-                            
-                            # 検出オブジェクト作成
-                            detected_obj = DetectedObject(
-                                class_name='person',
-                                confidence=conf,
-                                bbox=(x1, y1, x2, y2),
-                                center=((x1 + x2) // 2, (y1 + y2) // 2),
-                                area=(x2 - x1) * (y2 - y1),
-                                timestamp=datetime.now()
-                            )
-                            detected_objects.append(detected_obj)
-                            person_count += 1
-                            
-                            # バウンディングボックス描画
-                            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                            
-                            # 信頼度表示
-                            label = f"Person: {conf:.2f}"
-                            label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
-                            cv2.rectangle(
-                                annotated_frame,
-                                (x1, y1 - label_size[1] - 10),
-                                (x1 + label_size[0], y1),
-                                (0, 255, 0),
-                                -1
-                            )
-                            cv2.putText(
-                                annotated_frame,
-                                label,
-                                (x1, y1 - 5),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                0.6,
-                                (255, 255, 255),
-                                2
-                            )
+            # バウンディングボックス・信頼度描画
+            annotated_frame = draw_detections(frame.copy(), detections, lambda _: (0, 255, 0))
             
             return person_count, annotated_frame, detected_objects
             
@@ -214,6 +177,25 @@ class YouTubeStreamMonitor:
             self.logger.error(f"人検出エラー: {e}")
             return 0, frame, []
     
+    def detect_people_gated(self, frame: np.ndarray) -> Tuple[int, np.ndarray, List[DetectedObject]]:
+        """
+        人検出（動きがない間は前回の検出結果を再利用）
+        
+        Args:
+            frame: 入力フレーム
+        
+        Returns:
+            Tuple[int, np.ndarray, List[DetectedObject]]: (人数, 描画済みフレーム, 検出オブジェクト)
+        """
+        if self.motion_gate is None:
+            return self.detect_people_in_frame(frame)
+        if not self.motion_gate.should_infer(frame):
+            return self.motion_gate.last_result
+        
+        result = self.detect_people_in_frame(frame)
+        self.motion_gate.store(result)
+        return result
+    
     def draw_beach_info(self, frame: np.ndarray, person_count: int) -> np.ndarray:
         """海岸情報描画"""
         try:
@@ -305,9 +287,7 @@ class YouTubeStreamMonitor:
         self.total_detections += person_count
         
         # 履歴追加
-        timestamp = datetime.now()
         self.person_counts.append({
-            'timestamp': timestamp.isoformat(),
             'count': person_count,
             'max_today': self.max_person_count
         })
@@ -321,7 +301,7 @@ class YouTubeStreamMonitor:
                 'current_count': self.current_person_count,
                 'max_count_today': self.max_person_count,
                 'total_detections': self.total_detections,
-                'recent_counts': list(self.person_counts)[-100:]  # 最新100件
+                'recent_counts': self._recent_counts(100)  # 最新100件
             }
             
             with open('beach_statistics.json', 'w', encoding='utf-8') as f:
@@ -332,27 +312,41 @@ class YouTubeStreamMonitor:
         except Exception as e:
             self.logger.error(f"統計データ保存エラー: {e}")
     
+    def _recent_counts(self, limit: int) -> List[Dict]:
+        """直近の人数履歴（JSON保存用）"""
+        timestamps, values = self.person_counts.last(limit)
+        return [
+            {'timestamp': from_epoch_ms(timestamp).isoformat(), 'count': int(count), 'max_today': int(max_today)}
+            for timestamp, (count, max_today) in zip(timestamps.tolist(), values.tolist())
+        ]
+    
     def get_hourly_statistics(self) -> Dict:
         """時間別統計取得"""
         try:
-            now = datetime.now()
-            hourly_stats = defaultdict(list)
+            # 過去24時間のデータを時間別に分類（タイムスタンプ列から一括計算）
+            timestamps, values = self.person_counts.window(since=time.time() - 86400)
+            if len(timestamps) == 0:
+                return {}
+            
+            counts = self.person_counts.column(values, 'count').astype(np.int64)
+            utc_offset_ms = int(datetime.now().astimezone().utcoffset().total_seconds() * 1000)
+            hours = ((timestamps + utc_offset_ms) // 3600000) % 24
             
-            # 過去24時間のデータを時間別に分類
-            for entry in self.person_counts:
-                timestamp = datetime.fromisoformat(entry['timestamp'])
-                if (now - timestamp).total_seconds() <= 86400:  # 24時間以内
-                    hour_key = timestamp.strftime("%H:00")
-                    hourly_stats[hour_key].append(entry['count'])
+            samples = np.bincount(hours, minlength=24)
+            totals = np.bincount(hours, weights=counts, minlength=24)
+            maxima = np.full(24, np.iinfo(np.int64).min)
+            minima = np.full(24, np.iinfo(np.int64).max)
+            np.maximum.at(maxima, hours, counts)
+            np.minimum.at(minima, hours, counts)
             
             # 時間別平均・最大値計算
             result = {}
-            for hour, counts in hourly_stats.items():
-                result[hour] = {
-                    'average': sum(counts) / len(counts),
-                    'max': max(counts),
-                    'min': min(counts),
-                    'samples': len(counts)
+            for hour in np.flatnonzero(samples).tolist():
+                result[f"{hour:02d}:00"] = {
+                    'average': float(totals[hour] / samples[hour]),
+                    'max': int(maxima[hour]),
+                    'min': int(minima[hour]),
+                    'samples': int(samples[hour])
                 }
             
             return result
@@ -401,9 +395,9 @@ class YouTubeStreamMonitor:
                 
                 frame_count += 1
                 
-                # 人検出実行（5フレームに1回）
+                # 人検出実行（最大5フレームに1回・動きがない間は前回の結果を再利用）
                 if frame_count % 5 == 0:
-                    person_count, annotated_frame, detected_objects = self.detect_people_in_frame(frame)
+                    person_count, annotated_frame, detected_objects = self.detect_people_gated(frame)
                     
                     # カウントゾーン描画
                     zone_frame = self.counter.draw_counting_zones(annotated_frame)
@@ -462,6 +456,10 @@ class YouTubeStreamMonitor:
             print(f"   最大人数: {self.max_person_count}人")
             print(f"   総検出数: {self.total_detections}")
             print(f"   監視時間: {len(self.person_counts)}分")
+            if self.motion_gate is not None:
+                gate_stats = self.motion_gate.get_stats()
+                print(f"   推論: {gate_stats['inferred']}回 / スキップ: {gate_stats['skipped']}回 "
+                      f"(スキップ率 {gate_stats['skip_ratio']:.0%})")
 
 
 def main():
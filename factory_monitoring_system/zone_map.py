@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工場監視システム - カウントゾーンのラベルラスタ・描画キャッシュ
+ゾーンポリゴンを整数ラベル画像に事前描画し、検出中心のゾーン判定を配列参照1回で行う
+ゾーン表示（塗り・輪郭・名称）も事前描画したレイヤーを外接矩形内で1回合成する
+"""
+
+import time
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+class ZoneLabelMap:
+    """ゾーンラベルラスタ（重なったゾーンは組み合わせラベルで表現）"""
+    
+    def __init__(self, zones: Sequence):
+        """
+        初期化（ゾーン追加・削除・形状変更時は作り直す）
+        
+        Args:
+            zones: CountingZoneリスト
+        """
+        self.logger = logging.getLogger(__name__)
+        self.zones = list(zones)
+        self.zone_names = [zone.name for zone in self.zones]
+        self.labels = np.zeros((0, 0), dtype=np.int32)
+        # membership[ラベル, ゾーン] -> そのラベルの画素がゾーン内か
+        self.membership = np.zeros((1, len(self.zones)), dtype=bool)
+        self._target_cache = {}
+        self._build()
+    
+    def _build(self):
+        """ラベルラスタ作成（ゾーン外接矩形の範囲のみ処理）"""
+        start = time.perf_counter()
+        polygons = [np.asarray(zone.polygon, dtype=np.int32).reshape(-1, 2) for zone in self.zones]
+        valid = [points for points in polygons if len(points)]
+        if not valid:
+            return
+        
+        all_points = np.vstack(valid)
+        width = max(int(all_points[:, 0].max()) + 1, 1)
+        height = max(int(all_points[:, 1].max()) + 1, 1)
+        labels = np.zeros((height, width), dtype=np.int32)
+        
+        # ラベル0 = どのゾーンにも属さない
+        combos = [frozenset()]
+        combo_ids = {frozenset(): 0}
+        
+        for zone_index, points in enumerate(polygons):
+            if len(points) < 3:
+                continue
+            x1 = max(int(points[:, 0].min()), 0)
+            y1 = max(int(points[:, 1].min()), 0)
+            x2 = int(points[:, 0].max()) + 1
+            y2 = int(points[:, 1].max()) + 1
+            if x2 <= x1 or y2 <= y1:
+                continue
+            
+            mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            cv2.fillPoly(mask, [points - (x1, y1)], 1)
+            inside = mask.view(bool)
+            window = labels[y1:y2, x1:x2]
+            
+            # 既存ラベル毎に「そのラベル + このゾーン」のラベルへ置換
+            old_labels, inverse = np.unique(window[inside], return_inverse=True)
+            new_labels = []
+            for old_label in old_labels.tolist():
+                combo = combos[old_label] | {zone_index}
+                if combo not in combo_ids:
+                    combo_ids[combo] = len(combos)
+                    combos.append(combo)
+                new_labels.append(combo_ids[combo])
+            window[inside] = np.asarray(new_labels, dtype=np.int32)[inverse.reshape(-1)]
+        
+        membership = np.zeros((len(combos), len(self.zones)), dtype=bool)
+        for label, combo in enumerate(combos):
+            membership[label, list(combo)] = True
+        
+        self.labels = labels
+        self.membership = membership
+        self.logger.info(
+            f"ゾーンラベルラスタ作成: {len(self.zones)}ゾーン / {len(combos)}ラベル "
+            f"({width}x{height}, {(time.perf_counter() - start) * 1000:.1f} ms)"
+        )
+    
+    def lookup(self, centers: np.ndarray) -> np.ndarray:
+        """
+        中心座標のゾーン所属
+        
+        ラスタはポリゴンの境界画素を含み、座標は整数画素に切り捨てて参照するため、
+        レイキャスティング判定（上・左の辺を含まない）とは境界から1画素以内の点のみ異なる
+        
+        Args:
+            centers: 中心座標 (N, 2)
+        
+        Returns:
+            np.ndarray: 所属行列 (N, ゾーン数)
+        """
+        centers = np.asarray(centers, dtype=np.int64).reshape(-1, 2)
+        height, width = self.labels.shape
+        x = centers[:, 0]
+        y = centers[:, 1]
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        
+        point_labels = np.zeros(len(centers), dtype=np.int32)
+        point_labels[inside] = self.labels[y[inside], x[inside]]
+        return self.membership[point_labels]
+    
+    def _targets(self, class_names: Tuple[str, ...]) -> np.ndarray:
+        """対象クラス行列 (ゾーン数, クラス数)（クラス構成毎にキャッシュ）"""
+        targets = self._target_cache.get(class_names)
+        if targets is None:
+            targets = np.array([
+                [class_name in zone.target_classes for class_name in class_names]
+                for zone in self.zones
+            ], dtype=np.int64).reshape(len(self.zones), len(class_names))
+            self._target_cache[class_names] = targets
+        return targets
+    
+    def count(self, class_names: Sequence[str], centers: np.ndarray) -> Dict[str, Dict[str, int]]:
+        """
+        ゾーン別・クラス別カウント
+        
+        Args:
+            class_names: 検出のクラス名
+            centers: 検出の中心座標 (N, 2)
+        
+        Returns:
+            Dict[str, Dict[str, int]]: ゾーン名 -> クラス別カウント（有効ゾーンのみ）
+        """
+        enabled = [zone_index for zone_index, zone in enumerate(self.zones) if zone.enabled]
+        zone_counts = {self.zone_names[zone_index]: {} for zone_index in enabled}
+        if len(class_names) == 0 or not enabled:
+            return zone_counts
+        
+        unique_names, class_index = np.unique(np.asarray(class_names), return_inverse=True)
+        one_hot = np.zeros((len(class_names), len(unique_names)), dtype=np.int64)
+        one_hot[np.arange(len(class_names)), class_index.reshape(-1)] = 1
+        
+        # (ゾーン数, クラス数) のカウント行列を行列積1回で計算
+        counts = self.lookup(centers).T.astype(np.int64) @ one_hot
+        counts *= self._targets(tuple(unique_names.tolist()))
+        
+        unique_names = unique_names.tolist()
+        for zone_index in enabled:
+            row = counts[zone_index]
+            zone_counts[self.zone_names[zone_index]] = {
+                unique_names[class_pos]: int(row[class_pos])
+                for class_pos in np.flatnonzero(row).tolist()
+            }
+        return zone_counts
+
+
+class ZoneOverlay:
+    """ゾーン表示レイヤー（色 + 画素毎の透過率、ゾーン外接矩形のみ保持）"""
+    
+    FILL_COLOR = (0, 255, 255)
+    OUTLINE_COLOR = (0, 255, 255)
+    LABEL_COLOR = (255, 255, 255)
+    FILL_ALPHA = 0.2
+    
+    def __init__(self, zones: Sequence, frame_shape: Tuple[int, ...]):
+        """
+        初期化（ゾーン・フレームサイズ変更時は作り直す）
+        
+        Args:
+            zones: CountingZoneリスト
+            frame_shape: 描画先フレームの形状
+        """
+        self.logger = logging.getLogger(__name__)
+        self.frame_shape = tuple(frame_shape[:2])
+        self.signature = self.zone_signature(zones)
+        self.bounds = None
+        # 合成式: 出力 = 入力 * transmission + color * opacity（外接矩形内のみ）
+        self.transmission = None
+        self.opacity = None
+        self.color = None
+        self._build(zones)
+    
+    @staticmethod
+    def zone_signature(zones: Sequence) -> Tuple:
+        """描画内容を決めるゾーン属性（名称・ポリゴン・有効フラグ）"""
+        return tuple(
+            (zone.name, tuple(map(tuple, zone.polygon)), zone.enabled) for zone in zones
+        )
+    
+    def matches(self, zones: Sequence, frame_shape: Tuple[int, ...]) -> bool:
+        """キャッシュが再利用可能か"""
+        return (self.frame_shape == tuple(frame_shape[:2])
+                and self.signature == self.zone_signature(zones))
+    
+    def _build(self, zones: Sequence):
+        """各ゾーンの輪郭描画 → 塗り合成 → 名称描画の順序を1枚のレイヤーに畳み込む"""
+        start = time.perf_counter()
+        height, width = self.frame_shape
+        premultiplied = np.zeros((height, width, 3), dtype=np.float32)
+        transmission = np.ones((height, width), dtype=np.float32)
+        
+        def paint(region, mask, color, opacity: float = 1.0):
+            # mask の値（0〜255、文字はアンチエイリアスされる）を被覆率として重ねる
+            region_premultiplied, region_transmission = region
+            inside = mask > 0
+            coverage = mask[inside].astype(np.float32) * np.float32(opacity / 255.0)
+            region_premultiplied[inside] = (region_premultiplied[inside] * (1.0 - coverage[:, None])
+                                            + coverage[:, None] * np.array(color, np.float32))
+            region_transmission[inside] *= 1.0 - coverage
+            mask[:] = 0
+        
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        margin = 4
+        for zone in zones:
+            if not zone.enabled or not zone.polygon:
+                continue
+            points = np.array(zone.polygon, np.int32).reshape(-1, 2)
+            center_x = int(np.mean([p[0] for p in zone.polygon]))
+            center_y = int(np.mean([p[1] for p in zone.polygon]))
+            label_origin = (center_x - 50, center_y)
+            (text_width, text_height), baseline = cv2.getTextSize(zone.name, font, 0.7, 2)
+            
+            # ゾーンと名称を含む矩形内だけで描画
+            x1 = max(min(int(points[:, 0].min()), label_origin[0]) - margin, 0)
+            y1 = max(min(int(points[:, 1].min()), label_origin[1] - text_height) - margin, 0)
+            x2 = min(max(int(points[:, 0].max()), label_origin[0] + text_width) + margin + 1, width)
+            y2 = min(max(int(points[:, 1].max()), label_origin[1] + baseline) + margin + 1, height)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            region = (premultiplied[y1:y2, x1:x2], transmission[y1:y2, x1:x2])
+            mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            local_points = points - (x1, y1)
+            
+            # 輪郭（不透明）
+            cv2.polylines(mask, [local_points], True, 255, 2)
+            paint(region, mask, self.OUTLINE_COLOR)
+            
+            # 半透明塗りつぶし（既存レイヤーにも同じ比率で重なる）
+            cv2.fillPoly(mask, [local_points], 255)
+            paint(region, mask, self.FILL_COLOR, self.FILL_ALPHA)
+            
+            # ゾーン名（不透明）
+            cv2.putText(mask, zone.name, (label_origin[0] - x1, label_origin[1] - y1),
+                        font, 0.7, 255, 2)
+            paint(region, mask, self.LABEL_COLOR)
+        
+        rows = np.flatnonzero((transmission < 1.0).any(axis=1))
+        if len(rows) == 0:
+            return
+        cols = np.flatnonzero((transmission < 1.0).any(axis=0))
+        y1, y2, x1, x2 = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+        
+        transmission = np.ascontiguousarray(transmission[y1:y2, x1:x2])
+        opacity = 1.0 - transmission
+        color = np.divide(premultiplied[y1:y2, x1:x2], opacity[:, :, None],
+                          out=np.zeros((y2 - y1, x2 - x1, 3), dtype=np.float32),
+                          where=opacity[:, :, None] > 0)
+        
+        self.bounds = (x1, y1, x2, y2)
+        self.transmission = transmission
+        self.opacity = opacity
+        self.color = np.clip(np.rint(color), 0, 255).astype(np.uint8)
+        self.logger.info(
+            f"ゾーン表示レイヤー作成: {x2 - x1}x{y2 - y1} "
+            f"({(time.perf_counter() - start) * 1000:.1f} ms)"
+        )
+    
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        """
+        フレームへの合成
+        
+        Args:
+            frame: 入力フレーム（変更しない）
+        
+        Returns:
+            np.ndarray: ゾーン表示を合成したフレーム
+        """
+        output = frame.copy()
+        if self.bounds is None:
+            return output
+        
+        x1, y1, x2, y2 = self.bounds
+        region = output[y1:y2, x1:x2]
+        region[:] = cv2.blendLinear(region, self.color, self.transmission, self.opacity)
+        return output
+
+
+if __name__ == "__main__":
+    from object_counter import CountingZone
+    
+    # 棚ゾーン300個（10列 x 30段、隣接棚と一部重複）での判定コスト比較
+    zones = []
+    for row in range(30):
+        for col in range(10):
+            x, y = col * 190, row * 35
+            zones.append(CountingZone(
+                f"shelf_{row}_{col}",
+                [(x, y), (x + 200, y), (x + 200, y + 40), (x, y + 40)],
+                {'car', 'truck'}
+            ))
+    
+    zone_map = ZoneLabelMap(zones)
+    rng = np.random.default_rng(0)
+    centers = rng.integers(0, 1080, (200, 2)) * [1.78, 1]
+    class_names = rng.choice(['car', 'truck', 'person'], 200).tolist()
+    
+    def ray_casting(point: Tuple[float, float], polygon: List[Tuple[int, int]]) -> bool:
+        x, y = point
+        inside = False
+        p1x, p1y = polygon[0]
+        for i in range(1, len(polygon) + 1):
+            p2x, p2y = polygon[i % len(polygon)]
+            if min(p1y, p2y) < y <= max(p1y, p2y) and x <= max(p1x, p2x):
+                if p1y == p2y or p1x == p2x or x <= (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x:
+                    inside = not inside
+            p1x, p1y = p2x, p2y
+        return inside
+    
+    start = time.perf_counter()
+    python_total = sum(
+        1 for zone in zones for name, center in zip(class_names, centers.tolist())
+        if name in zone.target_classes and ray_casting(center, zone.polygon)
+    )
+    python_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    zone_counts = zone_map.count(class_names, centers)
+    raster_ms = (time.perf_counter() - start) * 1000
+    raster_total = sum(sum(counts.values()) for counts in zone_counts.values())
+    
+    print(f"ゾーン数: {len(zones)} / 検出数: {len(centers)}")
+    print(f"レイキャスティング: {python_ms:.2f} ms (ゾーン内検出 {python_total})")
+    print(f"ラベルラスタ: {raster_ms:.2f} ms (ゾーン内検出 {raster_total})")
+    
+    # 判定が異なるのはゾーン境界から1画素以内の点のみ（境界画素の扱い・座標の切り捨て）
+    python_inside = np.array([
+        [ray_casting(center, zone.polygon) for zone in zones] for center in centers.tolist()
+    ])
+    differing = np.argwhere(zone_map.lookup(centers) != python_inside)
+    distances = [
+        abs(cv2.pointPolygonTest(np.array(zones[zone_index].polygon, np.float32),
+                                 tuple(map(float, centers[point_index])), True))
+        for point_index, zone_index in differing.tolist()
+    ]
+    assert all(distance <= 1.0 for distance in distances), distances
+    print(f"判定の相違: {len(distances)}件（すべて境界から1画素以内）")